@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Benchmark the E-Prime .txt tokenizer in eprime_to_csv.py against the nested
+# regex approach it replaced (a DOTALL match for the header and body, a
+# findall with lazy quantifiers for the frames, then a findall for the fields
+# of each frame). Synthetic logs (synthetic_eprime.py) with the given numbers
+# of trial frames are written to a temporary directory, and the throughput of
+# each tokenizer is reported in MB/s of .txt file and frames/s. Both must find
+# the same frames.
+#
+#    bench_eprime_to_csv.py --frames 1000 10000 100000 1000000
+
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import eprime_to_csv
+import synthetic_eprime
+from tasks import TASKS
+
+
+# The tokenizer eprime_to_csv.py used to have. Reads the whole file at once
+def legacy_parse_frames(eprime_txt):
+
+    with open(eprime_txt,encoding='utf-16') as f:
+        txt = f.read().replace(u'\x00','')
+
+    expr_main = re.compile(
+        '\\*\\*\\* Header Start \\*\\*\\*(?P<hdr>.*)\\*\\*\\* Header End \\*\\*\\*'
+        '(?P<body>.*)'
+        ,re.DOTALL)
+    match_main = re.match(expr_main,txt)
+
+    expr_fields = re.compile(
+        '^\t*(?P<field>.*?)\\: (?P<value>.*)$'
+        ,re.MULTILINE)
+    parsed_hdr = re.findall(expr_fields,match_main.group('hdr'))
+    parsed_hdr.append(('Level','0'))
+    frames = [parsed_hdr]
+
+    expr_frame = re.compile(
+        '\t*?Level\\: (?P<level>[0-9]*?)[\n\r\t]*?'
+        '\\*\\*\\* LogFrame Start \\*\\*\\*[\n\r\t]*?'
+        '(?P<frame>.*?)[\n\r\t]*?'
+        '\\*\\*\\* LogFrame End \\*\\*\\*'
+        ,re.DOTALL)
+    for frame in re.findall(expr_frame,match_main.group('body')):
+        parsed_frame = re.findall(expr_fields,frame[1])
+        parsed_frame.append(('Level',frame[0]))
+        frames.append(parsed_frame)
+
+    return frames
+
+
+# The current tokenizer
+def scanner_parse_frames(eprime_txt):
+    return list(eprime_to_csv.parse_frames(eprime_to_csv.read_blocks(eprime_txt)))
+
+
+TOKENIZERS = {
+    'legacy': legacy_parse_frames,
+    'scanner': scanner_parse_frames,
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the E-Prime .txt tokenizer')
+    parser.add_argument('--frames', type=int, nargs='+', default=[1000,10000,100000],
+        help='Numbers of trial frames in the synthetic logs')
+    parser.add_argument('--task', choices=list(TASKS), default='WM',
+        help='Task the synthetic logs are for')
+    parser.add_argument('--noise', type=int, default=0,
+        help='Number of extra fields in each trial frame')
+    parser.add_argument('--tokenizers', nargs='+', choices=list(TOKENIZERS),
+        default=list(TOKENIZERS), help='Tokenizers to time')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='Runs per tokenizer; the fastest is reported')
+    args = parser.parse_args()
+
+    print('%10s %10s %10s %10s %12s %8s' %
+        ('frames','MB','tokenizer','sec','frames/s','MB/s'))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for nframes in args.frames:
+            eprime_txt = os.path.join(tmp_dir,'bench-%d.txt' % nframes)
+            synthetic_eprime.write_log(eprime_txt,args.task,nframes,noise=args.noise)
+            mb = os.path.getsize(eprime_txt) / 1024 / 1024
+
+            results = dict()
+            for name in args.tokenizers:
+                best = None
+                for r in range(args.repeat):
+                    t0 = time.perf_counter()
+                    frames = TOKENIZERS[name](eprime_txt)
+                    t = time.perf_counter() - t0
+                    best = t if best is None else min(best,t)
+                results[name] = frames
+                print('%10d %10.1f %10s %10.3f %12.0f %8.1f' %
+                    (nframes,mb,name,best,len(frames)/best,mb/best))
+
+            first = next(iter(results.values()))
+            for name,frames in results.items():
+                if frames != first:
+                    raise RuntimeError('%s frames differ for %d frames' % (name,nframes))
+
+            os.remove(eprime_txt)
+
+
+if __name__ == "__main__":
+    main()
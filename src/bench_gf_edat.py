@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Benchmark the processing chain in gf_edat.py on synthetic logs from
+# synthetic_eprime.py. For each task and number of trials, times the stages
+#
+#    convert     E-Prime .txt to table
+#    csv         Writing the table to CSV
+#    parse       Task summary from the table
+#    pdf         Report PDF from the summary
+#
+# and records the peak RSS of the process after each. Each run is done in a
+# fresh worker process so the peaks don't carry over between runs. Results
+# are written as JSON, and can be compared with an earlier results file to
+# catch regressions:
+#
+#    bench_gf_edat.py --trials 100 1000 10000 --out_json bench.json
+#    bench_gf_edat.py --trials 100 1000 10000 --baseline bench.json
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import pandas
+
+import gf_edat
+import synthetic_eprime
+from tasks import TASKS
+
+
+STAGES = ('convert','csv','parse','pdf')
+
+
+# Peak RSS of this process so far, in MB. ru_maxrss is in kB on Linux and
+# bytes on macOS
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+# Time each stage for one synthetic log. Runs in a worker process
+def run_stages(task, ntrials, nlevels, noise, seed):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        eprime_txt = os.path.join(tmp_dir,'%s-bench.txt' % task)
+        synthetic_eprime.write_log(eprime_txt, task, ntrials, nlevels=nlevels,
+            noise=noise, seed=seed)
+        result = dict(task=task, trials=ntrials, levels=nlevels, noise=noise,
+            txt_mb=os.path.getsize(eprime_txt) / 1024 / 1024,
+            start_rss_mb=peak_rss_mb(), stages=dict())
+
+        def stage(name, func, *args):
+            t0 = time.perf_counter()
+            value = func(*args)
+            result['stages'][name] = dict(sec=time.perf_counter() - t0,
+                peak_rss_mb=peak_rss_mb())
+            return value
+
+        parsed_frames = stage('convert',gf_edat.convert,eprime_txt,task)
+        stage('csv',parsed_frames.to_csv,os.path.join(tmp_dir,'eprime.csv'))
+        stims = stage('parse',gf_edat.summarize,parsed_frames,task)
+        stage('pdf',gf_edat.report,stims,os.path.join(tmp_dir,'eprime_summary.pdf'),task)
+
+    result['frames'] = len(parsed_frames.index)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+# Stages that got slower than in the baseline results by more than the
+# tolerance (a fraction), as (task,trials,stage,baseline sec,sec)
+def regressions(results, baseline, tolerance):
+    before = {(r['task'],r['trials'],r['levels'],r['noise']): r for r in baseline['results']}
+    slower = []
+    for r in results:
+        b = before.get((r['task'],r['trials'],r['levels'],r['noise']))
+        if b is None:
+            continue
+        for name,s in r['stages'].items():
+            if name in b['stages'] and s['sec'] > b['stages'][name]['sec'] * (1 + tolerance):
+                slower.append((r['task'],r['trials'],name,b['stages'][name]['sec'],s['sec']))
+    return slower
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Benchmark E-Prime processing for GF tasks')
+    parser.add_argument('--tasks', nargs='+', choices=list(TASKS), default=list(TASKS),
+        help='Tasks to benchmark')
+    parser.add_argument('--trials', type=int, nargs='+', default=[100,1000,10000],
+        help='Numbers of trials in the synthetic logs')
+    parser.add_argument('--levels', type=int, default=3, help='Level of the trial frames')
+    parser.add_argument('--noise', type=int, default=0,
+        help='Number of extra fields in each trial frame')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the logs')
+    parser.add_argument('--out_json', help='File to store the results')
+    parser.add_argument('--baseline', help='Results file from an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='Fraction a stage can be slower than in the baseline before it is reported')
+    args = parser.parse_args()
+
+    # One fresh process per run
+    results = []
+    with multiprocessing.Pool(1,maxtasksperchild=1) as pool:
+        for task in args.tasks:
+            for ntrials in args.trials:
+                r = pool.apply(run_stages,(task,ntrials,args.levels,args.noise,args.seed))
+                print('%-10s %8d trials %7.1f MB  ' % (task,ntrials,r['txt_mb']) +
+                    '  '.join('%s %.3fs' % (name,r['stages'][name]['sec']) for name in STAGES) +
+                    '  peak RSS %.0f MB' % r['peak_rss_mb'])
+                results.append(r)
+
+    bench = dict(
+        date=datetime.datetime.now().isoformat(timespec='seconds'),
+        python=platform.python_version(),
+        pandas=pandas.__version__,
+        platform=platform.platform(),
+        results=results,
+        )
+    if args.out_json:
+        with open(args.out_json,'w') as f:
+            json.dump(bench,f,indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(results,baseline,args.tolerance)
+        for task,ntrials,name,before,after in slower:
+            print('SLOWER: %s %d trials %s %.3fs -> %.3fs' % (task,ntrials,name,before,after))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
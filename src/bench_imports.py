@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Profile the startup cost of the pipeline modules with python -X importtime.
+# Each module is imported in a fresh interpreter, and the total import time
+# is reported with the heaviest packages it pulls in, so that a module that
+# starts importing pandas, numpy or fpdf at the top again shows up. Results
+# can be stored as JSON and compared with an earlier run:
+#
+#    bench_imports.py --out_json imports.json
+#    bench_imports.py --baseline imports.json
+#
+# The time for `gf_edat.py --lite` to run on a small synthetic log, start to
+# finish, is also reported.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_eprime
+
+
+MODULES = ('gf_edat','gf_edat_lite','eprime_to_csv','make_pdf','parse_csv_GF')
+
+# Packages that shouldn't be imported until a step needs them
+HEAVY = ('pandas','numpy','fpdf','pyarrow')
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Import a module in a fresh interpreter with -X importtime. Returns the
+# module's cumulative import time (ms), and the cumulative time of each
+# top level package imported on the way
+def import_times(module):
+    proc = subprocess.run([sys.executable,'-X','importtime','-c','import %s' % module],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    total = 0
+    packages = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        ms = int(cumulative_us) / 1000
+        if name == module:
+            total = ms
+        elif '.' not in name:
+            packages[name] = max(packages.get(name,0),ms)
+    return total, packages
+
+
+# Best wall time (ms) of a command over repeats
+def wall_ms(cmd, repeat):
+    best = None
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=SRC_DIR, check=True, stdout=subprocess.DEVNULL)
+        t = (time.perf_counter() - t0) * 1000
+        best = t if best is None else min(best,t)
+    return best
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Profile import time of the pipeline modules')
+    parser.add_argument('--modules', nargs='+', default=list(MODULES), help='Modules to import')
+    parser.add_argument('--top', type=int, default=5,
+        help='Number of heaviest imports to list for each module')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='Runs per measurement; the fastest is reported')
+    parser.add_argument('--out_json', help='File to store the results')
+    parser.add_argument('--baseline', help='Results file from an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='Fraction a module can be slower than in the baseline before it is reported')
+    args = parser.parse_args()
+
+    results = dict()
+    for module in args.modules:
+        total, packages = min((import_times(module) for r in range(args.repeat)),
+            key=lambda x: x[0])
+        heavy = [h for h in HEAVY if h in packages]
+        results[module] = dict(ms=total, heavy=heavy)
+        print('%-16s %8.1f ms%s' % (module,total,
+            '  imports ' + ', '.join(heavy) if heavy else ''))
+        for name,ms in sorted(packages.items(),key=lambda x: -x[1])[:args.top]:
+            print('    %-28s %8.1f ms' % (name,ms))
+
+    # Whole run of the lightweight path on a small log
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        eprime_txt = os.path.join(tmp_dir,'WM-bench.txt')
+        synthetic_eprime.write_log(eprime_txt,'WM',100)
+        ms = wall_ms([sys.executable,'gf_edat.py','--lite','--task','WM',
+            '--eprime_txt',eprime_txt,'--out_dir',tmp_dir],args.repeat)
+    results['gf_edat.py --lite'] = dict(ms=ms)
+    print('%-16s %8.1f ms' % ('gf_edat.py --lite',ms))
+
+    if args.out_json:
+        with open(args.out_json,'w') as f:
+            json.dump(results,f,indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = [(name,baseline[name]['ms'],r['ms']) for name,r in results.items()
+            if name in baseline and r['ms'] > baseline[name]['ms'] * (1 + args.tolerance)]
+        for name,before,after in slower:
+            print('SLOWER: %s %.1f ms -> %.1f ms' % (name,before,after))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#
+# Check the compiled tokenizer (eprime_tokenizer_cy.pyx, built with
+# setup_tokenizer.py) against the plain Python one. Both tokenizers are run
+# through the same conversions and the outputs compared byte for byte, for:
+#
+#    60 synthetic logs, of every task in tasks.py in several shapes and
+#       encodings (synthetic_eprime.py)
+#     6 awkward hand-written logs, in UTF-16 and UTF-8 (AWKWARD_LOGS below)
+#     N real logs, any given with --in_dir
+#
+# No real logs come with the repository, so only these 66 built-in ones are
+# checked without --in_dir. The conversions are:
+#
+#    pandas   eprime_to_csv.read_eprime_txt written as eprime.csv, sorted by
+#             level and in file order
+#    lite     gf_edat_lite.write_eprime_csv
+#    chunks   the columns, reading the file a few bytes at a time so frames
+#             and lines are split across blocks
+#
+# Exits 1 if anything differs, or if the compiled tokenizer isn't built.
+#
+#    check_tokenizer.py
+#    check_tokenizer.py --in_dir /INPUTS
+
+import argparse
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import eprime_to_csv
+import eprime_tokenizer
+import gf_edat_lite
+import synthetic_eprime
+from tasks import TASKS
+
+
+# Shapes of the synthetic logs: levels of the trial frames, and extra fields
+# per trial frame
+LEVELS = (2,3)
+NOISE = (0,5)
+ENCODINGS = ('utf-16','utf-8','utf-8-sig')
+CHUNK_SIZES = (7,64,1001)
+
+# Logs the synthetic ones don't cover: repeated fields in a frame, lines that
+# aren't fields, empty values, ': ' in a value, extra blank lines before the
+# frame start, a level line with no frame, and a truncated last frame; a
+# header without its end marker; and a log cut short in the header
+AWKWARD_LOGS = dict(
+    frames='''*** Header Start ***
+VersionPersist: 1
+LevelName: Session
+LevelName: Block
+Experiment: Awkward
+*** Header End ***
+Level: 1
+*** LogFrame Start ***
+Procedure: SessionProc
+Note: time: 12:00: noon
+Empty:
+not a field
+*** LogFrame End ***
+Level: 2
+
+\t
+*** LogFrame Start ***
+\tProcedure: BlockProc
+\tRepeated: first
+\tRepeated: second
+\t\tDeep: tabs
+*** LogFrame End ***
+Level: 3
+Level: 2
+*** LogFrame Start ***
+\tProcedure: BlockProc
+\tOnly: here
+*** LogFrame End ***
+Level: 2
+*** LogFrame Start ***
+\tProcedure: Trunc
+''',
+    header_end='''*** Header Start ***
+VersionPersist: 1
+Experiment: NoHeaderEnd
+Level: 1
+*** LogFrame Start ***
+Procedure: SessionProc
+*** LogFrame End ***
+''',
+    cut_header='''*** Header Start ***
+VersionPersist: 1
+Experiment: CutSh''',
+    )
+
+
+# The tokenizers, compiled if it's been built
+PLAIN = eprime_tokenizer.tokenize_py
+COMPILED = eprime_tokenizer.tokenize
+
+
+# Use a tokenizer for the conversions
+def use_tokenizer(tokenize):
+    eprime_to_csv.tokenize = tokenize
+    gf_edat_lite.tokenize = tokenize
+
+
+def pandas_csv(eprime_txt, sort):
+    f = io.StringIO()
+    eprime_to_csv.read_eprime_txt(eprime_txt,sort=sort).to_csv(f,index=False)
+    return f.getvalue().encode()
+
+
+def lite_csv(eprime_txt, out_csv):
+    columns, nrows = gf_edat_lite.read_columns(eprime_txt)
+    gf_edat_lite.write_eprime_csv(columns,nrows,out_csv)
+    with open(out_csv,'rb') as f:
+        return f.read()
+
+
+def chunked_columns(eprime_txt, tokenize):
+    return [tokenize(eprime_to_csv.read_blocks(eprime_txt,c)) for c in CHUNK_SIZES]
+
+
+# Outputs of the conversions of a log with a tokenizer, and the time taken
+def outputs(eprime_txt, tokenize, tmp_dir):
+    use_tokenizer(tokenize)
+    t0 = time.perf_counter()
+    result = dict(
+        pandas_sorted=pandas_csv(eprime_txt,True),
+        pandas_unsorted=pandas_csv(eprime_txt,False),
+        lite=lite_csv(eprime_txt,os.path.join(tmp_dir,'eprime.csv')),
+        )
+    t = time.perf_counter() - t0
+    result['chunks'] = chunked_columns(eprime_txt,tokenize)
+    return result, t
+
+
+# Compare the two tokenizers on a log. Returns the names of the outputs that
+# differ
+def check_log(eprime_txt, tmp_dir):
+    try:
+        plain, t_plain = outputs(eprime_txt,PLAIN,tmp_dir)
+        compiled, t_compiled = outputs(eprime_txt,COMPILED,tmp_dir)
+    finally:
+        use_tokenizer(COMPILED)
+    differ = [k for k in plain if plain[k] != compiled[k]]
+    print('%-6s %8.3f %8.3f  %s' % ('DIFF' if differ else 'ok',t_plain,t_compiled,
+        os.path.basename(eprime_txt)) + (' (%s)' % ', '.join(differ) if differ else ''))
+    return differ
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Check the compiled E-Prime tokenizer gives the same CSVs as plain Python')
+    parser.add_argument('--in_dir', help='Directory of real E-Prime .txt logs to check too')
+    parser.add_argument('--trials', type=int, default=500,
+        help='Number of trials in the synthetic logs')
+    args = parser.parse_args()
+
+    if not eprime_tokenizer.COMPILED:
+        print('Compiled tokenizer not built: run setup_tokenizer.py build_ext --inplace')
+        sys.exit(1)
+
+    failed = []
+    print('%-6s %8s %8s  %s' % ('','plain','compiled','log'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        logs = []
+        for task,levels,noise,encoding in itertools.product(TASKS,LEVELS,NOISE,ENCODINGS):
+            eprime_txt = os.path.join(tmp_dir,'%s-l%d-n%d-%s.txt' % (task,levels,noise,encoding))
+            synthetic_eprime.write_log(eprime_txt,task,args.trials,encoding=encoding,
+                nlevels=levels,noise=noise,seed=levels*10+noise)
+            logs.append(eprime_txt)
+        for (name,log),encoding in itertools.product(AWKWARD_LOGS.items(),('utf-16','utf-8')):
+            eprime_txt = os.path.join(tmp_dir,'awkward-%s-%s.txt' % (name,encoding))
+            with open(eprime_txt,'w',encoding=encoding,newline='\r\n') as f:
+                f.write(log)
+            logs.append(eprime_txt)
+        built_in = len(logs)
+        if args.in_dir:
+            logs += sorted(os.path.join(args.in_dir,f) for f in os.listdir(args.in_dir)
+                if f.endswith('.txt'))
+
+        for eprime_txt in logs:
+            if check_log(eprime_txt,tmp_dir):
+                failed.append(eprime_txt)
+
+    print('Done: %d logs (%d built in, %d from --in_dir), %d differ' % (len(logs),
+        built_in,len(logs) - built_in,len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
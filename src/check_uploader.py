@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+#
+# Check find_and_upload_eprime_files.py against a mock XNAT (mock_xnat.py)
+# served from this process. A directory of E-Prime files is swept by the
+# uploader, run as it would be from the command line with --host pointed at
+# the mock and the login in a .netrc under a temporary home directory. The
+# files cover:
+#
+#    uploaded     a file whose scan has no EPRIME_TXT resource yet
+#    exists       a file whose scan already has one
+#    retried      a file whose upload fails once with a 503, and is retried
+#    no scan      a file with no matching scan in its session
+#    invalid      a file whose name can't be parsed
+#
+# Each sweep's report is checked, and what's on the mock XNAT afterwards. The
+# sweep is then run again, when only the file with no matching scan should go
+# to XNAT, and again after a file has changed, when its upload should be
+# replaced, and once more with --overwrite True, when every file should be
+# uploaded again, over the resource that was already there too. All of it is
+# done with scans listed session by session and with --project_scans.
+#
+# Where DAX isn't installed (or with --mock_dax) the uploader is run with the
+# stand-in for dax.XnatUtils in mock_xnat.py, which says so. That checks the
+# uploader but not DAX and pyxnat's side of it, so run it where DAX is
+# installed too before trusting a change to how the uploader calls XNAT.
+#
+# Exits 1 if anything is wrong.
+#
+#    check_uploader.py
+#    check_uploader.py --mock_dax
+
+import argparse
+import csv
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+
+from mock_xnat import MockXnat
+
+
+PROJECT = 'GF_MOCK'
+
+UPLOADER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'find_and_upload_eprime_files.py')
+
+# A dax package whose XnatUtils is the stand-in, put on the uploader's path
+# when DAX isn't used
+MOCK_DAX = 'import mock_xnat as XnatUtils\n'
+
+# Files in the swept directory, with the session, scan and status each should
+# get in the first sweep
+FILES = dict(
+    uploaded=('WM-100001-1.txt','100001','5','uploaded'),
+    exists=('Oddball-100002-1.txt','100002','3','exists'),
+    retried=('SPT-100003-1.txt','100003','7','uploaded'),
+    no_scan=('WM-100004-1.txt','100004','','skipped'),
+    invalid=('WM-notasession.txt','','','invalid'),
+    )
+
+
+# A mock XNAT with a scan for each file that should find one, and a T1 in
+# the session with no matching scan
+def make_xnat():
+    xnat = MockXnat(PROJECT)
+    xnat.add_scan('100001','100001','1','T1')
+    xnat.add_scan('100001','100001','5','wm1_fMRI')
+    xnat.add_scan('100002','100002','3','oddball1',resources=['EPRIME_TXT'])
+    xnat.add_scan('100003','100003','7','spt1_fMRI')
+    xnat.add_scan('100004','100004','1','T1')
+    xnat.fail('POST','/experiments/100003/scans/7/resources/',times=1)
+    return xnat
+
+
+def write_file(path, text):
+    with open(path,'w',newline='\r\n') as f:
+        f.write(text)
+
+
+# Run a sweep of the directory, with any other options. Returns the exit code and the report's rows by
+# file name
+def sweep(url, tmp_dir, project_scans, options=(), mock_dax=False):
+    report = os.path.join(tmp_dir,'report.csv')
+    cmd = [sys.executable, UPLOADER, '--project', PROJECT, '--dir', os.path.join(tmp_dir,'eprime'),
+        '--host', url, '--manifest', os.path.join(tmp_dir,'uploads.sqlite'), '--report', report,
+        '--retries', '2', '--backoff', '0.01'] + list(options)
+    if project_scans:
+        cmd.append('--project_scans')
+    env = dict(os.environ, HOME=tmp_dir)
+    if mock_dax:
+        env['PYTHONPATH'] = os.pathsep.join([os.path.join(tmp_dir,'mock')] +
+            [p for p in [os.environ.get('PYTHONPATH')] if p])
+    result = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    if result.returncode:
+        print(result.stdout)
+    if not os.path.exists(report):
+        return result.returncode, dict()
+    with open(report,newline='') as f:
+        rows = {os.path.basename(r['eprime_txt']): r for r in csv.DictReader(f)}
+    os.remove(report)
+    return result.returncode, rows
+
+
+# What's wrong with a sweep's report, compared with the expected statuses by
+# file name
+def check_report(returncode, rows, expected):
+    problems = []
+    if returncode:
+        problems.append('exit code %d' % returncode)
+    if set(rows) != set(expected):
+        problems.append('files reported %s' % ', '.join(sorted(rows)))
+    for fname,(scan,status) in expected.items():
+        r = rows.get(fname)
+        if r is not None and (r['scan'],r['status']) != (scan,status):
+            problems.append('%s: %s %s (%s)' % (fname,r['status'],r['scan'],r['message']))
+    return problems
+
+
+# What's wrong with the files on the mock XNAT, compared with those in the
+# swept directory
+def check_uploads(xnat, tmp_dir, names):
+    problems = []
+    for name in names:
+        fname, session, scan_id, status = FILES[name]
+        with open(os.path.join(tmp_dir,'eprime',fname),'rb') as f:
+            data = f.read()
+        if xnat.files(session,scan_id,'EPRIME_TXT').get(fname) != data:
+            problems.append('%s not uploaded as it is' % fname)
+    return problems
+
+
+def report(name, problems):
+    print('%-6s %s' % ('FAIL' if problems else 'ok',name))
+    for p in problems:
+        print('          %s' % p)
+    return bool(problems)
+
+
+# The four sweeps, with scans listed one way. Returns the number of checks
+# that failed
+def check_sweeps(project_scans, mock_dax=False):
+    mode = 'project scans' if project_scans else 'session scans'
+    failed = 0
+    xnat = make_xnat()
+    url = xnat.start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir,'eprime'))
+        for name,(fname,session,scan_id,status) in FILES.items():
+            write_file(os.path.join(tmp_dir,'eprime',fname),'%s\n' % name)
+        netrc = os.path.join(tmp_dir,'.netrc')
+        write_file(netrc,'machine 127.0.0.1 login mock password mock\n')
+        os.chmod(netrc,0o600)
+        os.makedirs(os.path.join(tmp_dir,'mock','dax'))
+        write_file(os.path.join(tmp_dir,'mock','dax','__init__.py'),MOCK_DAX)
+
+        try:
+            # First sweep: every file gets its status, and the 503 is retried
+            returncode, rows = sweep(url,tmp_dir,project_scans,mock_dax=mock_dax)
+            problems = check_report(returncode,rows,
+                {f[0]: (f[2],f[3]) for f in FILES.values()})
+            problems += check_uploads(xnat,tmp_dir,['uploaded','retried'])
+            n = xnat.count('POST','/experiments/100003/scans/7/resources/')
+            if n != 2:
+                problems.append('%d upload attempts for the retried file' % n)
+            if xnat.files('100002','3','EPRIME_TXT'):
+                problems.append('existing resource was uploaded to')
+            if xnat.unknown:
+                problems.append('unknown requests: %s' % xnat.unknown)
+            failed += report('%s: first sweep' % mode,problems)
+
+            # Second sweep: only the file with no matching scan is tried again,
+            # and nothing is asked about the other sessions
+            xnat.requests = []
+            returncode, rows = sweep(url,tmp_dir,project_scans,mock_dax=mock_dax)
+            problems = check_report(returncode,rows,{FILES['no_scan'][0]: ('','skipped')})
+            for session in ('100001','100002','100003'):
+                if xnat.count(path='/experiments/%s/' % session):
+                    problems.append('session %s was checked again' % session)
+            failed += report('%s: second sweep' % mode,problems)
+
+            # Third sweep: a changed file replaces its upload
+            write_file(os.path.join(tmp_dir,'eprime',FILES['uploaded'][0]),'uploaded\nchanged\n')
+            returncode, rows = sweep(url,tmp_dir,project_scans,mock_dax=mock_dax)
+            problems = check_report(returncode,rows,{FILES['uploaded'][0]: ('5','uploaded'),
+                FILES['no_scan'][0]: ('','skipped')})
+            problems += check_uploads(xnat,tmp_dir,['uploaded'])
+            failed += report('%s: changed file' % mode,problems)
+
+            # Fourth sweep: with --overwrite True nothing is skipped, and the
+            # resource that was already there is uploaded over
+            returncode, rows = sweep(url,tmp_dir,project_scans,['--overwrite','True'],mock_dax)
+            problems = check_report(returncode,rows,
+                {f[0]: (f[2],'uploaded' if f[2] else f[3]) for f in FILES.values()})
+            problems += check_uploads(xnat,tmp_dir,['uploaded','exists','retried'])
+            failed += report('%s: overwrite' % mode,problems)
+        finally:
+            xnat.stop()
+    return failed
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Check the E-Prime uploader against a mock XNAT')
+    parser.add_argument('--mock_dax', action='store_true',
+        help='Use the stand-in for DAX in mock_xnat.py even if DAX is installed')
+    args = parser.parse_args()
+
+    mock_dax = args.mock_dax
+    if importlib.util.find_spec('dax') is None:
+        print('DAX not installed: checking with the stand-in for DAX in mock_xnat.py')
+        mock_dax = True
+    elif mock_dax:
+        print('Checking with the stand-in for DAX in mock_xnat.py')
+
+    failed = check_sweeps(False,mock_dax) + check_sweeps(True,mock_dax)
+    print('Done: %d checks failed' % failed)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
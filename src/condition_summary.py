@@ -0,0 +1,225 @@
+# Shared per-condition summary for the parse_csv_GF_* task parsers. Each
+# parser selects the trial rows of the E-Prime table and says which columns
+# hold the condition, onset, RT and accuracy; the onsets, durations, accuracy
+# and correct-trial RT stats for every condition are then computed together
+# in one grouped pass rather than by masking the whole table per condition,
+# on flat arrays of the trials sorted by condition.
+
+import numpy
+import pandas
+
+from eprime_to_csv import table_format
+
+
+# Summary columns, in output order, after the grouping columns and Condition
+SUMMARY_COLUMNS = [
+    'OnsetsSec',
+    'DurationsSec',
+    'Accuracy',
+    'PctAccuracy',
+    'RTms',
+    'MeanCorrectRTms',
+    'MedianCorrectRTms',
+    'MinCorrectRTms',
+    'MaxCorrectRTms',
+    ]
+
+
+# Use the earliest time of the trigger item as the start time
+def trigger_time(edat, column):
+    start_trigger_idx = edat.loc[:,column].idxmin()
+    return edat.loc[start_trigger_idx,column]
+
+
+# A column of info. Names containing {Condition} pick a different column for
+# each condition, e.g. '{Condition}Tone.RT' is StandardTone.RT for Standard
+# trials and DeviantTone.RT for Deviant trials.
+def condition_column(info, name):
+    if '{Condition}' not in name:
+        return info.loc[:,name]
+    col = None
+    for condition in pandas.unique(info.Condition):
+        inds = info.Condition==condition
+        vals = info.loc[:,name.format(Condition=condition)]
+        col = vals.where(inds) if col is None else col.where(~inds,vals)
+    return col
+
+
+# Per-condition summary held as flat typed arrays. Trials are stored grouped
+# by condition, keeping their original order within each one, and the trials
+# of condition i are [offsets[i]:offsets[i+1]] of
+#
+#    onsets         Onset (sec from the start time)
+#    durations      Duration (sec)
+#    rts            RT (ms, rounded)
+#    accs           Accuracy (int8, 0/1)
+#
+# conditions has the grouping columns (and Condition) with one row per
+# condition. pct (PctAccuracy) and rt_stats (mean, median, min, max of the
+# correct-trial RTs) have one row per condition, and with_acc and with_rt say
+# which conditions accuracy and RT are reported for. The list-valued table of
+# the summary CSV is only made by to_frame(), when writing out, and a table
+# with a row per trial by trials_frame().
+class ConditionSummary:
+
+    def __init__(self, conditions, offsets, onsets, durations, rts, accs, pct, rt_stats,
+            with_acc, with_rt):
+        self.conditions = conditions
+        self.offsets = offsets
+        self.onsets = onsets
+        self.durations = durations
+        self.rts = rts
+        self.accs = accs
+        self.pct = pct
+        self.rt_stats = rt_stats
+        self.with_acc = with_acc
+        self.with_rt = with_rt
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # The values of one condition's trials from a per-trial array
+    def trials(self, values, i):
+        return values[self.offsets[i]:self.offsets[i+1]]
+
+    # Table with one row per condition and list-valued cells for the
+    # per-trial values, as in the summary CSV. Cells that aren't computed for
+    # a condition are left as ().
+    def to_frame(self):
+        stims = self.conditions.copy()
+        summary = {c: [() for i in range(len(self))] for c in SUMMARY_COLUMNS}
+        for i in range(len(self)):
+            summary['OnsetsSec'][i] = list(self.trials(self.onsets,i))
+            summary['DurationsSec'][i] = list(self.trials(self.durations,i))
+            if self.with_acc[i]:
+                summary['Accuracy'][i] = list(self.trials(self.accs,i))
+                summary['PctAccuracy'][i] = self.pct[i]
+            if self.with_rt[i]:
+                summary['RTms'][i] = list(self.trials(self.rts,i))
+                for k,c in enumerate(SUMMARY_COLUMNS[5:]):
+                    summary[c][i] = self.rt_stats[i,k]
+        for c in SUMMARY_COLUMNS:
+            stims[c] = pandas.Series(summary[c],dtype=object)
+        return stims
+
+    def to_csv(self, path):
+        self.to_frame().to_csv(path,index=False)
+
+    # Long table with one row per trial, in the same order: the condition's
+    # grouping columns and Condition, the trial's number within its
+    # condition (from 1), OnsetSec, DurationSec, Accuracy (nullable int8)
+    # and RTms. Accuracy and RT are missing for conditions they aren't
+    # computed for.
+    def trials_frame(self):
+        rows = numpy.repeat(numpy.arange(len(self)),numpy.diff(self.offsets))
+        trials = self.conditions.iloc[rows].reset_index(drop=True)
+        trials['Trial'] = numpy.arange(len(rows)) - self.offsets[rows] + 1
+        trials['OnsetSec'] = self.onsets
+        trials['DurationSec'] = self.durations
+        trials['Accuracy'] = pandas.arrays.IntegerArray(self.accs,~self.with_acc[rows])
+        trials['RTms'] = numpy.where(self.with_rt[rows],self.rts,numpy.nan)
+        return trials
+
+    # Write the trial table as CSV, or as a typed feather or parquet file, by
+    # extension
+    def write_trials(self, path):
+        trials = self.trials_frame()
+        fmt = table_format(path)
+        if fmt == 'csv':
+            trials.to_csv(path,index=False)
+        elif fmt == 'feather':
+            trials.to_feather(path,compression='uncompressed')
+        else:
+            trials.to_parquet(path,index=False)
+
+
+# Mean, median, min and max of the values of each segment given by codes
+# (sorted) and counts. NaN for empty segments
+def segment_stats(values, codes, counts):
+    stats = numpy.full((len(counts),4),numpy.nan)
+    has = counts > 0
+    if not has.any():
+        return stats
+    values = values[numpy.lexsort((values,codes))]
+    ends = numpy.cumsum(counts)
+    starts = ends - counts
+    starts, ends, n = starts[has], ends[has], counts[has]
+    stats[has,0] = numpy.add.reduceat(values,starts) / n
+    stats[has,1] = (values[starts + (n-1)//2] + values[starts + n//2]) / 2
+    stats[has,2] = values[starts]
+    stats[has,3] = values[ends-1]
+    return stats
+
+
+# Summarize trials in info by condition.
+#
+#    start_time     Time (ms) that onsets are measured from
+#    groups         Columns whose unique combinations are the conditions
+#    onset, rt, acc Columns with onset time, RT, and accuracy (ms, ms, 0/1)
+#    duration       Constant duration (sec) or a column of durations (ms)
+#    condition      Columns joined with '_' to name the condition. If None,
+#                   groups includes a Condition column already
+#    rt_only        (column,value) - only compute RT for these conditions
+#    acc_only       (column,value) - only compute accuracy for these conditions
+#    sort           Sort conditions by groups, or keep order of appearance
+#    pct_decimals   Decimals to round PctAccuracy to, or None
+#
+# Returns a ConditionSummary.
+def summarize_conditions(info, start_time, groups, onset, rt, acc, duration,
+        condition=None, rt_only=None, acc_only=None, sort=False, pct_decimals=1):
+
+    groups = list(groups)
+    names = ['Condition'] if condition is not None else []
+    if info.index.size == 0:
+        empty = numpy.zeros(0)
+        return ConditionSummary(pandas.DataFrame(columns=groups + names),
+            numpy.zeros(1,dtype=int), empty, empty, empty, empty.astype(numpy.int8),
+            empty, numpy.zeros((0,4)), empty.astype(bool), empty.astype(bool))
+
+    # Number the conditions, and sort trial positions by condition keeping
+    # their original order within each one
+    codes = info.groupby(groups,sort=sort).ngroup().to_numpy()
+    order = numpy.argsort(codes,kind='stable')
+    counts = numpy.bincount(codes)
+    offsets = numpy.concatenate([[0],numpy.cumsum(counts)])
+    codes = codes[order]
+
+    conditions = info.iloc[order[offsets[:-1]]].loc[:,groups].reset_index(drop=True)
+    if condition is not None:
+        conditions['Condition'] = conditions.loc[:,condition[0]]
+        for c in condition[1:]:
+            conditions['Condition'] = conditions.Condition + '_' + conditions.loc[:,c]
+
+    # Per-trial values. We subtract the start time and convert to sec.
+    onsets = numpy.round( (condition_column(info,onset).to_numpy()[order] - start_time)
+        / 1000, 1)
+    if isinstance(duration,str):
+        durations = numpy.round( info.loc[:,duration].to_numpy()[order] / 1000, 1)
+    else:
+        durations = numpy.full(len(order),duration,dtype=float)
+    rts = condition_column(info,rt).to_numpy()[order]
+    accs = condition_column(info,acc).to_numpy()[order].astype(float)
+
+    # Accuracy for each condition, from the trials where it's known
+    known = ~numpy.isnan(accs)
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        pct = numpy.add.reduceat(numpy.where(known,accs,0),offsets[:-1]) \
+            / numpy.add.reduceat(known.astype(int),offsets[:-1]) * 100
+    if pct_decimals is not None:
+        pct = numpy.round(pct,pct_decimals)
+
+    # RT stats of the correct trials for each condition
+    correct = (accs == 1) & ~numpy.isnan(rts.astype(float))
+    rt_stats = segment_stats(rts[correct].astype(float), codes[correct],
+        numpy.bincount(codes[correct],minlength=len(counts)))
+    rt_stats = numpy.round(rt_stats,0)
+
+    # Which conditions get RT and accuracy
+    def selected(only):
+        if only is None:
+            return numpy.ones(len(counts),dtype=bool)
+        return (conditions.loc[:,only[0]]==only[1]).to_numpy()
+
+    return ConditionSummary(conditions, offsets, onsets, durations, numpy.round(rts,0),
+        numpy.where(known,accs,0).astype(numpy.int8), pct, rt_stats,
+        selected(acc_only), selected(rt_only))
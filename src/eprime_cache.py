@@ -0,0 +1,134 @@
+# On-disk cache of converted E-Prime tables and task summaries, so rerunning
+# on logs that haven't changed skips the work. It's only used when a cache dir
+# is given (--cache_dir or $GF_EDAT_CACHE). Entries are keyed by a hash of
+# the .txt file's bytes plus what was done with it (sorting, task definition)
+# and code_version(), and stored as pickles under the cache dir:
+#
+#    <cache_dir>/<2 hex digits>/<sha256>.pkl
+#
+# Every hit touches the entry's mtime. When the cache grows past its size
+# limit, the least recently used entries are removed.
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+
+# No cache unless $GF_EDAT_CACHE is set
+DEFAULT_CACHE_DIR = os.environ.get('GF_EDAT_CACHE') or None
+DEFAULT_MAX_MB = 1024
+
+# Code that makes what's cached. Any change to it, or to the versions of
+# pandas and numpy the entries are pickled with, means old entries aren't used
+SOURCES = ('eprime_to_csv.py','eprime_tokenizer.py','eprime_tokenizer_cy.pyx',
+    'condition_summary.py','parse_csv_GF.py','tasks.py','gf_edat.py')
+
+
+# Hash of a file's contents
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path,'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Hash of the SOURCES and the versions of python, pandas and numpy
+def code_version():
+    import numpy
+    import pandas
+    h = hashlib.sha256()
+    h.update(repr((sys.version_info[:2],pandas.__version__,numpy.__version__)).encode())
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for fname in SOURCES:
+        h.update(fname.encode())
+        with open(os.path.join(src_dir,fname),'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+class EprimeCache:
+
+    def __init__(self, cache_dir, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.version = code_version()
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = None
+
+    # Cache key for a file and what's being stored for it, e.g.
+    # key(txt_hash,'summary',task,task_spec)
+    def key(self, txt_hash, *what):
+        h = hashlib.sha256()
+        h.update(self.version.encode())
+        h.update(txt_hash.encode())
+        h.update(repr(what).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir,key[:2],key + '.pkl')
+
+    # Cached value, or None if not cached. A damaged entry counts as a miss
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path,'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    # Store a value. Written to a temp file first so parallel runs never see
+    # a partial entry. Failures to write are reported and otherwise ignored
+    def put(self, key, value):
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),suffix='.tmp')
+            with os.fdopen(fd,'wb') as f:
+                pickle.dump(value,f,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp,path)
+        except OSError as e:
+            print('WARNING: Could not write to cache %s: %s' % (self.cache_dir,e))
+            return
+
+        # Only walk the cache when it might be over the limit
+        if self.total_bytes is not None:
+            self.total_bytes += os.path.getsize(path)
+        if self.total_bytes is None or self.total_bytes > self.max_bytes:
+            self.evict()
+
+    # Remove least recently used entries until the cache fits
+    def evict(self):
+        entries = []
+        total = 0
+        for root,dirs,files in os.walk(self.cache_dir):
+            for fname in files:
+                if not fname.endswith('.pkl'):
+                    continue
+                path = os.path.join(root,fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime,st.st_size,path))
+                total += st.st_size
+        entries.sort()
+        for mtime,size,path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def report(self):
+        return 'Cache: %d hits, %d misses (%s)' % (self.hits,self.misses,self.cache_dir)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+#
+# Convert an E-Prime .txt log as far as it goes, for logs that are still
+# being written or were cut short (E-Prime crashed, or the scan was stopped
+# early). Only complete frames are converted. A checkpoint records how far
+# the log has been read: the byte offset of the end of the last whole line,
+# the text after the last complete frame (a frame that's part-written), and
+# the frames so far. When the log has grown, the next run reads on from the
+# offset instead of starting again. If it's been replaced rather than added
+# to, or the checkpoint is from an older version of this, it's read from the
+# start.
+#
+# Also reports how complete the log is: whether the header is all there, the
+# number of complete frames and (given the task) trials, whether a frame is
+# part-written, and whether the session frame has been logged. E-Prime writes
+# that (level 1) last, when the task finishes, so a log without it is still
+# being written or was cut short.
+#
+#    eprime_partial.py --eprime_txt WM-123456-1-run1.txt -o eprime.csv --task WM
+#
+# The checkpoint is kept next to the CSV (<CSV>.checkpoint.json) unless given
+# with --checkpoint. The CSV is written as gf_edat_lite.py writes it, with
+# the standard library only, and is the same as eprime_to_csv.py writes.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from eprime_to_csv import CHUNK_SIZE, EprimeDecoder, sniff_encoding
+from eprime_tokenizer import FRAME_START, collect_columns, parse_frames
+import gf_edat_lite
+from tasks import TASKS
+
+
+# Bump when a change here or to the tokenizer changes what's in a checkpoint
+CHECKPOINT_VERSION = '1'
+
+# Newline in each encoding sniff_encoding finds. Lines are split on these in
+# the bytes, so a resumed read starts on a line with no decoder state. (Logs
+# with bare \r line ends aren't read, but E-Prime writes \r\n)
+NEWLINES = {
+    'utf-8': b'\n',
+    'utf-16-le': b'\n\x00',
+    'utf-16-be': b'\x00\n',
+    }
+
+# Bytes before the offset that are hashed to tell a log that's grown from one
+# that's been replaced
+ANCHOR_BYTES = 4096
+
+
+# End of the last whole line in data, which starts at a character boundary,
+# or 0 if there isn't one
+def line_end(data, encoding):
+    nl = NEWLINES[encoding]
+    i = data.rfind(nl)
+    # A UTF-16 newline must start on a character
+    while i > 0 and i % len(nl):
+        i = data.rfind(nl,0,i + len(nl) - 1)
+    return i + len(nl) if i >= 0 else 0
+
+
+# Hash of the bytes just before offset, and at least the first bytes the
+# encoding is sniffed from, in case they weren't all there at first
+def anchor(f, offset):
+    end = max(offset,4)
+    start = max(0,end - ANCHOR_BYTES)
+    f.seek(start)
+    return hashlib.sha256(f.read(end - start)).hexdigest()
+
+
+# A checkpoint for a log that hasn't been read yet
+def new_checkpoint(f):
+    f.seek(0)
+    encoding, offset = sniff_encoding(f.read(4))
+    return dict(version=CHECKPOINT_VERSION, encoding=encoding, offset=offset,
+        anchor=anchor(f,offset), in_header=True, pending='', nrows=0, columns=dict())
+
+
+# Whether a log can be read on from a checkpoint: it's at least as long as
+# when the checkpoint was made, with the same bytes before the offset
+def can_resume(f, checkpoint):
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        return False
+    if os.fstat(f.fileno()).st_size < checkpoint['offset']:
+        return False
+    return anchor(f,checkpoint['offset']) == checkpoint['anchor']
+
+
+# Decoded text of the whole lines in the log after the checkpoint's offset,
+# a chunk at a time. The offset is moved on past each chunk as it's yielded
+def read_lines(f, checkpoint, chunk_size=CHUNK_SIZE):
+    encoding = checkpoint['encoding']
+    decoder = EprimeDecoder(encoding)
+    f.seek(checkpoint['offset'])
+    data = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        data += chunk
+        end = line_end(data,encoding)
+        if end:
+            yield decoder.decode(data[:end])
+            checkpoint['offset'] += end
+            data = data[end:]
+
+
+# Add columns of new frames to the checkpoint's. Fields first seen in the new
+# frames go after the ones already there, as they would reading it all at once
+def add_columns(checkpoint, columns, nrows):
+    have = checkpoint['columns']
+    for field,col in have.items():
+        col.extend(columns.pop(field,None) or [None] * nrows)
+    for field,col in columns.items():
+        have[field] = [None] * checkpoint['nrows'] + col
+    checkpoint['nrows'] += nrows
+
+
+# Read a log on from a checkpoint, or from the start if there isn't one or it
+# doesn't fit. Returns the updated checkpoint and whether anything has changed
+# since the one given. Raises ValueError if it isn't an E-Prime log
+def update(eprime_txt, checkpoint=None, chunk_size=CHUNK_SIZE):
+    with open(eprime_txt,'rb',buffering=0) as f:
+        offset = None
+        if checkpoint is not None and can_resume(f,checkpoint):
+            offset = checkpoint['offset']
+        else:
+            checkpoint = new_checkpoint(f)
+        state = dict(in_header=checkpoint['in_header'],pending=checkpoint['pending'])
+        columns, nrows = collect_columns(parse_frames(read_lines(f,checkpoint,chunk_size),state))
+        add_columns(checkpoint,columns,nrows)
+        checkpoint['in_header'] = state['in_header']
+        checkpoint['pending'] = state['pending']
+        checkpoint['anchor'] = anchor(f,checkpoint['offset'])
+        checkpoint['size'] = os.fstat(f.fileno()).st_size
+    return checkpoint, checkpoint['offset'] != offset
+
+
+# Number of trials of a task among the frames
+def count_trials(columns, nrows, task):
+    rows = TASKS[task]['rows']
+    col, is_int = gf_edat_lite.infer_column(columns.get(rows['column'],[None] * nrows))
+    return len(gf_edat_lite.trial_rows(col,rows))
+
+
+# How complete the log is, from its checkpoint
+def progress(checkpoint, task=None):
+    header = not checkpoint['in_header']
+    levels = checkpoint['columns'].get('Level',[])
+    finished = '1' in levels
+    if checkpoint['size'] == 0:
+        status = 'empty'
+    elif not header:
+        status = 'header incomplete'
+    else:
+        status = 'complete' if finished else 'incomplete'
+    return dict(
+        status=status,
+        header=header,
+        frames=max(checkpoint['nrows'] - 1,0),
+        trials=count_trials(checkpoint['columns'],checkpoint['nrows'],task) if task else None,
+        partial_frame=FRAME_START in checkpoint['pending'],
+        finished=finished,
+        bytes_read=checkpoint['offset'],
+        bytes_total=checkpoint['size'],
+        )
+
+
+def progress_text(p):
+    text = '%s, %d frames' % (p['status'],p['frames'])
+    if p['trials'] is not None:
+        text += ' (%d trials)' % p['trials']
+    if p['partial_frame']:
+        text += ', a frame part-written'
+    return text + ', %d of %d bytes read' % (p['bytes_read'],p['bytes_total'])
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Write a file whole or not at all, so a reader never sees it half-written
+def write_atomic(path, write):
+    tmp = '%s.%d.tmp' % (path,os.getpid())
+    try:
+        with open(tmp,'w',newline='') as f:
+            write(f)
+        os.replace(tmp,path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# Convert what there is of a log to out_csv, reading on from the checkpoint
+# file if there is one, and update the checkpoint. Frames are sorted by level
+# if the task sorts them (or if sort, without a task). The CSV is only
+# rewritten if something new was read. Returns the log's progress
+def convert(eprime_txt, out_csv, checkpoint_json=None, task=None, sort=True,
+        chunk_size=CHUNK_SIZE):
+    if checkpoint_json is None:
+        checkpoint_json = out_csv + '.checkpoint.json'
+    if task is not None:
+        sort = TASKS[task]['sort_frames']
+    for path in (out_csv,checkpoint_json):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+
+    checkpoint, changed = update(eprime_txt,read_checkpoint(checkpoint_json),chunk_size)
+    if changed or not os.path.exists(out_csv):
+        columns, nrows = checkpoint['columns'], checkpoint['nrows']
+        if sort and nrows:
+            columns = gf_edat_lite.sort_by_level(columns,nrows)
+        write_atomic(out_csv,lambda f: gf_edat_lite.write_eprime_rows(columns,nrows,f))
+        write_atomic(checkpoint_json,lambda f: json.dump(checkpoint,f,separators=(',',':')))
+    return progress(checkpoint,task)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Convert as much of an E-Prime .txt log as has been written')
+    parser.add_argument('--eprime_txt', help='E-Prime txt file', required=True)
+    parser.add_argument('-o', '--outcsv', help='File to store the output CSV')
+    parser.add_argument('--checkpoint',
+        help='Checkpoint file (default the output CSV with .checkpoint.json added)')
+    parser.add_argument('--task', choices=list(TASKS),
+        help='Task, to count its trials and sort frames as it does')
+    parser.add_argument('--unsorted', action='store_true',
+        help='Keep frames in file order (without --task)')
+    parser.add_argument('--progress_json', help='Also store the progress in this JSON file')
+    args = parser.parse_args()
+
+    out_csv = args.outcsv
+    if out_csv is None:
+        out_csv = '.csv'.join(args.eprime_txt.rsplit('.txt',1))
+
+    try:
+        p = convert(args.eprime_txt, out_csv, args.checkpoint, task=args.task,
+            sort=not args.unsorted)
+    except ValueError as e:
+        print('%s: %s' % (args.eprime_txt,e))
+        sys.exit(1)
+
+    print('%s: %s' % (args.eprime_txt,progress_text(p)))
+    if args.progress_json:
+        with open(args.progress_json,'w') as f:
+            json.dump(p,f,indent=2)
+
+
+if __name__ == "__main__":
+    main()
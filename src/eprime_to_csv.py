@@ -1,20 +1,369 @@
 #!/usr/bin/env python3
 #
 # Read E-Prime text files and convert to CSV
+#
+# The text parsing only needs the standard library. pandas is imported by the
+# functions that build or read data frames, so the parser can be used without
+# paying for the pandas import (see gf_edat_lite.py). The frames and fields
+# are tokenized by eprime_tokenizer.py, which has an optional compiled version.
 
 import argparse
-import re
-import pandas
+import codecs
+import csv
+import json
 import os
+import tempfile
+
+# Kept importable from here for existing callers
+from eprime_tokenizer import (FRAME_END, FRAME_START, HEADER_END, HEADER_START,
+    collect_columns, parse_frames, tokenize)
+
+
+# Bytes to read and decode at a time
+CHUNK_SIZE = 1024 * 1024
+
+# Values pandas.read_csv treats as missing by default
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null',
+    }
+BOOL_VALUES = {'True': True, 'TRUE': True, 'true': True,
+    'False': False, 'FALSE': False, 'false': False}
+
+# File formats for the converted table, by extension. Feather and parquet
+# store the dtypes, so they don't have to be inferred again on every read
+TABLE_FORMATS = {
+    '.csv': 'csv',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.parquet': 'parquet',
+    }
+
+
+# Byte order marks E-Prime .txt files can start with, and their encodings.
+# E-Prime writes UTF-16 with a BOM, but logs from other versions or re-saved
+# by hand can be UTF-8 or ANSI (Windows-1252), with or without one
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+    )
+
+
+# Encoding of an E-Prime .txt file from its first bytes. Returns the
+# encoding and the length of the BOM to skip. Without a BOM, UTF-16 shows as
+# a null in every other byte of the header text, and anything else is read
+# as UTF-8 with a fallback to Windows-1252, which covers ANSI files and ASCII
+# files with the odd ANSI character.
+def sniff_encoding(head):
+    for bom,encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    if len(head) >= 2 and head[0] and not head[1]:
+        return 'utf-16-le', 0
+    if len(head) >= 2 and not head[0] and head[1]:
+        return 'utf-16-be', 0
+    return 'utf-8', 0
+
+
+# Undecodable bytes in UTF-8 text are taken as Windows-1252
+def cp1252_fallback(error):
+    return error.object[error.start:error.end].decode('cp1252',errors='replace'), error.end
+
+codecs.register_error('eprime-cp1252',cp1252_fallback)
+
+
+# Incremental decoder for E-Prime text in a given encoding. Nulls are dropped
+# and newlines are converted to \n like Python's universal newlines mode, as
+# each chunk is decoded. A \r at the end of a chunk is held back in case it's
+# the first half of \r\n. A UTF-16 log that ends part-way through a
+# character, as one cut short can, loses the part.
+class EprimeDecoder(codecs.IncrementalDecoder):
+
+    def __init__(self, encoding):
+        super().__init__('eprime-cp1252' if encoding == 'utf-8' else 'strict')
+        self.decoder = codecs.getincrementaldecoder(encoding)(self.errors)
+        self.cr = False
+
+    def decode(self, data, final=False):
+        try:
+            txt = self.decoder.decode(data,final)
+        except UnicodeDecodeError:
+            if not final:
+                raise
+            # A UTF-16 log cut off part-way through a character
+            txt = self.decoder.decode(data)
+            self.decoder.reset()
+        if '\x00' in txt:
+            txt = txt.replace('\x00','')
+        if self.cr:
+            txt = '\r' + txt
+        self.cr = not final and txt.endswith('\r')
+        if self.cr:
+            txt = txt[:-1]
+        return txt.replace('\r\n','\n').replace('\r','\n')
+
+    def reset(self):
+        self.decoder.reset()
+        self.cr = False
+
+
+# Read an E-Prime .txt file a chunk at a time and yield blocks of text that
+# end on a line boundary, decoded with EprimeDecoder in the encoding sniffed
+# from the first bytes. Chunks are read straight into bytes for the codec;
+# reading through a memory map was slower, with the page faults and the copy
+# the codec makes of a buffer that isn't bytes.
+def read_blocks(eprime_txt, chunk_size=CHUNK_SIZE):
+
+    with open(eprime_txt,'rb',buffering=0) as f:
+        head = f.read(4)
+        encoding, start = sniff_encoding(head)
+        decoder = EprimeDecoder(encoding)
+        chunk = head[start:]
+        tail = ''
+        while True:
+            txt = tail + decoder.decode(chunk)
+            i = txt.rfind('\n') + 1
+            tail = txt[i:]
+            yield txt[:i]
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+        yield tail + decoder.decode(b'',final=True)
+
+
+# numpy's default argsort (quicksort) for a list of values compared with <:
+# an introsort with median-of-3 pivots, insertion sort for short runs and
+# heapsort past a depth limit. It isn't stable, and which way it orders equal
+# values is part of the output wherever frames are sorted by level, so it's
+# followed step for step. Short runs are those of 16 or fewer values
+SMALL_SORT = 15
+
+def np_argsort(values):
+    v = values
+    a = list(range(len(v)))
+    pl, pr = 0, len(v) - 1
+    depth = (max(len(v),1).bit_length() - 1) * 2
+    stack = []
+    while True:
+        if depth < 0:
+            np_aheapsort(v,a,pl,pr - pl + 1)
+        else:
+            while pr - pl > SMALL_SORT:
+                pm = pl + ((pr - pl) >> 1)
+                if v[a[pm]] < v[a[pl]]:
+                    a[pm], a[pl] = a[pl], a[pm]
+                if v[a[pr]] < v[a[pm]]:
+                    a[pr], a[pm] = a[pm], a[pr]
+                if v[a[pm]] < v[a[pl]]:
+                    a[pm], a[pl] = a[pl], a[pm]
+                pivot = v[a[pm]]
+                pi, pj = pl, pr - 1
+                a[pm], a[pj] = a[pj], a[pm]
+                while True:
+                    pi += 1
+                    while v[a[pi]] < pivot:
+                        pi += 1
+                    pj -= 1
+                    while pivot < v[a[pj]]:
+                        pj -= 1
+                    if pi >= pj:
+                        break
+                    a[pi], a[pj] = a[pj], a[pi]
+                a[pi], a[pr - 1] = a[pr - 1], a[pi]
+                # Carry on with the smaller side, the larger one waits
+                depth -= 1
+                if pi - pl < pr - pi:
+                    stack.append((pi + 1,pr,depth))
+                    pr = pi - 1
+                else:
+                    stack.append((pl,pi - 1,depth))
+                    pl = pi + 1
+            for i in range(pl + 1,pr + 1):
+                ai = a[i]
+                vi = v[ai]
+                j = i
+                while j > pl and vi < v[a[j - 1]]:
+                    a[j] = a[j - 1]
+                    j -= 1
+                a[j] = ai
+        if not stack:
+            return a
+        pl, pr, depth = stack.pop()
+
+
+# numpy's argsort heapsort of the n indices in a from start, in place
+def np_aheapsort(v, a, start, n):
+    o = start - 1
+    for l in range(n >> 1,0,-1):
+        sift_down(v,a,o,l,n,a[o + l])
+    while n > 1:
+        tmp = a[o + n]
+        a[o + n] = a[o + 1]
+        n -= 1
+        sift_down(v,a,o,1,n,tmp)
+
+
+def sift_down(v, a, o, i, n, tmp):
+    j = i * 2
+    while j <= n:
+        if j < n and v[a[o + j]] < v[a[o + j + 1]]:
+            j += 1
+        if not v[tmp] < v[a[o + j]]:
+            break
+        a[o + i] = a[o + j]
+        i = j
+        j += j
+    a[o + i] = tmp
+
 
-    
-def main():
+# Order of the rows when sorted by level, as read_eprime_txt sorts them with
+# pandas: numpy's argsort of the levels, then rows without one. Conversions
+# that don't use pandas sort with this so they list frames in the same order
+def level_order(levels):
+    present = [i for i,level in enumerate(levels) if level is not None]
+    order = np_argsort([levels[i] for i in present])
+    return [present[i] for i in order] + [i for i,level in enumerate(levels) if level is None]
+
+
+# Read an E-Prime .txt file into a data frame, one row per log frame plus
+# one for the header. Every value is kept as the original text.
+def read_eprime_txt(eprime_txt, sort=True):
+    import pandas
+
+    columns, nrows = tokenize(read_blocks(eprime_txt))
+
+    parsed_frames = pandas.DataFrame(columns,index=[0]*nrows)
+
+    # Sort by level for pretty
+    if sort:
+        parsed_frames = parsed_frames.sort_values(axis=0,by='Level')
+
+    return parsed_frames
+
+
+# Give the text columns of a parsed table the same dtypes pandas.read_csv
+# would infer from its CSV, so it can be handed straight to a task parser
+# without writing and re-reading the CSV. Works for any table of text cells
+# with None for missing values. The index is reset like read_csv's.
+def infer_dtypes(table):
+    import pandas
+
+    typed = dict()
+    for field in table.columns:
+        values = [None if v is None or v in NA_VALUES else v for v in table[field]]
+        col = pandas.Series(values,dtype=object)
+        try:
+            col = pandas.to_numeric(col)
+        except (ValueError, TypeError):
+            present = [v for v in values if v is not None]
+            if present and None not in values and all(v in BOOL_VALUES for v in present):
+                col = col.map(BOOL_VALUES).astype(bool)
+            else:
+                col = col.fillna(float('nan'))
+        typed[field] = col
+
+    return pandas.DataFrame(typed)
+
+
+# Format of a table file from its extension. Anything unknown is CSV
+def table_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return TABLE_FORMATS.get(ext,'csv')
+
+
+# Write the parsed table as CSV, or as a typed feather/parquet file. Feather
+# files are uncompressed so they can be memory mapped when read
+def write_eprime_table(parsed_frames, path):
+    fmt = table_format(path)
+    if fmt == 'csv':
+        parsed_frames.to_csv(path)
+        return
+    typed = infer_dtypes(parsed_frames)
+    if fmt == 'feather':
+        typed.to_feather(path,compression='uncompressed')
+    else:
+        typed.to_parquet(path,index=False)
+
+
+# Read a converted table written by eprime_to_csv, optionally just some of
+# its columns. Feather files are memory mapped
+def read_eprime_table(path, columns=None):
+    import pandas
+    fmt = table_format(path)
+    if fmt == 'csv':
+        return pandas.read_csv(path,usecols=columns)
+    if fmt == 'feather':
+        import pyarrow.feather
+        return pyarrow.feather.read_table(path,columns=columns,memory_map=True).to_pandas()
+    return pandas.read_parquet(path,columns=columns,memory_map=True)
+
+
+# Names of the columns in a converted table written by eprime_to_csv, from
+# the CSV header or the feather/parquet schema
+def table_columns(path):
+    fmt = table_format(path)
+    if fmt == 'csv':
+        with open(path,newline='') as f:
+            return next(csv.reader(f),[])
+    if fmt == 'feather':
+        import pyarrow.ipc
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema.names
+    import pyarrow.parquet
+    return pyarrow.parquet.read_schema(path).names
+
+
+# Convert an E-Prime .txt file to CSV in bounded memory. Each frame is
+# spooled to a temporary file as soon as it closes, as a list of values in
+# column order (columns only ever get added at the end), and only its level
+# and place in the spool are kept. Once the full set of columns is known, the
+# spooled rows are written to the CSV one at a time, in level_order if
+# sorting. The output is byte for byte the same as read_eprime_txt().to_csv().
+def stream_eprime_txt_to_csv(eprime_txt, out_csv, sort=True, chunk_size=CHUNK_SIZE):
+
+    columns = dict()
+    levels = []
+    offsets = []
+    with tempfile.TemporaryFile() as spool:
+
+        for pairs in parse_frames(read_blocks(eprime_txt,chunk_size)):
+            frame = dict(pairs)
+            for field in frame:
+                if field not in columns:
+                    columns[field] = len(columns)
+            values = [None] * len(columns)
+            for field,value in frame.items():
+                values[columns[field]] = value
+            levels.append(frame.get('Level'))
+            offsets.append(spool.tell())
+            spool.write(json.dumps(values).encode() + b'\n')
+
+        with open(out_csv,'w',newline='') as f:
+            writer = csv.writer(f,lineterminator='\n')
+            writer.writerow([''] + list(columns))
+            padding = len(columns)
+            for i in level_order(levels) if sort else range(len(offsets)):
+                spool.seek(offsets[i])
+                values = json.loads(spool.readline())
+                values.extend([None] * (padding - len(values)))
+                writer.writerow(['0'] + values)
+
+
+def main(sort=True):
 
     # Parse arguments
     parser = argparse.ArgumentParser(description='Parse E-Prime text output and create CSV')
     parser.add_argument('-o', '--outcsv', help='File to store the output CSV')
+    parser.add_argument('--outtable',
+        help='Also store the table with dtypes in a .feather or .parquet file')
+    parser.add_argument('--no_csv', action='store_true', help='Do not write the CSV')
+    parser.add_argument('--stream', action='store_true',
+        help='Convert in bounded memory, writing the CSV incrementally')
     parser.add_argument('eprime_txt', help='E-Prime txt file', metavar='EPRIME_TXT')
     args = parser.parse_args()
+    if args.stream and (args.outtable or args.no_csv):
+        parser.error('--stream only writes CSV')
 
     # Generate output CSV path+filename
     if args.outcsv is None:
@@ -23,51 +372,23 @@ def main():
     else:
         out_csv = args.outcsv
 
-    # Read entire file into a string, eliminating nulls
-    with open(args.eprime_txt,encoding='utf-16') as f:
-        txt = f.read().replace(u'\x00','')
-
-    # Pull out header, main body. No special treatment for carriage returns (DOTALL)
-    expr_main = re.compile(
-        '\*\*\* Header Start \*\*\*(?P<hdr>.*)\*\*\* Header End \*\*\*'
-        '(?P<body>.*)'
-        ,re.DOTALL)
-    match_main = re.match(expr_main,txt)
-
-    # Parse header into fields and values
-    expr_fields = re.compile(
-        '^\t*(?P<field>.*?)\: (?P<value>.*)$'
-        ,re.MULTILINE)
-    parsed_hdr = re.findall(expr_fields,match_main.group('hdr'))
-    parsed_hdr.append(('Level','0'))
-
-    # Pull out log frames. Can't be greedy if we want to separate frames, so lots of *?
-    expr_frame = re.compile(
-        '\t*?Level\: (?P<level>[0-9]*?)[\n\r\t]*?'
-        '\*\*\* LogFrame Start \*\*\*[\n\r\t]*?'
-        '(?P<frame>.*?)[\n\r\t]*?'
-        '\*\*\* LogFrame End \*\*\*'
-        ,re.DOTALL)
-    match_frame = re.findall(expr_frame,match_main.group('body'))
-
-    # Parse log frames into fields and values, reorganize into data frame
-    parsed_frames = pandas.DataFrame(dict(parsed_hdr),index=[0])
-    for frame in match_frame:
-        parsed_frame = re.findall(expr_fields,frame[1])
-        parsed_frame.append(('Level',frame[0]))
-        parsed_frame = pandas.DataFrame(dict(parsed_frame),index=[0])
-        #parsed_frames = parsed_frames.append(parsed_frame)
-        parsed_frames = pandas.concat([parsed_frames,parsed_frame])
+    # Bounded memory conversion writes the CSV as it goes
+    if args.stream:
+        stream_eprime_txt_to_csv(args.eprime_txt,out_csv,sort=sort)
+        return
 
-    # Sort by level for pretty
-    parsed_frames = parsed_frames.sort_values(axis=0,by='Level')
+    # Parse log frames into a data frame
+    parsed_frames = read_eprime_txt(args.eprime_txt,sort=sort)
 
-    # Write to CSV
-    parsed_frames.to_csv(out_csv)
+    # Write to CSV and/or typed table
+    if not args.no_csv:
+        parsed_frames.to_csv(out_csv)
+    if args.outtable:
+        write_eprime_table(parsed_frames,args.outtable)
 
 
 
 if __name__ == "__main__":
     main()
-    
+
 
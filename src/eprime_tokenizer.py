@@ -0,0 +1,174 @@
+# Tokenizer for E-Prime .txt logs: splits the decoded text into the header
+# and log frames, and collects their fields into columns. This is the CPU-
+# heavy part of the conversion. tokenize() does both in one pass and is
+# replaced by the compiled version in eprime_tokenizer_cy.pyx if that has
+# been built, for large reprocessing jobs:
+#
+#    pip3 install cython
+#    python3 setup_tokenizer.py build_ext --inplace
+#
+# Without it, or if it won't import (e.g. built for another Python), the
+# plain Python version here is used. COMPILED says which one is in use, and
+# check_tokenizer.py checks the two give the same CSVs.
+
+import re
+
+
+# Markers that delimit the header and log frames in E-Prime's .txt output
+HEADER_START = '*** Header Start ***'
+HEADER_END = '*** Header End ***'
+FRAME_START = '*** LogFrame Start ***'
+FRAME_END = '*** LogFrame End ***'
+
+# Lines that end the header, start a frame (its level line, any blank lines,
+# then the start marker), end a frame, and hold a field
+expr_header_end = re.compile(r'^\t*' + re.escape(HEADER_END), re.MULTILINE)
+expr_frame_start = re.compile(
+    r'^\t*Level: (?P<level>[0-9]*)\t*\n(?:\t*\n)*\t*' + re.escape(FRAME_START) + '.*$',
+    re.MULTILINE)
+expr_frame_end = re.compile(r'^\t*' + re.escape(FRAME_END), re.MULTILINE)
+expr_fields = re.compile(r'^\t*(?P<field>.*?): (?P<value>.*)$', re.MULTILINE)
+
+
+# Where the header that starts txt ends: the end of its fields, and where to
+# look for frames after it. The header ends at its end marker, or if that's
+# missing (a log cut short, or a damaged line) at the first frame. Returns
+# None if neither is there yet
+def find_header_end(txt, first):
+    end = expr_header_end.search(txt,first)
+    start = expr_frame_start.search(txt,first,end.start() if end else len(txt))
+    if start is not None:
+        return start.start(), start.start()
+    if end is not None:
+        return end.start(), end.end()
+    return None
+
+
+# Tokenize E-Prime text from read_blocks. Yields a list of (field,value) pairs
+# for the header and then for each complete log frame, with the frame's level
+# appended as a final ('Level',level) pair. The header is reported as level 0,
+# and a header that never ends is reported with the fields it has.
+#
+# Each frame is found with one anchored search for its level and start marker
+# and one for its end marker, and its fields are pulled out with a single
+# findall over the lines in between, so every line is scanned once. Field
+# lines are tab-indented according to their level, "<field>: <value>".
+#
+# With state (a dict), tokenizing carries on from where an earlier call left
+# off, for a log that's still being written: state['in_header'] and
+# state['pending'], the text after the last complete frame, are used at the
+# start and updated at the end, and a header that hasn't ended is left
+# pending. blocks is then the text added to the log since.
+def parse_frames(blocks, state=None):
+
+    txt = ''
+    pos = 0
+    in_header = True
+    if state is not None:
+        txt = state.get('pending','')
+        in_header = state.get('in_header',True)
+
+    for block in blocks:
+        txt += block
+        if not txt:
+            continue
+
+        # Find the header. E-Prime always starts the file with it
+        if in_header:
+            if not txt.startswith(HEADER_START):
+                raise ValueError('E-Prime header not found')
+            first = txt.find('\n')
+            if first < 0:
+                first = len(txt)
+            end = find_header_end(txt,first)
+            if end is None:
+                continue
+            pairs = expr_fields.findall(txt,first,end[0])
+            pairs.append(('Level','0'))
+            yield pairs
+            pos = end[1]
+            in_header = False
+
+        # Complete frames. Only whitespace is allowed between the level and
+        # the frame start
+        while True:
+            start = expr_frame_start.search(txt,pos)
+            if start is None:
+                break
+            end = expr_frame_end.search(txt,start.end())
+            if end is None:
+                break
+            pairs = expr_fields.findall(txt,start.end(),end.start())
+            pairs.append(('Level',start.group('level')))
+            yield pairs
+            pos = end.end()
+
+        # Keep what might be the start of a frame that isn't all here yet
+        if start is not None:
+            pos = start.start()
+        else:
+            i = txt.rfind('Level: ',pos)
+            pos = txt.rfind('\n',0,i) + 1 if i >= 0 else len(txt)
+        txt = txt[pos:]
+        pos = 0
+
+    if state is not None:
+        state['in_header'] = in_header
+        state['pending'] = txt
+    elif in_header:
+        if not txt.startswith(HEADER_START):
+            raise ValueError('E-Prime header not found')
+        first = txt.find('\n')
+        pairs = expr_fields.findall(txt,first if first >= 0 else len(txt))
+        pairs.append(('Level','0'))
+        yield pairs
+
+
+# Collect frames into column-oriented buffers. Each column keeps the row
+# numbers where it has a value, so sparse columns cost nothing for the rows
+# where they are absent. Columns are ordered by first appearance. Returns
+# the columns as full-length lists (None where missing) and the row count.
+def collect_columns(frames):
+
+    colrows = dict()
+    colvals = dict()
+    nrows = 0
+    for pairs in frames:
+        # Repeated fields within a frame keep the last value
+        for field,value in dict(pairs).items():
+            rows = colrows.get(field)
+            if rows is None:
+                rows = colrows[field] = []
+                colvals[field] = []
+            rows.append(nrows)
+            colvals[field].append(value)
+        nrows += 1
+
+    columns = dict()
+    for field,rows in colrows.items():
+        vals = colvals[field]
+        if len(rows) == nrows:
+            columns[field] = vals
+        else:
+            col = [None] * nrows
+            for r,v in zip(rows,vals):
+                col[r] = v
+            columns[field] = col
+
+    return columns, nrows
+
+
+# Header and frames of E-Prime text from read_blocks, as columns. Returns the
+# same as collect_columns
+def tokenize(blocks):
+    return collect_columns(parse_frames(blocks))
+
+
+# Use the compiled tokenizer if it's been built. The plain one stays
+# available as tokenize_py
+tokenize_py = tokenize
+try:
+    from eprime_tokenizer_cy import tokenize
+    COMPILED = True
+except ImportError:
+    COMPILED = False
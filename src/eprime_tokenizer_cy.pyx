@@ -0,0 +1,114 @@
+# cython: language_level=3
+#
+# Compiled version of eprime_tokenizer.tokenize. Build with
+#
+#    python3 setup_tokenizer.py build_ext --inplace
+#
+# Frames are found with the same expressions as parse_frames, but the fields
+# are split out of the lines by hand and added straight to the columns,
+# without building a list of pairs per frame. Each column is padded with
+# None up to the row it's added on. The result must be the same as the plain
+# Python version's, columns in the same order: check with check_tokenizer.py.
+
+from eprime_tokenizer import (HEADER_START, expr_frame_end, expr_frame_start,
+    find_header_end)
+
+
+# Set a field's value on a row. A field repeated within a frame is already
+# on the row, and keeps the last value
+cdef inline void add_value(dict columns, str field, str value, Py_ssize_t row):
+    cdef list col = columns.get(field)
+    cdef Py_ssize_t n
+    if col is None:
+        col = columns[field] = []
+    n = len(col)
+    if n == row + 1:
+        col[row] = value
+        return
+    if n < row:
+        col.extend([None] * (row - n))
+    col.append(value)
+
+
+# Fields of the lines between pos and end, "<field>: <value>" after any tabs.
+# Lines without ': ' are skipped
+cdef void add_fields(dict columns, str txt, Py_ssize_t pos, Py_ssize_t end, Py_ssize_t row):
+    cdef Py_ssize_t nl, sep
+    while pos < end:
+        nl = txt.find('\n',pos,end)
+        if nl < 0:
+            nl = end
+        while pos < nl and txt[pos] == u'\t':
+            pos += 1
+        sep = txt.find(': ',pos,nl)
+        if sep >= 0:
+            add_value(columns,txt[pos:sep],txt[sep+2:nl],row)
+        pos = nl + 1
+
+
+# As eprime_tokenizer.parse_frames then collect_columns
+def tokenize(blocks):
+
+    cdef str txt = ''
+    cdef Py_ssize_t pos = 0, first, i
+    cdef bint in_header = True
+    cdef Py_ssize_t nrows = 0
+    cdef dict columns = {}
+    start = None
+
+    for block in blocks:
+        txt += block
+        if not txt:
+            continue
+
+        # Find the header. E-Prime always starts the file with it
+        if in_header:
+            if not txt.startswith(HEADER_START):
+                raise ValueError('E-Prime header not found')
+            first = txt.find('\n')
+            if first < 0:
+                first = len(txt)
+            end = find_header_end(txt,first)
+            if end is None:
+                continue
+            add_fields(columns,txt,first,end[0],nrows)
+            add_value(columns,'Level','0',nrows)
+            nrows += 1
+            pos = end[1]
+            in_header = False
+
+        # Complete frames
+        while True:
+            start = expr_frame_start.search(txt,pos)
+            if start is None:
+                break
+            end = expr_frame_end.search(txt,start.end())
+            if end is None:
+                break
+            add_fields(columns,txt,start.end(),end.start(),nrows)
+            add_value(columns,'Level',start.group('level'),nrows)
+            nrows += 1
+            pos = end.end()
+
+        # Keep what might be the start of a frame that isn't all here yet
+        if start is not None:
+            pos = start.start()
+        else:
+            i = txt.rfind('Level: ',pos)
+            pos = txt.rfind('\n',0,i) + 1 if i >= 0 else len(txt)
+        txt = txt[pos:]
+        pos = 0
+
+    # A header that never ends
+    if in_header:
+        if not txt.startswith(HEADER_START):
+            raise ValueError('E-Prime header not found')
+        first = txt.find('\n')
+        add_fields(columns,txt,first if first >= 0 else len(txt),len(txt),nrows)
+        add_value(columns,'Level','0',nrows)
+        nrows += 1
+
+    for col in columns.values():
+        if len(col) < nrows:
+            col.extend([None] * (nrows - len(col)))
+    return columns, nrows
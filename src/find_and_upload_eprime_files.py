@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+#
+# Search a directory and all its subdirectories for EPrime txt files:
+#    Oddball-*.txt
+#    SPT-*.txt
+#    WM-*.txt
+#
+# and upload each one to the EPRIME_TXT resource of the correct subject,
+# session, scan on XNAT based on the filename, the same way as
+# upload_single_gf_eprime_to_xnat.py. By default, upload will be skipped if the
+# resource already exists on XNAT.
+#
+# Everything runs in one process. Files are grouped by session, and the scans
+# of each session are listed once and matched to all its files. Sessions are
+# uploaded by a small pool of threads, each keeping its own XNAT connection
+# for the whole run, and XNAT calls that fail are retried with increasing
+# waits on a new connection. The status of every file is listed at the end.
+#
+# The directory tree is searched by several threads at once, and uploads for
+# the files in each directory start as soon as it has been listed. Directory
+# listings are kept in the manifest database (below), and directories that
+# haven't changed since the last run are not listed again.
+#
+# What happened to each file is recorded in a local database (see
+# upload_manifest.py). Files that were uploaded, whose scan already had the
+# resource, or whose filename couldn't be parsed are skipped on later runs
+# without checking XNAT until they change. Files that changed after they
+# were uploaded replace the earlier upload; other files that weren't uploaded
+# (no matching scan, failed, ...) are tried again. With --overwrite True no
+# file is skipped, and every one is uploaded over what's on XNAT.
+#
+# Requires a python 3 installation and DAX:
+#    https://dax.readthedocs.io/en/latest/installing_dax_in_a_virtual_environment.html
+#
+# The XNAT host and login come from $XNAT_HOST and ~/.netrc as for other DAX
+# tools unless --host/--user are given, e.g. to test against a local server.
+#
+# Usage:
+#
+#    find_and_upload_eprime_files.py --project <XNAT_project> --dir <directory>
+#        [--days N] [--overwrite True] [--jobs N] [--report status.csv]
+#        [--manifest uploads.sqlite | --no_manifest]
+
+import argparse
+import concurrent.futures
+import csv
+import fnmatch
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import dax
+
+import upload_manifest
+
+
+# Filenames to look for
+FILE_PATTERNS = ('Oddball-*.txt','SPT-*.txt','WM-*.txt')
+
+# Session and run from the filename, e.g. WM-123456-2-run3.txt
+expr_filename = re.compile(r'^(?P<task>.*?)-(?P<session>.*?)-(?P<run>\d)\S*\.txt$')
+
+RESOURCE = 'EPRIME_TXT'
+
+
+# Whether a filename is one of the task E-Prime files
+def is_eprime_file(fname):
+    return any(fnmatch.fnmatchcase(fname,p) for p in FILE_PATTERNS)
+
+
+# Listings of directories from an earlier search, by path: the directory's
+# mtime, when it was listed, and the E-Prime files and subdirectories in it.
+# A directory's mtime changes whenever an entry is added, removed or renamed,
+# so if it hasn't changed the directory doesn't need listing again. Listings
+# made within a few seconds of the mtime aren't trusted, since a change made
+# just after might not have moved the mtime on. Listings used or made during
+# a search are collected in fresh, to be kept for the next one.
+class DirCache:
+
+    MARGIN = 2
+
+    def __init__(self, listings=None):
+        self.listings = listings or dict()
+        self.fresh = dict()
+
+    def get(self, path, mtime):
+        listing = self.listings.get(path)
+        if listing is None or listing['mtime'] != mtime or listing['listed'] - mtime < self.MARGIN:
+            return None
+        self.fresh[path] = listing
+        return listing
+
+    def put(self, path, mtime, listed, files, subdirs):
+        self.fresh[path] = dict(mtime=mtime, listed=listed, files=files, subdirs=subdirs)
+
+
+# E-Prime files and subdirectories in one directory, from the cache if it
+# hasn't changed. Unreadable directories are skipped, like os.walk does.
+def scan_dir(path, dir_cache=None, cutoff=None):
+    try:
+        mtime = os.stat(path).st_mtime
+        listing = dir_cache.get(path,mtime) if dir_cache is not None else None
+        if listing is None:
+            listed = time.time()
+            files, subdirs = [], []
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif is_eprime_file(entry.name) and entry.is_file():
+                        files.append(entry.name)
+            if dir_cache is not None:
+                dir_cache.put(path,mtime,listed,files,subdirs)
+        else:
+            files, subdirs = listing['files'], listing['subdirs']
+    except OSError:
+        return [], []
+
+    files = [os.path.join(path,f) for f in files]
+    if cutoff is not None:
+        files = [f for f in files if os.path.exists(f) and os.path.getmtime(f) >= cutoff]
+    return sorted(files), [os.path.join(path,d) for d in subdirs]
+
+
+# Search a directory tree for E-Prime files with a pool of threads, one
+# directory at a time, optionally only those modified in the past days. Yields
+# the files in each directory as soon as it's been listed, so they can be
+# handled while the search goes on.
+def scan_tree(in_dir, days=None, jobs=8, dir_cache=None):
+    cutoff = None if days is None else time.time() - days * 24 * 3600
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        running = {executor.submit(scan_dir,in_dir,dir_cache,cutoff)}
+        while running:
+            done, running = concurrent.futures.wait(running,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for d in subdirs:
+                    running.add(executor.submit(scan_dir,d,dir_cache,cutoff))
+                if files:
+                    yield files
+
+
+# Find E-Prime files in a directory tree, optionally only those modified in
+# the past days
+def find_eprime_files(in_dir, days=None, jobs=8, dir_cache=None):
+    for files in scan_tree(in_dir,days,jobs,dir_cache):
+        yield from files
+
+
+# Task, subject, session, run and expected scan label prefix from the
+# filename, or None if it can't be parsed
+#
+# wm1*
+# wm2*
+# oddball1*
+# oddball2*
+# spt1*
+def parse_filename(eprime_txt):
+    r = expr_filename.match(os.path.basename(eprime_txt))
+    if r is None:
+        return None
+    return dict(
+        task=r.group('task'),
+        subject=r.group('session'),
+        session=r.group('session'),
+        run=r.group('run'),
+        scan_prefix='%s%s' % (r.group('task').lower(),r.group('run')),
+        )
+
+
+# Find the usable scan where scan_prefix matches scans['scan_type']. Only
+# proceed if exactly one match is found. Returns the scan, or None and a
+# warning
+def match_scan(scans, scan_prefix):
+    match = [x for x in scans if x['scan_type'].startswith(scan_prefix) and x['quality']!='unusable']
+    if len(match) == 0:
+        return None, 'No matching scan'
+    if len(match) > 1:
+        return None, 'Multiple matching scans found'
+    return match[0], None
+
+
+# XNAT connections for a pool of threads. Each thread connects the first time
+# it calls XNAT and keeps the connection. The login found for the first
+# connection (from netrc or a prompt) is reused for the others.
+class XnatPool:
+
+    def __init__(self, host=None, user=None, pwd=None, retries=3, backoff=1.0):
+        self.host = host
+        self.user = user
+        self.pwd = pwd
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.interfaces = []
+
+    def get(self):
+        xnat = getattr(self.local,'xnat',None)
+        if xnat is None:
+            with self.lock:
+                xnat = dax.XnatUtils.get_interface(self.host,self.user,self.pwd)
+                self.host, self.user, self.pwd = xnat.host, xnat.user, xnat.pwd
+                self.interfaces.append(xnat)
+            self.local.xnat = xnat
+        return xnat
+
+    # Drop this thread's connection so the next call makes a new one
+    def discard(self):
+        xnat = getattr(self.local,'xnat',None)
+        if xnat is None:
+            return
+        self.local.xnat = None
+        with self.lock:
+            self.interfaces.remove(xnat)
+        try:
+            xnat.disconnect()
+        except Exception:
+            pass
+
+    # Call func with this thread's connection. Errors are retried after a wait
+    # that doubles each time (with some jitter so threads don't retry in step)
+    def call(self, func):
+        for attempt in range(self.retries + 1):
+            try:
+                return func(self.get())
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2**attempt * random.uniform(0.5,1.0)
+                print('   Retrying in %.1fs after %s: %s' % (wait,type(e).__name__,e))
+                self.discard()
+                time.sleep(wait)
+
+    def close(self):
+        for xnat in self.interfaces:
+            try:
+                xnat.disconnect()
+            except Exception:
+                pass
+        self.interfaces = []
+
+
+# Scans and their resources on XNAT, fetched at most once per session (or
+# once for a whole project) and kept for the run, so files from the same
+# session are matched without asking XNAT again. Resource labels are only
+# fetched for scans that a file matches. Only one thread at a time works on
+# a session, holding session_lock().
+class ScanIndex:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.sessions = dict()
+        self.resources = dict()
+        self.projects = set()
+        self.lock = threading.Lock()
+        self.locks = dict()
+
+    def session_lock(self, project, subject, session):
+        with self.lock:
+            return self.locks.setdefault((project,subject,session),threading.Lock())
+
+    # Scans in a session, as from dax get_scans
+    def scans(self, project, subject, session):
+        key = (project,subject,session)
+        if key not in self.sessions:
+            if project in self.projects:
+                return []
+            self.sessions[key] = self.pool.call(
+                lambda xnat: xnat.get_scans(project,subject,session))
+        return self.sessions[key]
+
+    # Labels of a scan's resources
+    def scan_resources(self, project, subject, session, scan_id):
+        key = (project,subject,session,scan_id)
+        if key not in self.resources:
+            self.resources[key] = {r['label'] for r in self.pool.call(
+                lambda xnat: xnat.get_scan_resources(project,subject,session,scan_id))}
+        return self.resources[key]
+
+    def add_resource(self, project, subject, session, scan_id, resource):
+        self.scan_resources(project,subject,session,scan_id).add(resource)
+
+    # Fetch scans and resource labels for every session in a project with
+    # one listing, rather than session by session
+    def load_project(self, project):
+        for scan in self.pool.call(lambda xnat: xnat.get_project_scans(project)):
+            key = (project,scan['subject_label'],scan['session_label'])
+            self.sessions.setdefault(key,[]).append(scan)
+            self.resources[key + (scan['scan_id'],)] = {r for r in scan['resources'] if r}
+        self.projects.add(project)
+
+
+# Upload one file to the EPRIME_TXT resource of its scan, matching it with
+# the scans in the index. XNAT calls go through pool.call, and every call can
+# be retried on its own. Returns the status ('uploaded'; 'exists' if the scan
+# already has the resource; 'invalid' if the filename can't be parsed;
+# 'skipped' otherwise), the scan ID, and a warning if not uploaded.
+def upload_file(pool, index, eprime_txt, project, overwrite=False):
+
+    info = parse_filename(eprime_txt)
+    if info is None:
+        return 'invalid', None, 'Could not parse filename'
+    subject, session = info['subject'], info['session']
+    with index.session_lock(project,subject,session):
+        return upload_to_scan(pool,index,eprime_txt,project,subject,session,
+            info['scan_prefix'],overwrite)
+
+
+def upload_to_scan(pool, index, eprime_txt, project, subject, session, scan_prefix,
+        overwrite=False):
+
+    # Find the scan in this session
+    scan, warning = match_scan(index.scans(project,subject,session),scan_prefix)
+    if scan is None:
+        return 'skipped', None, warning
+    scan_id = scan['scan_id']
+
+    # If scan has resource warn and skip upload unless overwrite
+    resources = index.scan_resources(project,subject,session,scan_id)
+    if RESOURCE in resources and not overwrite:
+        return 'exists', scan_id, '%s resource already exists on XNAT' % RESOURCE
+
+    def put(xnat):
+        rsrc = xnat.select_scan_resource(project,subject,session,scan_id,RESOURCE)
+        if RESOURCE not in resources:
+            rsrc.create()
+            index.add_resource(project,subject,session,scan_id,RESOURCE)
+        rsrc.put([eprime_txt],overwrite=True)
+    pool.call(put)
+
+    return 'uploaded', scan_id, ''
+
+
+# Upload the files for one session in turn, catching errors so one file
+# doesn't stop the rest. Files in replace are new versions of files uploaded
+# before, and overwrite the earlier upload
+def upload_session(pool, index, eprime_txts, project, overwrite=False, replace=()):
+    results = []
+    for eprime_txt in eprime_txts:
+        try:
+            status, scan_id, message = upload_file(pool, index, eprime_txt, project,
+                overwrite or eprime_txt in replace)
+        except Exception as e:
+            status, scan_id, message = 'failed', None, '%s: %s' % (type(e).__name__,e)
+        results.append(dict(eprime_txt=eprime_txt, status=status, scan=scan_id or '',
+            message=message))
+    return results
+
+
+# Store an upload result in the manifest, with the file details from
+# manifest.pending()
+def record_result(manifest, project, result, pending):
+    info = parse_filename(result['eprime_txt']) or dict()
+    manifest.record(result['eprime_txt'], project, pending['size'], pending['mtime'],
+        pending['sha256'], subject=info.get('subject'), session=info.get('session'),
+        scan=result['scan'] or None, status=result['status'],
+        message=result['message'] or None)
+
+
+# Group files by session so each session's scans are only fetched once
+def group_by_session(eprime_txts):
+    sessions = dict()
+    for eprime_txt in eprime_txts:
+        info = parse_filename(eprime_txt)
+        key = None if info is None else (info['subject'],info['session'])
+        sessions.setdefault(key,[]).append(eprime_txt)
+    return sessions
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Find E-Prime .txt files and upload them to XNAT')
+    parser.add_argument('--project', help='XNAT project', default='GenFac_HWZ')
+    parser.add_argument('--dir', help='Directory to search', required=True)
+    parser.add_argument('--days', type=float,
+        help='Only upload files modified in the past N days')
+    parser.add_argument('--overwrite', help='Force overwrite if existing', default='False')
+    parser.add_argument('--jobs', type=int, default=4,
+        help='Number of uploads to run at once, each with its own XNAT connection')
+    parser.add_argument('--scan_jobs', type=int, default=8,
+        help='Number of directories to list at once when searching')
+    parser.add_argument('--retries', type=int, default=3, help='Retries for failed XNAT calls')
+    parser.add_argument('--backoff', type=float, default=1.0,
+        help='Wait (sec) before the first retry. Doubles for each retry after')
+    parser.add_argument('--host', help='XNAT host (default $XNAT_HOST)')
+    parser.add_argument('--user', help='XNAT user (default from ~/.netrc)')
+    parser.add_argument('--report', help='CSV file to store the status of each file')
+    parser.add_argument('--manifest', default=upload_manifest.DEFAULT_MANIFEST,
+        help='Database of files already handled (default ~/.cache/gf-edat/uploads.sqlite)')
+    parser.add_argument('--no_manifest', action='store_true',
+        help='Check every file with XNAT, and do not record results')
+    parser.add_argument('--project_scans', action='store_true',
+        help='List the scans of the whole project at once instead of session by session. '
+        'Faster when uploading to many sessions')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print('Specified directory %s not found' % args.dir)
+        sys.exit(1)
+    overwrite = args.overwrite.lower()=='true'
+
+    # Info
+    print('Uploading from %s to %s' % (args.dir,args.project))
+
+    manifest = None
+    dir_cache = None
+    if not args.no_manifest:
+        manifest = upload_manifest.UploadManifest(args.manifest)
+        dir_cache = DirCache(manifest.load_dirs())
+
+    pool = XnatPool(args.host, args.user, retries=args.retries, backoff=args.backoff)
+    index = ScanIndex(pool)
+    pending = dict()
+    running = set()
+    results = []
+    unchanged = 0
+
+    def finish(futures):
+        for future in futures:
+            for r in future.result():
+                print('%-8s %s' % (r['status'],r['eprime_txt']))
+                results.append(r)
+                if manifest is not None:
+                    record_result(manifest,args.project,r,pending[r['eprime_txt']])
+
+    try:
+        if args.project_scans:
+            index.load_project(args.project)
+        with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+
+            # Start on each directory's files as soon as they're found,
+            # skipping those handled before that haven't changed since (unless
+            # overwriting)
+            for eprime_txts in scan_tree(args.dir,args.days,args.scan_jobs,dir_cache):
+                if manifest is not None:
+                    found = eprime_txts
+                    eprime_txts = []
+                    for eprime_txt in found:
+                        p = manifest.pending(eprime_txt,args.project,overwrite)
+                        if p is None:
+                            unchanged += 1
+                        else:
+                            pending[eprime_txt] = p
+                            eprime_txts.append(eprime_txt)
+                replace = {f for f in eprime_txts if pending.get(f,{}).get('replace')}
+                for session_txts in group_by_session(eprime_txts).values():
+                    running.add(executor.submit(upload_session, pool, index, session_txts,
+                        args.project, overwrite, replace))
+                done = {f for f in running if f.done()}
+                running -= done
+                finish(done)
+
+            finish(concurrent.futures.as_completed(running))
+
+        # Only keep directory listings from a complete search
+        if manifest is not None:
+            manifest.save_dirs(dir_cache.fresh)
+    finally:
+        pool.close()
+        if manifest is not None:
+            manifest.close()
+
+    if manifest is not None:
+        print('%d files unchanged since they were handled' % unchanged)
+
+    # Status report
+    results.sort(key=lambda r: r['eprime_txt'])
+    print()
+    for r in results:
+        print('%-8s %-8s %s%s' % (r['status'], r['scan'], r['eprime_txt'],
+            '  (%s)' % r['message'] if r['message'] else ''))
+    counts = dict()
+    for r in results:
+        counts[r['status']] = counts.get(r['status'],0) + 1
+    print('%d files: %s' % (len(results),
+        ', '.join('%d %s' % (n,status) for status,n in sorted(counts.items()))))
+
+    if args.report:
+        with open(args.report,'w',newline='') as f:
+            writer = csv.DictWriter(f,fieldnames=['eprime_txt','status','scan','message'])
+            writer.writeheader()
+            writer.writerows(results)
+
+    print('Done.')
+    if counts.get('failed'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
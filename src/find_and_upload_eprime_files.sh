@@ -5,10 +5,10 @@
 #    SPT-*.txt
 #    WM-*.txt
 #
-# For each file found, call the upload_single_gf_eprime_to_xnat.py python script
-# to upload it to the EPRIME_TXT resource of the correct subject, session, scan
-# on XNAT based on the filename. By default, upload will be skipped if the resource
-# already exists on XNAT.
+# and upload each one to the EPRIME_TXT resource of the correct subject, session,
+# scan on XNAT based on the filename. By default, upload will be skipped if the
+# resource already exists on XNAT. The work is done by find_and_upload_eprime_files.py,
+# which uploads several files at once over a few kept-open XNAT connections.
 #
 # This must be run in a python environment where DAX is installed:
 # https://dax.readthedocs.io/en/latest/installing_dax_in_a_virtual_environment.html
@@ -23,6 +23,9 @@
 # Optionally, to overwrite existing resources, use
 #        --overwrite True
 #
+# Optionally, to set the number of uploads run at once (default 4), use
+#        --jobs N
+#
 #
 # The --project option defaults to GenFac_HWZ if not specified. The --dir option 
 # is required.
@@ -31,7 +34,7 @@
 # it's run from. Easiest may be to run this script from the directory where both of 
 # these files exist:
 #    This one                 find_and_upload_eprime_files.sh
-#    Python upload script     upload_single_gf_eprime_to_xnat.py
+#    Python upload script     find_and_upload_eprime_files.py
 
 
 # Defaults
@@ -39,6 +42,7 @@ project=GenFac_HWZ
 overwrite=False
 dir=
 days=all
+jobs=
 
 # Parse inputs
 while [[ $# -gt 0 ]]
@@ -53,6 +57,8 @@ do
 			overwrite="$2"; shift; shift ;;
 		--days)
 			days="$2"; shift; shift ;;
+		--jobs)
+			jobs="$2"; shift; shift ;;
 		*)
 			echo "Ignoring unknown input ${1}"; shift ;;
 	esac
@@ -69,32 +75,24 @@ if [[ ! -d "${dir}" ]]; then
 fi
 
 # If we can't find the python script, fail
-upload_cmd=upload_single_gf_eprime_to_xnat.py
+upload_cmd=find_and_upload_eprime_files.py
 w=$(which "${upload_cmd}")
 if [[ -z "${w}" ]]; then
-	upload_cmd=./upload_single_gf_eprime_to_xnat.py
+	upload_cmd=./find_and_upload_eprime_files.py
 fi
 w=$(which "${upload_cmd}")
 if [[ -z "${w}" ]]; then
-	echo "Cannot find upload_single_gf_eprime_to_xnat.py"
+	echo "Cannot find find_and_upload_eprime_files.py"
 	exit 1
 fi
 
-# Info
-echo "Uploading from ${dir} to ${project}"
-
 # Create days option
 if [[ "${days}" == "all" ]]; then
 	daybit=""
 else
-	daybit="-mtime -$days"
+	daybit="--days $days"
 fi
 
-# Find all relevant .txt files in dir and upload each one
-# https://stackoverflow.com/a/8677566
-while IFS= read -r -d $'\0' file; do
-	echo Checking $file
-	"${upload_cmd}" --eprime_txt "${file}" --project "${project}" --overwrite "${overwrite}"
-done < <(find "${dir}" ${daybit} \( -name Oddball-*.txt -or -name SPT-*.txt -or -name WM-*.txt \) -print0)
-
-echo Done.
+# Find all relevant .txt files in dir and upload them in one process
+exec "${upload_cmd}" --dir "${dir}" --project "${project}" --overwrite "${overwrite}" \
+	${daybit} ${jobs:+--jobs "${jobs}"}
@@ -27,6 +27,20 @@ do
 			export eprime_txt="$2"; shift; shift ;;
 		--out_dir)
 			export out_dir="$2"; shift; shift ;;
+		--eprime_table)
+			export eprime_table="$2"; shift; shift ;;
+		--trials_table)
+			export trials_table="$2"; shift; shift ;;
+		--onsets)
+			export onsets="$2"; shift; shift ;;
+		--cache_dir)
+			export cache_dir="$2"; shift; shift ;;
+		--no_cache|--no-cache)
+			export no_cache=--no_cache; shift ;;
+		--lite)
+			export lite=--lite; shift ;;
+		--profile)
+			export profile="$2"; shift; shift ;;
 		--src_dir)
 			export src_dir="$2"; shift; shift ;;
 		*)
@@ -34,44 +48,18 @@ do
 	esac
 done
 
-# Verify the specified task is in the list we can handle
-case "${task}" in
-	Oddball|OddballOld|SPT|SPT-ESOP|WM)
-		;;
-	*)
-		echo Unknown task "${task}"
-		exit 1
-		;;
-esac
-
-# Convert E-Prime's .txt to a table format CSV file
-echo Converting to CSV: "${eprime_txt}"
-eprime_csv="${out_dir}"/eprime.csv
-case "${task}" in
-	Oddball|OddballOld|SPT|WM)
-        ${src_dir}/eprime_to_csv.py --outcsv "${eprime_csv}" "${eprime_txt}"
-		;;
-	*)
-        ${src_dir}/eprime_to_csv_unsorted.py --outcsv "${eprime_csv}" "${eprime_txt}"
-		;;
-esac
-
-# Parse for the specific task (Oddball, WM, SPT)
-echo Parsing: "${eprime_csv}"
-summary_csv="${out_dir}"/eprime_summary_${task}.csv
-"${src_dir}"/parse_csv_GF_${task}.py --outcsv "${summary_csv}" "${eprime_csv}"
-
-# Create PDF
-echo Creating PDF
-summary_pdf="${out_dir}"/eprime_summary.pdf
-"${src_dir}"/make_pdf.py  --incsv "${summary_csv}" --outpdf "${summary_pdf}" \
-	--project "${project}" --subject "${subject}" --session "${session}" --scan "${scan}" \
-	--task "${task}"
-
-# Organize files into dirs so we don't need to know the filenames for the yaml
-echo Organizing outputs
-mkdir -p "${out_dir}"/EPRIME_CSV
-mv "${eprime_csv}" "${out_dir}"/EPRIME_CSV
-mkdir -p "${out_dir}"/SUMMARY_CSV
-mv "${summary_csv}" "${out_dir}"/SUMMARY_CSV
-
+# Convert E-Prime's .txt to a table, parse for the specific task (Oddball, WM,
+# SPT, ... as defined in tasks.py), and create the PDF, all in one python
+# process. Exits with an error for an unknown task. Outputs are written
+# directly to the EPRIME_CSV and SUMMARY_CSV dirs so we don't need to know the
+# filenames for the yaml. --onsets takes a quoted list, e.g. --onsets "fsl bids".
+# With --lite, only the CSVs are made, using the
+# standard library only, which starts faster for small logs. Time, CPU and
+# peak memory of each stage go to metrics.json in the output dir; --profile
+# cprofile (or pyinstrument) also profiles each stage into PROFILE
+"${src_dir}"/gf_edat.py --eprime_txt "${eprime_txt}" --task "${task}" \
+	--out_dir "${out_dir:-/}" ${eprime_table:+--eprime_table "${eprime_table}"} \
+	${trials_table:+--trials_table "${trials_table}"} ${onsets:+--onsets ${onsets}} \
+	${cache_dir:+--cache_dir "${cache_dir}"} ${no_cache} ${lite} \
+	${profile:+--profile "${profile}"} \
+	--project "${project}" --subject "${subject}" --session "${session}" --scan "${scan}"
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+#
+# Convert, parse, and report on an E-Prime .txt log in a single process. This
+# is what gf-edat.sh runs. The converted E-Prime table goes straight to the
+# task parser and the summary straight to the report, so the CSVs are only
+# written as outputs, not used to pass data between steps.
+#
+# Can also be imported, e.g.
+#
+#    import gf_edat
+#    result = gf_edat.run('WM-123456-1-run1.txt', 'WM', '/OUTPUTS')
+#    result['summary'].to_frame()
+#
+# pandas, numpy and fpdf are only imported once a step needs them. With
+# --lite, the log is converted and summarized with the standard library only
+# (gf_edat_lite.py), and no PDF is made.
+#
+# Outputs in out_dir:
+#
+#    eprime_summary.pdf
+#    EPRIME_CSV/eprime.csv
+#    EPRIME_CSV/eprime.feather or .parquet (if eprime_table is given)
+#    SUMMARY_CSV/eprime_summary_<task>.csv
+#    SUMMARY_CSV/eprime_trials_<task>.feather or .parquet (if trials_table is given)
+#    ONSETS/...   FSL, SPM and/or BIDS onset files (if onsets are given, see
+#                 onset_files.py)
+#    metrics.json Time, CPU and peak memory of each stage of the run (see
+#                 run_metrics.py)
+#    PROFILE/...  Profile of each stage (with --profile)
+
+import argparse
+import os
+import sys
+
+import eprime_cache
+import eprime_to_csv
+import run_metrics
+from tasks import TASKS, missing_columns, task_columns
+
+
+# Convert E-Prime's .txt to a table
+def convert(eprime_txt, task):
+    return eprime_to_csv.read_eprime_txt(eprime_txt,sort=TASKS[task]['sort_frames'])
+
+
+# Parse for the specific task. Only the columns the task uses are given
+# dtypes as if read from the CSV. Any the log is missing are empty
+def summarize(parsed_frames, task):
+    import parse_csv_GF
+    missing_columns(task,parsed_frames.columns)
+    columns = task_columns(task)
+    edat = eprime_to_csv.infer_dtypes(parsed_frames.reindex(columns=columns))
+    return parse_csv_GF.summarize(edat,task)
+
+
+# Create the PDF report from the summary
+def report(stims, out_pdf, task, project='NO_PROJ', subject='NO_SUBJ',
+        session='NO_SESS', scan='NO_SCAN'):
+    import make_pdf
+    rows = make_pdf.summary_rows(stims)
+    title = make_pdf.report_title(task,project,subject,session,scan)
+    make_pdf.write_report(rows,out_pdf,title)
+    return make_pdf.report_text(rows,title)
+
+
+# Converted table and summary for a log, from the cache if the log has been
+# seen before. If the summary is cached, the table is only fetched (or made)
+# when with_table is set
+def cached_results(eprime_txt, task, cache, with_table=True, log=print, metrics=None):
+
+    if metrics is None:
+        metrics = run_metrics.RunMetrics()
+
+    with metrics.stage('cache_lookup'):
+        txt_hash = eprime_cache.file_hash(eprime_txt)
+        sort = TASKS[task]['sort_frames']
+        table_key = cache.key(txt_hash,'eprime',sort)
+        summary_key = cache.key(txt_hash,'summary',task,TASKS[task])
+        parsed_frames = None
+        stims = cache.get(summary_key)
+
+    if stims is None or with_table:
+        with metrics.stage('convert') as stage:
+            parsed_frames = cache.get(table_key)
+            stage.add(input_bytes=os.path.getsize(eprime_txt), cached=parsed_frames is not None)
+            if parsed_frames is None:
+                log('Converting: %s' % eprime_txt)
+                parsed_frames = convert(eprime_txt,task)
+                cache.put(table_key,parsed_frames)
+            else:
+                log('Cached conversion: %s' % eprime_txt)
+            stage.add(frames=len(parsed_frames.index))
+    if stims is None:
+        with metrics.stage('parse') as stage:
+            log('Parsing: %s' % task)
+            stims = summarize(parsed_frames,task)
+            cache.put(summary_key,stims)
+            stage.add(cached=False, trials=len(stims.onsets), conditions=len(stims))
+    else:
+        with metrics.stage('parse') as stage:
+            log('Cached summary: %s' % task)
+            stage.add(cached=True, trials=len(stims.onsets), conditions=len(stims))
+
+    return parsed_frames, stims
+
+
+# Total size of files written, for the metrics
+def output_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+# Run the whole chain for one log. The E-Prime table and summary are returned
+# and optionally written to CSV in out_dir. With a cache (eprime_cache.EprimeCache),
+# logs that were already converted and summarized are not done again. Each
+# stage is recorded in metrics (run_metrics.RunMetrics), which is returned too.
+def run(eprime_txt, task, out_dir, project='NO_PROJ', subject='NO_SUBJ',
+        session='NO_SESS', scan='NO_SCAN', eprime_csv=True, eprime_table=None,
+        summary_csv=True, trials_table=None, onsets=(), pdf=True, cache=None,
+        verbose=False, metrics=None):
+
+    if task not in TASKS:
+        raise ValueError('Unknown task %s' % task)
+
+    def log(msg):
+        if verbose:
+            print(msg)
+
+    if metrics is None:
+        metrics = run_metrics.RunMetrics(eprime_txt=eprime_txt, task=task)
+
+    if cache is None:
+        with metrics.stage('convert') as stage:
+            log('Converting: %s' % eprime_txt)
+            parsed_frames = convert(eprime_txt,task)
+            stage.add(input_bytes=os.path.getsize(eprime_txt), frames=len(parsed_frames.index))
+        with metrics.stage('parse') as stage:
+            log('Parsing: %s' % task)
+            stims = summarize(parsed_frames,task)
+            stage.add(trials=len(stims.onsets), conditions=len(stims))
+    else:
+        parsed_frames, stims = cached_results(eprime_txt, task, cache,
+            with_table=eprime_csv or eprime_table, log=log, metrics=metrics)
+
+    if eprime_csv or eprime_table:
+        with metrics.stage('write_eprime') as stage:
+            csv_dir = os.path.join(out_dir,'EPRIME_CSV')
+            os.makedirs(csv_dir,exist_ok=True)
+            paths = []
+            if eprime_csv:
+                paths.append(os.path.join(csv_dir,'eprime.csv'))
+                parsed_frames.to_csv(paths[-1])
+            if eprime_table:
+                paths.append(os.path.join(csv_dir,'eprime.%s' % eprime_table))
+                eprime_to_csv.write_eprime_table(parsed_frames,paths[-1])
+            stage.add(output_bytes=output_bytes(paths))
+
+    if summary_csv or trials_table:
+        with metrics.stage('write_summary') as stage:
+            csv_dir = os.path.join(out_dir,'SUMMARY_CSV')
+            os.makedirs(csv_dir,exist_ok=True)
+            paths = []
+            if summary_csv:
+                paths.append(os.path.join(csv_dir,'eprime_summary_%s.csv' % task))
+                stims.to_csv(paths[-1])
+            if trials_table:
+                paths.append(os.path.join(csv_dir,'eprime_trials_%s.%s' % (task,trials_table)))
+                stims.write_trials(paths[-1])
+            stage.add(output_bytes=output_bytes(paths))
+
+    if onsets:
+        with metrics.stage('write_onsets') as stage:
+            import onset_files
+            paths = onset_files.write_onset_files(stims,os.path.join(out_dir,'ONSETS'),
+                task,onsets)
+            stage.add(output_bytes=output_bytes(paths))
+
+    if pdf:
+        with metrics.stage('pdf') as stage:
+            log('Creating PDF')
+            os.makedirs(out_dir,exist_ok=True)
+            out_pdf = os.path.join(out_dir,'eprime_summary.pdf')
+            txt = report(stims, out_pdf, task,
+                project=project, subject=subject, session=session, scan=scan)
+            stage.add(output_bytes=output_bytes([out_pdf]))
+        log(txt)
+
+    return dict(eprime=parsed_frames, summary=stims, metrics=metrics)
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='E-Prime processing for GF tasks')
+    parser.add_argument('--project', default='NO_PROJ')
+    parser.add_argument('--subject', default='NO_SUBJ')
+    parser.add_argument('--session', default='NO_SESS')
+    parser.add_argument('--scan', default='NO_SCAN')
+    parser.add_argument('--task', help='One of %s' % ', '.join(TASKS), required=True)
+    parser.add_argument('--eprime_txt', help='E-Prime .txt log', required=True)
+    parser.add_argument('--out_dir', help='Directory to store outputs', default='.')
+    parser.add_argument('--no_eprime_csv', action='store_true',
+        help='Do not write the converted E-Prime CSV')
+    parser.add_argument('--eprime_table', choices=['feather','parquet'],
+        help='Also store the E-Prime table with dtypes in this format')
+    parser.add_argument('--no_summary_csv', action='store_true',
+        help='Do not write the summary CSV')
+    parser.add_argument('--trials_table', choices=['feather','parquet','csv'],
+        help='Also store a table with one row per trial in this format')
+    parser.add_argument('--onsets', nargs='+', choices=['fsl','spm','bids'], default=[],
+        help='Also write onset files for these packages in ONSETS')
+    parser.add_argument('--no_pdf', action='store_true', help='Do not create the PDF')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true',
+        help='Do not use or update the cache of converted logs, even if $GF_EDAT_CACHE is set')
+    parser.add_argument('--cache_dir', default=eprime_cache.DEFAULT_CACHE_DIR,
+        help='Cache converted logs here (default $GF_EDAT_CACHE; no cache if neither is given)')
+    parser.add_argument('--cache_max_mb', type=int, default=eprime_cache.DEFAULT_MAX_MB,
+        help='Cache size limit in MB')
+    parser.add_argument('--no_metrics', action='store_true',
+        help='Do not write metrics.json')
+    parser.add_argument('--profile', choices=run_metrics.PROFILERS,
+        help='Profile each stage into PROFILE in the output directory')
+    parser.add_argument('--lite', action='store_true',
+        help='Convert and summarize with the standard library only. Faster startup for '
+        'small logs; no PDF, typed table or cache')
+    args = parser.parse_args()
+    if args.lite and (args.eprime_table or args.trials_table or args.onsets):
+        parser.error('--lite does not write typed tables or onset files')
+
+    # Verify the specified task is in the list we can handle
+    if args.task not in TASKS:
+        print('Unknown task %s' % args.task)
+        sys.exit(1)
+
+    # Metrics are written even if the run fails part way
+    try:
+        metrics = run_metrics.RunMetrics(args.profile, os.path.join(args.out_dir,'PROFILE'),
+            eprime_txt=args.eprime_txt, task=args.task, project=args.project,
+            subject=args.subject, session=args.session, scan=args.scan, lite=args.lite)
+    except ImportError:
+        parser.error('--profile %s needs %s installed' % (args.profile,args.profile))
+    try:
+        if args.lite:
+            import gf_edat_lite
+            gf_edat_lite.run(args.eprime_txt, args.task, args.out_dir,
+                eprime_csv=not args.no_eprime_csv, summary_csv=not args.no_summary_csv,
+                verbose=True, metrics=metrics)
+            return
+
+        cache = None
+        if args.cache_dir and not args.no_cache:
+            cache = eprime_cache.EprimeCache(args.cache_dir,args.cache_max_mb)
+
+        run(args.eprime_txt, args.task, args.out_dir, project=args.project,
+            subject=args.subject, session=args.session, scan=args.scan,
+            eprime_csv=not args.no_eprime_csv, eprime_table=args.eprime_table,
+            summary_csv=not args.no_summary_csv, trials_table=args.trials_table,
+            onsets=args.onsets, pdf=not args.no_pdf, cache=cache, verbose=True,
+            metrics=metrics)
+
+        if cache is not None:
+            print(cache.report())
+    finally:
+        if not args.no_metrics:
+            metrics.write(os.path.join(args.out_dir,'metrics.json'))
+
+
+if __name__ == "__main__":
+    main()
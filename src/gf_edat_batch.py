@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+#
+# Batch version of gf-edat.sh. Find E-Prime .txt logs in a directory tree, or
+# take them from a manifest, and convert, parse and report on each one in a
+# pool of worker processes. Outputs for each log go in their own directory
+# under --out_dir, laid out the same as a single gf-edat.sh run:
+#
+#    <out_dir>/<log name>/eprime_summary.pdf
+#    <out_dir>/<log name>/EPRIME_CSV/eprime.csv
+#    <out_dir>/<log name>/SUMMARY_CSV/eprime_summary_<task>.csv
+#    <out_dir>/<log name>/SUMMARY_CSV/eprime_trials_<task>.<fmt> (with --trials_table)
+#    <out_dir>/<log name>/ONSETS/... (with --onsets)
+#    <out_dir>/<log name>/metrics.json
+#
+# A failure on one log doesn't stop the others. The status of every log is
+# written to <out_dir>/batch_status.csv and failures are listed at the end.
+# With --report_pdf, the reports of all the logs that went through are also
+# put together in one PDF, with an index page linking to each.
+#
+# The manifest is a CSV with an eprime_txt column, and optionally task,
+# project, subject, session, scan columns. When searching a directory, the
+# task comes from the filename (Oddball-*.txt, SPT-*.txt, WM-*.txt, ...) and
+# the subject/session from the filename the same way as
+# upload_single_gf_eprime_to_xnat.py. Use --task to force a task for all logs,
+# e.g. OddballOld for older Oddball data.
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import re
+import sys
+import traceback
+
+import eprime_cache
+import run_metrics
+from gf_edat import TASKS, run
+
+
+# Longest task names first so e.g. SPT-ESOP-* isn't taken for SPT
+expr_task = re.compile(
+    '^(?P<task>%s)-' % '|'.join(sorted(TASKS,key=len,reverse=True)))
+expr_filename = re.compile(r'^(?P<task>.*?)-(?P<session>.*?)-(?P<run>\d)\S*\.txt$')
+
+
+# Fill in task and XNAT info for a log from its filename where not given
+def describe_log(eprime_txt, task=None, project=None, subject=None, session=None, scan=None):
+    fname = os.path.basename(eprime_txt)
+    if not task:
+        r = expr_task.match(fname)
+        task = r.group('task') if r else None
+    r = expr_filename.match(fname)
+    if r:
+        subject = subject or r.group('session')
+        session = session or r.group('session')
+    return dict(
+        eprime_txt=eprime_txt,
+        task=task,
+        project=project or 'NO_PROJ',
+        subject=subject or 'NO_SUBJ',
+        session=session or 'NO_SESS',
+        scan=scan or 'NO_SCAN',
+        )
+
+
+# Find the task logs in a directory tree
+def find_logs(in_dir, task=None):
+    logs = []
+    for root,dirs,files in os.walk(in_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            if not fname.endswith('.txt'):
+                continue
+            if task is None and not expr_task.match(fname):
+                continue
+            logs.append(describe_log(os.path.join(root,fname),task))
+    return logs
+
+
+# Read logs from a manifest CSV
+def read_manifest(manifest, task=None):
+    logs = []
+    with open(manifest,newline='') as f:
+        for row in csv.DictReader(f):
+            row = {k: v.strip() for k,v in row.items() if k and v and v.strip()}
+            eprime_txt = row.pop('eprime_txt')
+            if task:
+                row['task'] = task
+            logs.append(describe_log(eprime_txt,**row))
+    return logs
+
+
+# Output directory for each log, named after the log file. Logs with the same
+# name in different places get a numbered suffix
+def assign_out_dirs(logs, out_dir):
+    used = set()
+    for log in logs:
+        name = os.path.splitext(os.path.basename(log['eprime_txt']))[0]
+        label, n = name, 1
+        while label in used:
+            n += 1
+            label = '%s_%d' % (name,n)
+        used.add(label)
+        log['out_dir'] = os.path.join(out_dir,label)
+
+
+# Convert, parse, and report on a single log. Runs in a worker process
+def process_log(log, out_dir, eprime_table=None, cache=None, trials_table=None, onsets=()):
+    metrics = run_metrics.RunMetrics(**log)
+    try:
+        run(log['eprime_txt'], log['task'], out_dir, project=log['project'],
+            subject=log['subject'], session=log['session'], scan=log['scan'],
+            eprime_table=eprime_table, trials_table=trials_table, onsets=onsets, cache=cache,
+            metrics=metrics)
+    finally:
+        metrics.write(os.path.join(out_dir,'metrics.json'))
+
+
+# Catch everything so one bad log doesn't take down the batch. Returns status,
+# error, traceback, and cache hits and misses
+def run_log(log, out_dir, eprime_table=None, cache_dir=None, cache_max_mb=None,
+        trials_table=None, onsets=()):
+    cache = None
+    if cache_dir:
+        cache = eprime_cache.EprimeCache(cache_dir,cache_max_mb)
+    try:
+        process_log(log,out_dir,eprime_table,cache,trials_table,onsets)
+        result = ['OK', '', '']
+    except Exception as e:
+        result = ['FAILED', '%s: %s' % (type(e).__name__,e), traceback.format_exc()]
+    if cache is None:
+        return result + [0, 0]
+    return result + [cache.hits, cache.misses]
+
+
+# One PDF with the reports of the logs, from their summary CSVs
+def combined_report(logs, out_pdf):
+    import make_pdf
+    reports = []
+    for log in logs:
+        rows = make_pdf.csv_rows(os.path.join(log['out_dir'],'SUMMARY_CSV',
+            'eprime_summary_%s.csv' % log['task']))
+        title = make_pdf.report_title(log['task'],log['project'],log['subject'],
+            log['session'],log['scan'])
+        reports.append((title, rows, (os.path.basename(log['out_dir']), log['task'],
+            log['subject'], log['session'], log['scan'])))
+    make_pdf.write_combined_report(reports,out_pdf,('Log','Task','Subject','Session','Scan'))
+    print('Wrote %s' % out_pdf)
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Batch process E-Prime logs for GF tasks')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--in_dir', help='Directory tree to search for E-Prime .txt logs')
+    inputs.add_argument('--manifest', help='CSV listing logs in an eprime_txt column')
+    parser.add_argument('--out_dir', help='Directory to store outputs', required=True)
+    parser.add_argument('--task', choices=list(TASKS), help='Task to use for all logs')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+        help='Number of worker processes')
+    parser.add_argument('--eprime_table', choices=['feather','parquet'],
+        help='Also store each E-Prime table with dtypes in this format')
+    parser.add_argument('--trials_table', choices=['feather','parquet','csv'],
+        help='Also store a table with one row per trial for each log in this format')
+    parser.add_argument('--onsets', nargs='+', choices=['fsl','spm','bids'], default=[],
+        help='Also write onset files for these packages for each log')
+    parser.add_argument('--report_pdf',
+        help='Also write one PDF with the reports of all logs processed')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true',
+        help='Do not use or update the cache of converted logs, even if $GF_EDAT_CACHE is set')
+    parser.add_argument('--cache_dir', default=eprime_cache.DEFAULT_CACHE_DIR,
+        help='Cache converted logs here (default $GF_EDAT_CACHE; no cache if neither is given)')
+    parser.add_argument('--cache_max_mb', type=int, default=eprime_cache.DEFAULT_MAX_MB,
+        help='Cache size limit in MB')
+    args = parser.parse_args()
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    if args.in_dir:
+        logs = find_logs(args.in_dir,args.task)
+    else:
+        logs = read_manifest(args.manifest,args.task)
+    assign_out_dirs(logs,args.out_dir)
+    print('Processing %d logs' % len(logs))
+
+    # Send each log through the pipeline and collect status as they finish
+    results = dict()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(run_log, log, log['out_dir'], args.eprime_table,
+                cache_dir, args.cache_max_mb, args.trials_table, args.onsets): i
+            for i,log in enumerate(logs)
+            }
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker process died
+                result = ['FAILED', '%s: %s' % (type(e).__name__,e), '', 0, 0]
+            results[i] = result
+            print('%s %s' % (result[0],logs[i]['eprime_txt']))
+
+    # Status of every log
+    os.makedirs(args.out_dir,exist_ok=True)
+    with open(os.path.join(args.out_dir,'batch_status.csv'),'w',newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['eprime_txt','task','out_dir','status','error'])
+        for i,log in enumerate(logs):
+            writer.writerow([log['eprime_txt'], log['task'], log['out_dir'],
+                results[i][0], results[i][1]])
+
+    failed = [i for i in results if results[i][0] != 'OK']
+    if args.report_pdf:
+        combined_report([log for i,log in enumerate(logs) if i not in failed],args.report_pdf)
+    for i in sorted(failed):
+        print('\nFAILED %s\n%s' % (logs[i]['eprime_txt'],results[i][2] or results[i][1]))
+    if cache_dir:
+        print('Cache: %d hits, %d misses (%s)' % (
+            sum(r[3] for r in results.values()), sum(r[4] for r in results.values()), cache_dir))
+    print('Done: %d OK, %d failed' % (len(logs) - len(failed),len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
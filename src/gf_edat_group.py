@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+#
+# Group-level summary of many gf-edat runs for QC. Finds the summary CSVs
+# (SUMMARY_CSV/eprime_summary_<task>.csv) in a tree of outputs, e.g. the
+# --out_dir of gf_edat_batch.py, reads them in a pool of worker processes,
+# and writes two tables:
+#
+#    --out_conditions   One row per scan and condition: the scan's output
+#                       directory, task, subject, session, condition, number
+#                       of trials, and its accuracy and correct-trial RT stats
+#    --out_stats        One row per task and condition: the number of scans,
+#                       and the mean, median and percentiles over scans of
+#                       PctAccuracy and MeanCorrectRTms
+#
+# Tables are written as CSV, or as .feather or .parquet by extension. The
+# subject and session come from the name of each scan's output directory
+# (the log name, for gf_edat_batch.py outputs) the same way as for logs.
+#
+# Only the scalar columns of the summary CSVs are parsed. The list-valued
+# columns aren't evaluated, just their items counted for the number of trials.
+#
+#    gf_edat_group.py --in_dir /OUTPUTS --out_conditions conditions.parquet \
+#        --out_stats stats.parquet
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import re
+import sys
+
+from eprime_to_csv import table_format
+from gf_edat_batch import describe_log
+
+
+expr_summary = re.compile(r'^eprime_summary_(?P<task>.+)\.csv$')
+
+# Per-scan values for each condition, from the summary CSV
+STATS = ('PctAccuracy','MeanCorrectRTms','MedianCorrectRTms','MinCorrectRTms',
+    'MaxCorrectRTms')
+
+# Values summarized over scans
+GROUP_STATS = ('PctAccuracy','MeanCorrectRTms')
+
+CONDITION_COLUMNS = ('scan_dir','task','subject','session','Condition','NTrials') + STATS
+
+
+# Find the summary CSVs in a directory tree. Returns (path, task, scan
+# directory relative to in_dir, scan name)
+def find_summaries(in_dir):
+    summaries = []
+    for root,dirs,files in os.walk(in_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            r = expr_summary.match(fname)
+            if not r:
+                continue
+            scan_dir = root
+            if os.path.basename(scan_dir) == 'SUMMARY_CSV':
+                scan_dir = os.path.dirname(scan_dir)
+            summaries.append((os.path.join(root,fname), r.group('task'),
+                os.path.relpath(scan_dir,in_dir), os.path.basename(os.path.abspath(scan_dir))))
+    return summaries
+
+
+# A stats cell as a number. Empty cells are NaN, and so are cells that
+# weren't computed for the condition, ()
+def stat_value(cell):
+    if cell in ('','()'):
+        return float('nan')
+    return float(cell)
+
+
+# Items in a list-valued cell
+def count_items(cell):
+    if cell in ('','()','[]'):
+        return 0
+    return cell.count(',') + 1
+
+
+# Condition rows of one summary CSV. Returns the rows and an error message,
+# or None if it was read
+def read_summary(path, task, scan_dir, name):
+    log = describe_log(name + '.txt',task=task)
+    rows = []
+    try:
+        with open(path,newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            col = {c: header.index(c) for c in ('Condition','OnsetsSec') + STATS}
+            for cells in reader:
+                row = [scan_dir, task, log['subject'], log['session'],
+                    cells[col['Condition']], count_items(cells[col['OnsetsSec']])]
+                rows.append(row + [stat_value(cells[col[s]]) for s in STATS])
+    except Exception as e:
+        return [], '%s: %s' % (type(e).__name__,e)
+    return rows, None
+
+
+# Read a batch of summary CSVs. Runs in a worker process
+def read_summaries(summaries):
+    return [read_summary(*s) for s in summaries]
+
+
+# Group stats over scans for each task and condition
+def group_stats(conditions, percentiles=(5,25,75,95)):
+    grouped = conditions.groupby(['task','Condition'],sort=True)
+    stats = grouped.size().rename('NScans').to_frame()
+    for s in GROUP_STATS:
+        g = grouped[s]
+        stats[s + '_n'] = g.count()
+        stats[s + '_mean'] = g.mean()
+        stats[s + '_median'] = g.median()
+        for p in percentiles:
+            stats['%s_p%g' % (s,p)] = g.quantile(p / 100)
+    return stats.reset_index()
+
+
+# Write a table as CSV, feather or parquet by extension
+def write_table(table, path):
+    fmt = table_format(path)
+    if fmt == 'csv':
+        table.to_csv(path,index=False)
+    elif fmt == 'feather':
+        table.to_feather(path)
+    else:
+        table.to_parquet(path,index=False)
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Group-level summary of GF task summary CSVs')
+    parser.add_argument('--in_dir', help='Directory tree to search for summary CSVs',
+        required=True)
+    parser.add_argument('--out_conditions',
+        help='Table of every scan and condition (.csv, .feather or .parquet)')
+    parser.add_argument('--out_stats', required=True,
+        help='Table of group stats by task and condition (.csv, .feather or .parquet)')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[5,25,75,95],
+        help='Percentiles to compute over scans')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+        help='Number of worker processes')
+    parser.add_argument('--batch_size', type=int, default=200,
+        help='Summary CSVs read by a worker at a time')
+    args = parser.parse_args()
+
+    summaries = find_summaries(args.in_dir)
+    print('Reading %d summary CSVs' % len(summaries))
+
+    # Read in batches, so thousands of small files don't mean thousands of
+    # round trips to the workers
+    batches = [summaries[i:i+args.batch_size]
+        for i in range(0,len(summaries),args.batch_size)]
+    rows = []
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for batch,results in zip(batches,pool.map(read_summaries,batches)):
+            for summary,(r,error) in zip(batch,results):
+                rows += r
+                if error:
+                    failed.append((summary[0],error))
+
+    import pandas
+    conditions = pandas.DataFrame(rows,columns=CONDITION_COLUMNS)
+    stats = group_stats(conditions,args.percentiles)
+    if args.out_conditions:
+        write_table(conditions,args.out_conditions)
+    write_table(stats,args.out_stats)
+
+    for path,error in failed:
+        print('FAILED %s: %s' % (path,error))
+    print('Done: %d scans, %d conditions, %d failed' % (
+        len(summaries) - len(failed), len(conditions.index), len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
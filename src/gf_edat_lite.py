@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+#
+# Convert and summarize an E-Prime .txt log with the standard library only,
+# for short single-log jobs where importing pandas, numpy and fpdf would take
+# longer than the work itself. Writes the same EPRIME_CSV/eprime.csv and
+# SUMMARY_CSV/eprime_summary_<task>.csv as gf_edat.py, but no PDF, no typed
+# table and no cache. gf_edat.py --lite runs this.
+#
+# The summary follows parse_csv_GF.summarize and
+# condition_summary.summarize_conditions value for value: column types are
+# inferred as pandas.read_csv would, and rounding is done the way numpy does
+# it, so the outputs are byte for byte the same.
+#
+#    gf_edat_lite.py --eprime_txt WM-123456-1-run1.txt --task WM --out_dir /OUTPUTS
+
+import argparse
+import csv
+import math
+import os
+import re
+import sys
+
+from eprime_to_csv import BOOL_VALUES, NA_VALUES, level_order, read_blocks, tokenize
+import run_metrics
+from tasks import TASKS, missing_columns, task_columns
+
+
+NAN = float('nan')
+
+# Summary columns, in output order, after the grouping columns and Condition
+# (as condition_summary.SUMMARY_COLUMNS)
+SUMMARY_COLUMNS = [
+    'OnsetsSec',
+    'DurationsSec',
+    'Accuracy',
+    'PctAccuracy',
+    'RTms',
+    'MeanCorrectRTms',
+    'MedianCorrectRTms',
+    'MinCorrectRTms',
+    'MaxCorrectRTms',
+    ]
+
+expr_int = re.compile(r'[+-]?[0-9]+')
+
+
+def isnan(v):
+    return isinstance(v,float) and v != v
+
+
+# numpy.round: scale, round half to even, and scale back
+def np_round(v, decimals=0):
+    if isnan(v):
+        return v
+    scale = 10.0 ** decimals
+    r = float(round(v * scale))
+    if r == 0:
+        r = math.copysign(0.0,v)
+    return r / scale
+
+
+# A column of text values with the type pandas.read_csv would give it:
+# ints, floats (NaN for missing), bools, or text (NaN for missing). Returns
+# the values and whether they're ints
+def infer_column(values):
+    values = [None if v is None or v in NA_VALUES else v for v in values]
+    try:
+        numbers = []
+        for v in values:
+            if v is None:
+                numbers.append(None)
+            elif '_' in v or v != v.strip():
+                raise ValueError(v)
+            elif expr_int.fullmatch(v):
+                numbers.append(int(v))
+            else:
+                numbers.append(float(v))
+    except ValueError:
+        present = [v for v in values if v is not None]
+        if present and None not in values and all(v in BOOL_VALUES for v in present):
+            return [BOOL_VALUES[v] for v in values], False
+        return [NAN if v is None else v for v in values], False
+    if None in numbers or any(isinstance(v,float) for v in numbers):
+        return [NAN if v is None else float(v) for v in numbers], False
+    return numbers, True
+
+
+# Read the log into columns of text, one row per frame plus one for the
+# header, sorted by level if the task sorts frames
+def read_columns(eprime_txt, sort=True):
+    columns, nrows = tokenize(read_blocks(eprime_txt))
+    if sort:
+        columns = sort_by_level(columns,nrows)
+    return columns, nrows
+
+
+# Columns with the rows sorted by level, in the order pandas sorts them
+def sort_by_level(columns, nrows):
+    order = level_order(columns.get('Level',[None] * nrows))
+    return {field: [col[i] for i in order] for field,col in columns.items()}
+
+
+# Write the columns of text as gf_edat.py writes the converted table
+def write_eprime_csv(columns, nrows, out_csv):
+    with open(out_csv,'w',newline='') as f:
+        write_eprime_rows(columns,nrows,f)
+
+
+def write_eprime_rows(columns, nrows, f):
+    writer = csv.writer(f,lineterminator='\n')
+    writer.writerow([''] + list(columns))
+    cols = list(columns.values())
+    for i in range(nrows):
+        writer.writerow(['0'] + [col[i] for col in cols])
+
+
+# A column of the trials. Names containing {Condition} pick a different
+# column for each condition, as condition_summary.condition_column. Returns
+# the values and whether they're ints
+def condition_column(info, is_int, name):
+    if '{Condition}' not in name:
+        return info[name], is_int[name]
+    col = [NAN] * len(info['Condition'])
+    conditions = list(dict.fromkeys(info['Condition']))
+    for condition in conditions:
+        vals = info[name.format(Condition=condition)]
+        for i,c in enumerate(info['Condition']):
+            if c == condition:
+                col[i] = vals[i]
+    if len(conditions) > 1:
+        return [float(v) for v in col], False
+    return col, is_int[name.format(Condition=conditions[0])]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else NAN
+
+
+def median(values):
+    if not values:
+        return NAN
+    values = sorted(values)
+    n = len(values)
+    if n % 2:
+        return values[n//2]
+    return (values[n//2-1] + values[n//2]) / 2
+
+
+# Summary rows for the trials in info (dict of columns), as
+# condition_summary.summarize_conditions. Returns the column names and rows
+def summarize_conditions(info, is_int, ntrials, start_time, groups, onset, rt, acc,
+        duration, condition=None, rt_only=None, acc_only=None, sort=False, pct_decimals=1):
+
+    groups = list(groups)
+    names = ['Condition'] if condition is not None else []
+    header = groups + names + SUMMARY_COLUMNS
+    if ntrials == 0:
+        return header, []
+
+    # Trials of each condition, in order of appearance or sorted
+    trials = dict()
+    for i in range(ntrials):
+        trials.setdefault(tuple(info[g][i] for g in groups),[]).append(i)
+    keys = sorted(trials) if sort else list(trials)
+
+    onsets = [np_round((v - start_time) / 1000,1) for v in condition_column(info,is_int,onset)[0]]
+    if isinstance(duration,str):
+        durations = [np_round(v / 1000,1) for v in info[duration]]
+    rts, rt_int = condition_column(info,is_int,rt)
+    accs = condition_column(info,is_int,acc)[0]
+
+    rows = []
+    for key in keys:
+        t = trials[key]
+        row = dict(zip(groups,key))
+        if condition is not None:
+            row['Condition'] = '_'.join(row[c] for c in condition)
+        row.update({c: () for c in SUMMARY_COLUMNS})
+        row['OnsetsSec'] = [onsets[i] for i in t]
+        if isinstance(duration,str):
+            row['DurationsSec'] = [durations[i] for i in t]
+        else:
+            row['DurationsSec'] = [duration for i in t]
+        if acc_only is None or row[acc_only[0]] == acc_only[1]:
+            pct = mean([accs[i] for i in t if not isnan(accs[i])]) * 100
+            if pct_decimals is not None:
+                pct = np_round(pct,pct_decimals)
+            row['Accuracy'] = [0 if isnan(accs[i]) else int(accs[i]) for i in t]
+            row['PctAccuracy'] = pct
+        if rt_only is None or row[rt_only[0]] == rt_only[1]:
+            correct = [rts[i] for i in t if accs[i] == 1 and not isnan(rts[i])]
+            row['RTms'] = [rts[i] if rt_int else np_round(rts[i]) for i in t]
+            row['MeanCorrectRTms'] = np_round(mean(correct))
+            row['MedianCorrectRTms'] = np_round(median(correct))
+            row['MinCorrectRTms'] = np_round(float(min(correct))) if correct else NAN
+            row['MaxCorrectRTms'] = np_round(float(max(correct))) if correct else NAN
+        rows.append([row[c] for c in header])
+
+    return header, rows
+
+
+# Per-condition summary of a log's columns of text, as parse_csv_GF.summarize
+# Trial rows of the task's rows column (typed, from infer_column): those with
+# one of the values, or with any value if none are given
+def trial_rows(col, rows):
+    if rows.get('values') is None:
+        return [i for i,v in enumerate(col) if not isnan(v)]
+    return [i for i,v in enumerate(col) if v in rows['values']]
+
+
+def summarize(columns, task):
+
+    spec = TASKS[task]
+    edat = dict()
+    is_int = dict()
+    empty = [None] * len(columns['Level'])
+    missing_columns(task,columns)
+    for c in task_columns(task):
+        edat[c], is_int[c] = infer_column(columns.get(c,empty))
+
+    # Start time from the trigger item
+    start_time = min(v for v in edat[spec['start']] if not isnan(v))
+
+    keep = trial_rows(edat[spec['rows']['column']],spec['rows'])
+    info = {c: [vals[i] for i in keep] for c,vals in edat.items()}
+
+    # Derived columns, e.g. condition names
+    for d in spec.get('derive',()):
+        col = [d['default']] * len(keep)
+        for value,label in d['values'].items():
+            for i,v in enumerate(info[d['column']]):
+                if v == value:
+                    col[i] = label
+        info[d['name']] = col
+        is_int[d['name']] = False
+
+    drop = spec.get('drop')
+    if drop is not None:
+        keep = [i for i,v in enumerate(info[drop['column']]) if v not in drop['values']]
+        info = {c: [vals[i] for i in keep] for c,vals in info.items()}
+
+    options = {k: spec[k] for k in ('groups','condition','onset','rt','acc','duration',
+        'rt_only','acc_only','sort','pct_decimals') if k in spec}
+    return summarize_conditions(info,is_int,len(keep),start_time,**options)
+
+
+# Write summary rows as pandas' to_csv would: lists as their repr, and NaN
+# outside lists as empty cells
+def write_summary_csv(header, rows, out_csv):
+    with open(out_csv,'w',newline='') as f:
+        writer = csv.writer(f,lineterminator='\n')
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(['' if isnan(v) else v for v in row])
+
+
+# Convert and summarize one log into out_dir. Returns the summary header and
+# rows. Stages are recorded in metrics (run_metrics.RunMetrics) if given
+def run(eprime_txt, task, out_dir, eprime_csv=True, summary_csv=True, verbose=False,
+        metrics=None):
+
+    if task not in TASKS:
+        raise ValueError('Unknown task %s' % task)
+    if metrics is None:
+        metrics = run_metrics.RunMetrics(eprime_txt=eprime_txt, task=task)
+
+    with metrics.stage('convert') as stage:
+        if verbose:
+            print('Converting: %s' % eprime_txt)
+        columns, nrows = read_columns(eprime_txt,TASKS[task]['sort_frames'])
+        stage.add(input_bytes=os.path.getsize(eprime_txt), frames=nrows)
+    if eprime_csv:
+        with metrics.stage('write_eprime') as stage:
+            csv_dir = os.path.join(out_dir,'EPRIME_CSV')
+            os.makedirs(csv_dir,exist_ok=True)
+            out_csv = os.path.join(csv_dir,'eprime.csv')
+            write_eprime_csv(columns,nrows,out_csv)
+            stage.add(output_bytes=os.path.getsize(out_csv))
+
+    with metrics.stage('parse') as stage:
+        if verbose:
+            print('Parsing: %s' % task)
+        header, rows = summarize(columns,task)
+        trials = header.index('OnsetsSec')
+        stage.add(trials=sum(len(row[trials]) for row in rows), conditions=len(rows))
+    if summary_csv:
+        with metrics.stage('write_summary') as stage:
+            csv_dir = os.path.join(out_dir,'SUMMARY_CSV')
+            os.makedirs(csv_dir,exist_ok=True)
+            out_csv = os.path.join(csv_dir,'eprime_summary_%s.csv' % task)
+            write_summary_csv(header,rows,out_csv)
+            stage.add(output_bytes=os.path.getsize(out_csv))
+
+    return header, rows
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        description='E-Prime conversion and summary for GF tasks, standard library only')
+    parser.add_argument('--task', help='One of %s' % ', '.join(TASKS), required=True)
+    parser.add_argument('--eprime_txt', help='E-Prime .txt log', required=True)
+    parser.add_argument('--out_dir', help='Directory to store outputs', default='.')
+    parser.add_argument('--no_eprime_csv', action='store_true',
+        help='Do not write the converted E-Prime CSV')
+    args = parser.parse_args()
+
+    if args.task not in TASKS:
+        print('Unknown task %s' % args.task)
+        sys.exit(1)
+
+    run(args.eprime_txt, args.task, args.out_dir, eprime_csv=not args.no_eprime_csv,
+        verbose=True)
+
+
+if __name__ == "__main__":
+    main()
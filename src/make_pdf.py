@@ -1,47 +1,311 @@
 #!/usr/bin/env python3
 #
-# Rough and ready report PDF from summary csv
+# Report PDF from a task summary. The report has a table of accuracy and
+# correct-trial RT stats by condition, then the onsets, durations, accuracy
+# and RTs of every condition's trials. It's laid out directly from the
+# summary, either a condition_summary.ConditionSummary in memory or the
+# cells of a summary CSV as text, without going through pandas.
+#
+# One scan:
+#
+#    make_pdf.py --incsv eprime_summary_WM.csv --outpdf eprime_summary.pdf --task WM
+#
+# Many scans, from the summary CSVs in a tree of outputs (as gf_edat_group.py
+# finds them): one combined PDF with an index page linking to each scan's
+# report, and/or a PDF for each scan made in a pool of worker processes:
+#
+#    make_pdf.py --in_dir /OUTPUTS --combined_pdf all_scans.pdf
+#    make_pdf.py --in_dir /OUTPUTS --out_dir /REPORTS --jobs 8
+#
+# fpdf is imported where it's used, to keep startup short for callers that
+# never make a PDF.
 
-import datetime
-import io
-import pandas
 import argparse
-from fpdf import FPDF
-
-# Parse arguments
-parser = argparse.ArgumentParser(description='Report PDF from summary csv')
-parser.add_argument('--incsv',help='Input CSV file',required=True)
-parser.add_argument('--outpdf',help='Output PDF file',required=True)
-parser.add_argument('--project',default='NO_PROJ')
-parser.add_argument('--subject',default='NO_SUBJ')
-parser.add_argument('--session',default='NO_SESS')
-parser.add_argument('--scan',default='NO_SCAN')
-parser.add_argument('--task',default='NO_TASK')
-args = parser.parse_args()
-
-# Load CSV and get pandas' display summaries of it into a string
-csv=pandas.read_csv(args.incsv)
-pandas.set_option('display.max_colwidth',80)
-f = io.StringIO()
-print('%s: %s %s %s %s\n' % (args.task,args.project,args.subject,args.session,args.scan),file=f)
-print(datetime.datetime.now(),file=f)
-print('\n\n',file=f)
-print(csv.loc[:,('Condition','PctAccuracy','MeanCorrectRTms','MedianCorrectRTms','MinCorrectRTms','MaxCorrectRTms')],file=f)
-print('\n',file=f)
-print(csv.loc[:,('Condition','OnsetsSec')],file=f)
-print('\n',file=f)
-print(csv.loc[:,('Condition','DurationsSec')],file=f)
-print('\n',file=f)
-print(csv.loc[:,('Condition','Accuracy')],file=f)
-print('\n',file=f)
-print(csv.loc[:,('Condition','RTms')],file=f)
-    
-print(f.getvalue())
-
-
-pdf = FPDF()
-pdf.add_page()
-pdf.set_font('Courier', size = 7)
-pdf.multi_cell(193, 3, txt = f.getvalue())
-pdf.output(args.outpdf)
+import concurrent.futures
+import csv
+import datetime
+import os
+import sys
+
+
+# Stats reported by condition, and per-trial values
+STATS = ('PctAccuracy','MeanCorrectRTms','MedianCorrectRTms','MinCorrectRTms',
+    'MaxCorrectRTms')
+TRIALS = ('OnsetsSec','DurationsSec','Accuracy','RTms')
+
+FONT = 'Courier'
+LINE = 3
+
+
+def report_title(task='NO_TASK', project='NO_PROJ', subject='NO_SUBJ', session='NO_SESS',
+        scan='NO_SCAN'):
+    return '%s: %s %s %s %s' % (task,project,subject,session,scan)
+
+
+# Report rows from a ConditionSummary: one dict per condition with its name,
+# number of trials, stats as numbers, and per-trial values as text. Values
+# that aren't computed for a condition are None
+def summary_rows(summary):
+    rows = []
+    for i in range(len(summary)):
+        row = dict.fromkeys(STATS + TRIALS)
+        row['Condition'] = str(summary.conditions['Condition'].iloc[i])
+        row['NTrials'] = int(summary.offsets[i+1] - summary.offsets[i])
+        row['OnsetsSec'] = list_text(summary.trials(summary.onsets,i))
+        row['DurationsSec'] = list_text(summary.trials(summary.durations,i))
+        if summary.with_acc[i]:
+            row['Accuracy'] = list_text(summary.trials(summary.accs,i))
+            row['PctAccuracy'] = float(summary.pct[i])
+        if summary.with_rt[i]:
+            row['RTms'] = list_text(summary.trials(summary.rts,i))
+            for k,s in enumerate(STATS[1:]):
+                row[s] = float(summary.rt_stats[i,k])
+        rows.append(row)
+    return rows
+
+
+def list_text(values):
+    return ', '.join(str(v) for v in values.tolist())
+
+
+# Report rows from a summary CSV. The list-valued cells are used as text,
+# not evaluated
+def csv_rows(incsv):
+    rows = []
+    with open(incsv,newline='') as f:
+        for cells in csv.DictReader(f):
+            row = dict(Condition=cells['Condition'])
+            for s in STATS:
+                cell = cells[s]
+                row[s] = None if cell == '()' else float(cell) if cell else float('nan')
+            for t in TRIALS:
+                cell = cells[t]
+                row[t] = None if cell == '()' else cell.strip('[]')
+            row['NTrials'] = row['OnsetsSec'].count(',') + 1 if row['OnsetsSec'] else 0
+            rows.append(row)
+    return rows
+
+
+# A stat as text: - if it isn't computed for the condition, n/a if missing
+def stat_text(value):
+    if value is None:
+        return '-'
+    if value != value:
+        return 'n/a'
+    return '%.1f' % value
+
+
+# The stats table as rows of text, header first
+def stats_table(rows):
+    table = [['Condition','NTrials'] + list(STATS)]
+    for row in rows:
+        table.append([row['Condition'],str(row['NTrials'])] + [stat_text(row[s]) for s in STATS])
+    return table
+
+
+# Plain text of the report, for logs
+def report_text(rows, title):
+    table = stats_table(rows)
+    widths = [max(len(r[c]) for r in table) for c in range(len(table[0]))]
+    lines = [title, str(datetime.datetime.now()), '']
+    for r in table:
+        lines.append('  '.join([r[0].ljust(widths[0])] +
+            [v.rjust(w) for v,w in zip(r[1:],widths[1:])]))
+    for t in TRIALS:
+        lines.append('\n%s' % t)
+        lines += ['%s: %s' % (row['Condition'],row[t]) for row in rows if row[t] is not None]
+    return '\n'.join(lines) + '\n'
+
+
+def new_pdf():
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_margins(10,10)
+    pdf.set_auto_page_break(True,10)
+    return pdf
+
+
+# Add one scan's report to the PDF, starting on a new page. link is set to
+# the page if given
+def add_report(pdf, rows, title, link=None):
+
+    pdf.add_page()
+    if link is not None:
+        pdf.set_link(link)
+    pdf.set_font(FONT,'B',9)
+    pdf.cell(0,5,title,ln=1)
+    pdf.set_font(FONT,'',7)
+    pdf.cell(0,LINE,str(datetime.datetime.now()),ln=1)
+    pdf.ln(LINE)
+
+    # Stats table, columns sized to their contents
+    table = stats_table(rows)
+    widths = [max(pdf.get_string_width(r[c]) for r in table) + 3
+        for c in range(len(table[0]))]
+    for n,r in enumerate(table):
+        pdf.set_font(FONT,'B' if n == 0 else '',7)
+        pdf.cell(widths[0],LINE,r[0],border='B' if n == 0 else 0)
+        for v,w in zip(r[1:],widths[1:]):
+            pdf.cell(w,LINE,v,border='B' if n == 0 else 0,align='R')
+        pdf.ln(LINE)
+
+    # Per-trial values, wrapped beside the condition name
+    name_width = widths[0]
+    for t in TRIALS:
+        pdf.ln(LINE)
+        pdf.set_font(FONT,'B',7)
+        pdf.cell(0,LINE,t,ln=1)
+        pdf.set_font(FONT,'',7)
+        for row in rows:
+            if row[t] is None:
+                continue
+            pdf.cell(name_width,LINE,row['Condition'])
+            pdf.multi_cell(0,LINE,row[t] or '(none)',align='L')
+
+
+# Report PDF for one scan
+def write_report(rows, outpdf, title):
+    pdf = new_pdf()
+    add_report(pdf,rows,title)
+    pdf.output(outpdf)
+
+
+# One PDF for many scans. reports is a list of (title, rows, index entry),
+# the index entry a list of text cells for the scan's line on the index
+# pages, which link to its report
+def write_combined_report(reports, outpdf, index_header=('Scan',)):
+    pdf = new_pdf()
+    pdf.add_page()
+    pdf.set_font(FONT,'B',9)
+    pdf.cell(0,5,'Index: %d scans' % len(reports),ln=1)
+    pdf.set_font(FONT,'',7)
+    pdf.cell(0,LINE,str(datetime.datetime.now()),ln=1)
+    pdf.ln(LINE)
+
+    entries = [list(index_header)] + [list(r[2]) for r in reports]
+    widths = [max(pdf.get_string_width(e[c]) for e in entries) + 3
+        for c in range(len(index_header))]
+    pdf.set_font(FONT,'B',7)
+    for v,w in zip(entries[0],widths):
+        pdf.cell(w,LINE,v,border='B')
+    pdf.ln(LINE)
+    pdf.set_font(FONT,'',7)
+    links = []
+    for entry in entries[1:]:
+        link = pdf.add_link()
+        links.append(link)
+        for v,w in zip(entry,widths):
+            pdf.cell(w,LINE,v,link=link)
+        pdf.ln(LINE)
+
+    for (title,rows,entry),link in zip(reports,links):
+        add_report(pdf,rows,title,link)
+    pdf.output(outpdf)
+
+
+# Load summary CSV and make the PDF. Returns the report text
+def make_pdf(incsv, outpdf, **kwargs):
+    rows = csv_rows(incsv)
+    title = report_title(**kwargs)
+    write_report(rows,outpdf,title)
+    return report_text(rows,title)
+
+
+# Report for a summary CSV found in a tree, with the scan's subject and
+# session from its directory name as in gf_edat_group.py. Returns the title,
+# rows and index entry, or None and the error
+def scan_report(path, task, scan_dir, name):
+    from gf_edat_batch import describe_log
+    log = describe_log(name + '.txt',task=task)
+    try:
+        rows = csv_rows(path)
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__,e)
+    title = '%s: %s (subject %s, session %s)' % (task,scan_dir,log['subject'],log['session'])
+    return (title, rows, (scan_dir,task,log['subject'],log['session'],str(len(rows)))), None
+
+
+# Write the PDFs for a batch of summary CSVs found in a tree, each to
+# <out_dir>/<scan directory>/eprime_summary_<task>.pdf. Runs in a worker
+# process. Returns the errors, None for each that was written
+def write_scan_reports(summaries, out_dir):
+    errors = []
+    for path,task,scan_dir,name in summaries:
+        report, error = scan_report(path,task,scan_dir,name)
+        if report is not None:
+            try:
+                pdf_dir = os.path.join(out_dir,scan_dir)
+                os.makedirs(pdf_dir,exist_ok=True)
+                write_report(report[1],os.path.join(pdf_dir,'eprime_summary_%s.pdf' % task),
+                    report[0])
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__,e)
+        errors.append(error)
+    return errors
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Report PDF from summary csv')
+    parser.add_argument('--incsv',help='Input CSV file')
+    parser.add_argument('--outpdf',help='Output PDF file')
+    parser.add_argument('--project',default='NO_PROJ')
+    parser.add_argument('--subject',default='NO_SUBJ')
+    parser.add_argument('--session',default='NO_SESS')
+    parser.add_argument('--scan',default='NO_SCAN')
+    parser.add_argument('--task',default='NO_TASK')
+    parser.add_argument('--in_dir',help='Directory tree to search for summary CSVs')
+    parser.add_argument('--combined_pdf',help='Output PDF with the reports of all scans in in_dir')
+    parser.add_argument('--out_dir',help='Directory to store a PDF for each scan in in_dir')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+        help='Number of worker processes for --out_dir')
+    parser.add_argument('--batch_size', type=int, default=50,
+        help='PDFs written by a worker at a time')
+    args = parser.parse_args()
+
+    if args.in_dir is None:
+        if not (args.incsv and args.outpdf):
+            parser.error('--incsv and --outpdf are required without --in_dir')
+        txt = make_pdf(args.incsv, args.outpdf, project=args.project, subject=args.subject,
+            session=args.session, scan=args.scan, task=args.task)
+        print(txt)
+        return
+
+    if not (args.combined_pdf or args.out_dir):
+        parser.error('--in_dir needs --combined_pdf and/or --out_dir')
+
+    from gf_edat_group import find_summaries
+    summaries = find_summaries(args.in_dir)
+    print('Reporting on %d summary CSVs' % len(summaries))
+    failed = []
+
+    if args.out_dir:
+        batches = [summaries[i:i+args.batch_size]
+            for i in range(0,len(summaries),args.batch_size)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for batch,errors in zip(batches,
+                    pool.map(write_scan_reports,batches,[args.out_dir]*len(batches))):
+                failed += [(s[0],e) for s,e in zip(batch,errors) if e]
+
+    if args.combined_pdf:
+        reports = []
+        for summary in summaries:
+            report, error = scan_report(*summary)
+            if report is None:
+                if not args.out_dir:
+                    failed.append((summary[0],error))
+            else:
+                reports.append(report)
+        write_combined_report(reports,args.combined_pdf,
+            ('Scan','Task','Subject','Session','Conditions'))
+
+    for path,error in failed:
+        print('FAILED %s: %s' % (path,error))
+    print('Done: %d scans, %d failed' % (len(summaries) - len(failed),len(failed)))
+    if failed:
+        sys.exit(1)
+
 
+if __name__ == "__main__":
+    main()
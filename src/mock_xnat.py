@@ -0,0 +1,379 @@
+# A stand-in for the parts of the XNAT REST API that the uploader uses through
+# DAX and pyxnat, for check_uploader.py. It's served over HTTP by a thread,
+# and holds one project's subjects, sessions and scans in memory, with each
+# scan's resources and the files put in them. Requests can be made to fail a
+# number of times, to check that the uploader retries them.
+#
+#    xnat = MockXnat('GenFac_HWZ')
+#    xnat.add_scan('123456','123456','5','wm1_fMRI')
+#    xnat.fail('GET','/scans/5/resources',times=1)
+#    url = xnat.start()
+#    ...
+#    xnat.stop()
+#
+# Listings are given as CSV or JSON (format=csv or format=json), with every
+# column the uploader asks for whatever the columns= parameter says. Requests
+# it doesn't know get 404 and are kept in unknown.
+
+import base64
+import csv
+import http.server
+import io
+import json
+import netrc
+import os
+import threading
+import urllib.parse
+import urllib.request
+import zipfile
+
+
+SESSION_TYPE = 'xnat:mrSessionData'
+SCAN_TYPE = 'xnat:mrScanData'
+
+# Columns DAX asks for in its scan listings
+SESSION_SCAN_COLUMNS = ','.join(['ID','URI','label','subject_label','project'] +
+    ['xnat:imagesessiondata/scans/scan/%s' % c for c in
+    ('id','type','quality','note','frames','series_description')] +
+    ['xnat:imagesessiondata/subject_id'])
+PROJECT_SCAN_COLUMNS = ','.join(['ID','URI','label','subject_label','project',
+    'xnat:imagesessiondata/subject_id'] + ['xnat:imagescandata/%s' % c for c in
+    ('id','type','quality','note','frames','series_description','file/label')])
+
+
+class MockXnat:
+
+    def __init__(self, project):
+        self.project = project
+        self.subjects = dict()
+        self.sessions = dict()
+        self.failures = []
+        self.requests = []
+        self.unknown = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    # Add a scan, and its session and subject if they're new. Resources are
+    # labels of resources the scan already has
+    def add_scan(self, subject, session, scan_id, scan_type, quality='usable', resources=()):
+        self.subjects.setdefault(subject,'MOCK_S%05d' % (len(self.subjects) + 1))
+        sess = self.sessions.setdefault(session,dict(
+            ID='MOCK_E%05d' % (len(self.sessions) + 1), subject=subject, scans=dict()))
+        sess['scans'][scan_id] = dict(type=scan_type, quality=quality, resources=dict())
+        for label in resources:
+            self.add_resource(session,scan_id,label)
+
+    def add_resource(self, session, scan_id, label):
+        resources = self.sessions[session]['scans'][scan_id]['resources']
+        n = sum(len(s['resources']) for sess in self.sessions.values()
+            for s in sess['scans'].values())
+        return resources.setdefault(label,dict(ID=str(n + 1), files=dict()))
+
+    # Files in a scan's resource, by name
+    def files(self, session, scan_id, label):
+        resource = self.sessions[session]['scans'][scan_id]['resources'].get(label)
+        return dict() if resource is None else resource['files']
+
+    # Make the next requests with this method, whose path contains the given
+    # text, fail with an HTTP error
+    def fail(self, method, path, times=1, status=503):
+        self.failures.append(dict(method=method, path=path, times=times, status=status))
+
+    # Number of requests made, optionally only those with this method whose
+    # path contains the given text
+    def count(self, method=None, path=''):
+        return sum(1 for m,p in self.requests if method in (None,m) and path in p)
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1',0),make_handler(self))
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # HTTP status to fail a request with, if it should fail
+    def failure(self, method, path):
+        for f in self.failures:
+            if f['times'] and f['method'] == method and f['path'] in path:
+                f['times'] -= 1
+                return f['status']
+        return None
+
+    # A subject's session, by ID or label
+    def session(self, subject, session):
+        for label,sess in self.sessions.items():
+            if session in (label,sess['ID']) and sess['subject'] == subject:
+                return label, sess
+        return None, None
+
+    # A scan's resource, by ID or label
+    def resource(self, session, scan_id, resource):
+        resources = self.sessions[session]['scans'][scan_id]['resources']
+        for label,r in resources.items():
+            if resource in (label,r['ID']):
+                return r
+        return None
+
+    def subject_rows(self):
+        return [dict(ID=sid, project=self.project, label=label, URI='/data/subjects/%s' % sid,
+            insert_date='', last_modified='', src='', handedness='', gender='', yob='', dob='')
+            for label,sid in self.subjects.items()]
+
+    def session_rows(self, subject=None):
+        t = SESSION_TYPE.lower()
+        return [{'ID': sess['ID'], 'label': label, 'URI': '/data/experiments/%s' % sess['ID'],
+            'project': self.project, 'xsiType': SESSION_TYPE, 'modality': 'MR', 'date': '',
+            'subject_label': sess['subject'], 'subject_ID': self.subjects[sess['subject']],
+            '%s/age' % t: '', '%s/meta/last_modified' % t: '', '%s/original' % t: ''}
+            for label,sess in self.sessions.items() if subject in (None,sess['subject'])]
+
+    # A row per scan of the sessions, as dax get_scans lists them
+    def session_scan_rows(self, subject):
+        rows = []
+        for row in self.session_rows(subject):
+            p = 'xnat:imagesessiondata/scans/scan/'
+            for scan_id,scan in self.sessions[row['label']]['scans'].items():
+                rows.append(dict(row, **{p+'id': scan_id, p+'type': scan['type'],
+                    p+'quality': scan['quality'], p+'note': '', p+'frames': '',
+                    p+'series_description': scan['type'],
+                    'xnat:imagesessiondata/subject_id': row['subject_ID']}))
+        return rows
+
+    # A row per scan and resource in the project, as dax get_project_scans
+    # lists them
+    def project_scan_rows(self):
+        rows = []
+        for row in self.session_rows():
+            p = 'xnat:imagescandata/'
+            for scan_id,scan in self.sessions[row['label']]['scans'].items():
+                for label in list(scan['resources']) or ['']:
+                    rows.append(dict(row, **{p+'id': scan_id, p+'type': scan['type'],
+                        p+'quality': scan['quality'], p+'note': '', p+'frames': '',
+                        p+'series_description': scan['type'], p+'file/label': label,
+                        'xnat:imagesessiondata/subject_id': row['subject_ID']}))
+        return rows
+
+    def scan_rows(self, session):
+        return [dict(ID=scan_id, type=scan['type'], quality=scan['quality'], xsiType=SCAN_TYPE,
+            URI='/data/experiments/%s/scans/%s' % (self.sessions[session]['ID'],scan_id))
+            for scan_id,scan in self.sessions[session]['scans'].items()]
+
+    def resource_rows(self, session, scan_id):
+        return [dict(xnat_abstractresource_id=r['ID'], label=label, element_name='xnat:resourceCatalog',
+            category='scans', cat_id=scan_id, format='', content='', file_count=len(r['files']))
+            for label,r in self.sessions[session]['scans'][scan_id]['resources'].items()]
+
+    # Answer a request: its HTTP status, and the rows of a listing or the
+    # text of the body
+    def handle(self, method, path, query, body):
+        with self.lock:
+            self.requests.append((method,path))
+            status = self.failure(method,path)
+            if status is not None:
+                return status, 'Service Unavailable'
+            return self.route(method,path,query,body)
+
+    def route(self, method, path, query, body):
+        parts = [urllib.parse.unquote(p) for p in path.strip('/').split('/')]
+        if parts[:1] in (['data'],['REST']):
+            parts = parts[1:]
+        n = len(parts)
+
+        if parts == ['JSESSION']:
+            return 200, 'MOCKSESSION'
+        if parts == ['archive','experiments'] and method == 'GET':
+            if query.get('project') != self.project:
+                return 200, []
+            return 200, self.project_scan_rows()
+        if n < 2 or parts[0] != 'projects' or parts[1] != self.project:
+            return 404, 'Not Found'
+        if parts == ['projects',self.project] and method == 'GET':
+            return 200, [dict(ID=self.project, name=self.project)]
+        if parts[2:] == ['subjects'] and method == 'GET':
+            return 200, self.subject_rows()
+        if parts[2:] == ['experiments'] and method == 'GET':
+            return 200, self.session_rows()
+        if n < 4 or parts[2] != 'subjects':
+            return 404, 'Not Found'
+        subject = {sid: label for label,sid in self.subjects.items()}.get(parts[3],parts[3])
+        if subject not in self.subjects:
+            return 404, 'Not Found'
+        if n == 4 and method == 'GET':
+            return 200, [r for r in self.subject_rows() if r['label'] == subject]
+        if parts[4:] == ['experiments'] and method == 'GET':
+            return 200, self.session_scan_rows(subject) if 'columns' in query and \
+                'scans' in query['columns'] else self.session_rows(subject)
+        if n < 6 or parts[4] != 'experiments':
+            return 404, 'Not Found'
+        session, sess = self.session(subject,parts[5])
+        if sess is None:
+            return 404, 'Not Found'
+        if parts[6:] == ['scans'] and method == 'GET':
+            return 200, self.scan_rows(session)
+        if n < 8 or parts[6] != 'scans' or parts[7] not in sess['scans']:
+            return 404, 'Not Found'
+        scan_id = parts[7]
+        if parts[8:] == ['resources'] and method == 'GET':
+            return 200, self.resource_rows(session,scan_id)
+        if n < 10 or parts[8] != 'resources':
+            return 404, 'Not Found'
+        if n == 10 and method == 'PUT':
+            self.add_resource(session,scan_id,parts[9])
+            return 200, ''
+        resource = self.resource(session,scan_id,parts[9])
+        if resource is None:
+            return 404, 'Not Found'
+        if parts[10:11] == ['files'] and n == 12 and method in ('PUT','POST'):
+            if query.get('extract') == 'true':
+                with zipfile.ZipFile(io.BytesIO(body)) as z:
+                    for name in z.namelist():
+                        resource['files'][name.split('/')[-1]] = z.read(name)
+            else:
+                resource['files'][parts[11]] = body
+            return 200, ''
+        return 404, 'Not Found'
+
+
+# Rows of a listing as XNAT sends them
+def listing(rows, fmt):
+    if fmt == 'json':
+        return json.dumps(dict(ResultSet=dict(Result=rows, totalRecords=str(len(rows)))))
+    f = io.StringIO()
+    fieldnames = list(dict.fromkeys(k for row in rows for k in row))
+    writer = csv.DictWriter(f,fieldnames=fieldnames,lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return f.getvalue()
+
+
+def make_handler(xnat):
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self, method):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            status, result = xnat.handle(method,url.path,query,body)
+            if not isinstance(result,str):
+                result = listing(result,query.get('format','csv'))
+            if status == 404:
+                xnat.unknown.append((method,self.path))
+            data = result.encode()
+            self.send_response(status)
+            self.send_header('Content-Type','text/plain')
+            self.send_header('Content-Length',str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.respond('GET')
+
+        def do_PUT(self):
+            self.respond('PUT')
+
+        def do_POST(self):
+            self.respond('POST')
+
+        def do_DELETE(self):
+            self.respond('DELETE')
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# Connect as dax.XnatUtils.get_interface does, with the login from ~/.netrc
+# for the host unless it's given
+def get_interface(host=None, user=None, pwd=None):
+    host = host or os.environ['XNAT_HOST']
+    if user is None:
+        login = netrc.netrc().authenticators(urllib.parse.urlparse(host).hostname)
+        if login is None:
+            raise Exception('No login for %s in ~/.netrc' % host)
+        user, _, pwd = login
+    return Interface(host,user,pwd)
+
+
+class Interface:
+
+    def __init__(self, host, user, pwd):
+        self.host = host.rstrip('/')
+        self.user = user
+        self.pwd = pwd
+        self.request('GET','/data/JSESSION')
+
+    # Make a request, raising urllib.error.HTTPError if it fails. Returns the
+    # body
+    def request(self, method, path, data=None, headers=None):
+        req = urllib.request.Request(self.host + path, data=data, method=method,
+            headers=dict(headers or {}))
+        req.add_header('Authorization','Basic ' +
+            base64.b64encode(('%s:%s' % (self.user,self.pwd)).encode()).decode())
+        with urllib.request.urlopen(req) as r:
+            return r.read()
+
+    def get_json(self, path):
+        sep = '&' if '?' in path else '?'
+        result = json.loads(self.request('GET',path + sep + 'format=json'))
+        return result['ResultSet']['Result']
+
+    def get_scans(self, project, subject, session):
+        rows = self.get_json('/REST/projects/%s/subjects/%s/experiments?columns=%s' %
+            (project,subject,SESSION_SCAN_COLUMNS))
+        p = 'xnat:imagesessiondata/scans/scan/'
+        return [dict(scan_id=r[p+'id'], scan_type=r[p+'type'], quality=r[p+'quality'],
+            scan_description=r[p+'series_description'], subject_label=r['subject_label'],
+            session_id=r['ID'], session_label=r['label'], project_id=project)
+            for r in rows if session in (r['ID'],r['label'])]
+
+    def get_scan_resources(self, project, subject, session, scan_id):
+        return self.get_json('/REST/projects/%s/subjects/%s/experiments/%s/scans/%s/resources' %
+            (project,subject,session,scan_id))
+
+    def get_project_scans(self, project):
+        rows = self.get_json('/REST/archive/experiments?project=%s&xsiType=xnat:imageSessionData'
+            '&columns=%s' % (project,PROJECT_SCAN_COLUMNS))
+        p = 'xnat:imagescandata/'
+        scans = dict()
+        for r in rows:
+            scan = scans.setdefault((r['ID'],r[p+'id']),dict(scan_id=r[p+'id'],
+                scan_type=r[p+'type'], quality=r[p+'quality'],
+                scan_description=r[p+'series_description'], subject_label=r['subject_label'],
+                session_id=r['ID'], session_label=r['label'], project_id=project,
+                resources=[]))
+            scan['resources'].append(r[p+'file/label'])
+        return list(scans.values())
+
+    def select_scan_resource(self, project, subject, session, scan_id, resource):
+        return Resource(self,'/REST/projects/%s/subjects/%s/experiments/%s/scans/%s/resources/%s' %
+            (project,subject,session,scan_id,resource))
+
+    def disconnect(self):
+        self.request('DELETE','/data/JSESSION')
+
+
+class Resource:
+
+    def __init__(self, intf, path):
+        self.intf = intf
+        self.path = path
+
+    def create(self):
+        self.intf.request('PUT',self.path)
+
+    # Put files in the resource zipped, as pyxnat does, to be unzipped on XNAT
+    def put(self, files, overwrite=False):
+        f = io.BytesIO()
+        with zipfile.ZipFile(f,'w') as z:
+            for path in files:
+                z.write(path,os.path.basename(path))
+        self.intf.request('POST','%s/files/files.zip?extract=true%s' % (self.path,
+            '&overwrite=true' if overwrite else ''),data=f.getvalue(),
+            headers={'Content-Type': 'application/zip'})
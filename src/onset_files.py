@@ -0,0 +1,106 @@
+# Model-ready onset files for a task, written straight from the trials of a
+# condition_summary.ConditionSummary, so they don't have to be parsed back
+# out of the summary CSV. Formats:
+#
+#    fsl    <task>_<Condition>.txt   FSL three-column format: onset, duration
+#                                    and weight (1) per trial, one file per
+#                                    condition
+#    spm    <task>_conditions.mat    SPM multiple conditions: names, onsets
+#                                    and durations cell arrays
+#    bids   task-<task>_events.tsv   BIDS events: onset, duration,
+#                                    trial_type (the condition),
+#                                    response_time (sec, n/a with no
+#                                    response) and accuracy
+#
+# Times are in seconds from the task's start trigger. Trials are listed in
+# onset order, and trials without an onset are left out. The SPM file needs
+# scipy.
+
+import os
+import re
+
+import numpy
+
+
+FORMATS = ('fsl','spm','bids')
+
+
+# Condition name made safe for a filename
+def file_label(name):
+    return re.sub(r'[^A-Za-z0-9_-]+','_',str(name))
+
+
+# Condition name and the positions of its trials that have an onset, in
+# onset order, for each condition
+def condition_trials(summary):
+    for i in range(len(summary)):
+        trials = numpy.arange(summary.offsets[i],summary.offsets[i+1])
+        trials = trials[~numpy.isnan(summary.onsets[trials])]
+        trials = trials[numpy.argsort(summary.onsets[trials],kind='stable')]
+        yield summary.conditions['Condition'].iloc[i], trials
+
+
+# FSL three-column files, one per condition
+def write_fsl(summary, out_dir, task):
+    paths = []
+    for name,trials in condition_trials(summary):
+        path = os.path.join(out_dir,'%s_%s.txt' % (task,file_label(name)))
+        with open(path,'w') as f:
+            for t in trials:
+                f.write('%s\t%s\t1\n' % (float(summary.onsets[t]),float(summary.durations[t])))
+        paths.append(path)
+    return paths
+
+
+# SPM multiple conditions file
+def write_spm(summary, out_dir, task):
+    import scipy.io
+    names, onsets, durations = [], [], []
+    for name,trials in condition_trials(summary):
+        names.append(str(name))
+        onsets.append(summary.onsets[trials].reshape(-1,1))
+        durations.append(summary.durations[trials].reshape(-1,1))
+
+    def cells(values):
+        c = numpy.empty((1,len(values)),dtype=object)
+        for i,v in enumerate(values):
+            c[0,i] = v
+        return c
+
+    path = os.path.join(out_dir,'%s_conditions.mat' % task)
+    scipy.io.savemat(path, dict(names=cells(names), onsets=cells(onsets),
+        durations=cells(durations)))
+    return [path]
+
+
+# BIDS events file. Missing values are n/a, as are RTs of trials with no
+# response (E-Prime gives those an RT of 0)
+def write_bids(summary, out_dir, task):
+    events = []
+    for i,(name,trials) in enumerate(condition_trials(summary)):
+        for t in trials:
+            rt = summary.rts[t] if summary.with_rt[i] else numpy.nan
+            acc = summary.accs[t] if summary.with_acc[i] else None
+            events.append((float(summary.onsets[t]), float(summary.durations[t]), str(name),
+                'n/a' if numpy.isnan(rt) or rt <= 0 else str(float(rt) / 1000),
+                'n/a' if acc is None else str(int(acc))))
+    events.sort(key=lambda e: e[0])
+
+    path = os.path.join(out_dir,'task-%s_events.tsv' % re.sub('[^A-Za-z0-9]','',task))
+    with open(path,'w') as f:
+        f.write('onset\tduration\ttrial_type\tresponse_time\taccuracy\n')
+        for e in events:
+            f.write('%s\t%s\t%s\t%s\t%s\n' % e)
+    return [path]
+
+
+WRITERS = dict(fsl=write_fsl, spm=write_spm, bids=write_bids)
+
+
+# Write onset files in each of the formats to out_dir. Returns their paths
+def write_onset_files(summary, out_dir, task, formats=FORMATS):
+    os.makedirs(out_dir,exist_ok=True)
+    paths = []
+    for fmt in formats:
+        paths += WRITERS[fmt](summary,out_dir,task)
+    return paths
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+#
+# Read CSV from eprime_to_csv.py and perform study-specific analysis for any
+# of the GF tasks defined in tasks.py. Only the columns the task uses are
+# read from the CSV. The .feather or .parquet table from eprime_to_csv.py
+# --outtable can be used in place of the CSV.
+
+import argparse
+import pandas
+import os
+
+from condition_summary import summarize_conditions, trigger_time
+from eprime_to_csv import read_eprime_table, table_columns
+from onset_files import FORMATS, write_onset_files
+from tasks import TASKS, missing_columns, task_columns
+
+
+# Options that are passed straight on to summarize_conditions
+SUMMARY_OPTIONS = ('groups','condition','onset','rt','acc','duration',
+    'rt_only','acc_only','sort','pct_decimals')
+
+
+# Read the converted E-Prime CSV or table, keeping only the columns the task
+# uses. Any the log is missing, as one cut short can be, are empty
+def read_eprime_csv(eprime_csv, task):
+    columns = task_columns(task)
+    missing = missing_columns(task,table_columns(eprime_csv))
+    edat = read_eprime_table(eprime_csv,columns=[c for c in columns if c not in missing])
+    return edat.reindex(columns=columns)
+
+
+# Per-condition onsets, durations, accuracy and RT from the E-Prime table, as
+# a condition_summary.ConditionSummary
+def summarize(edat, task):
+
+    spec = TASKS[task]
+
+    # Start time from the trigger item
+    start_time = trigger_time(edat,spec['start'])
+
+    # Trial rows
+    rows = spec['rows']
+    if rows.get('values') is None:
+        keep = edat.loc[:,rows['column']].notna()
+    else:
+        keep = edat.loc[:,rows['column']].isin(rows['values'])
+    info = edat.loc[keep,:].copy()
+
+    # Derived columns, e.g. condition names
+    for d in spec.get('derive',()):
+        col = pandas.Series(d['default'],index=info.index,dtype=object)
+        for value,label in d['values'].items():
+            col[info.loc[:,d['column']]==value] = label
+        info[d['name']] = col
+
+    drop = spec.get('drop')
+    if drop is not None:
+        info = info.loc[~info.loc[:,drop['column']].isin(drop['values']),:]
+
+    options = {k: spec[k] for k in SUMMARY_OPTIONS if k in spec}
+    return summarize_conditions(info,start_time,**options)
+
+
+def main(task=None):
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        description='Parse CSV for GF %s task' % task if task else 'Parse CSV for a GF task')
+    parser.add_argument('-o', '--outcsv', help='Path to store the output summary CSV')
+    parser.add_argument('--outtrials',
+        help='Also store a table with one row per trial (.csv, .feather or .parquet)')
+    parser.add_argument('--onsets', nargs='+', choices=list(FORMATS), default=[],
+        help='Also write onset files for these packages')
+    parser.add_argument('--onsets_dir', default='.', help='Directory for the onset files')
+    if task is None:
+        parser.add_argument('--task', help='Task', choices=list(TASKS), required=True)
+    parser.add_argument('eprime_csv', help='CSV (or .feather/.parquet) file from eprime_to_csv.py',
+        metavar='EPRIME_CSV')
+    args = parser.parse_args()
+    if task is None:
+        task = args.task
+
+    # Generate output CSV path+filename
+    if args.outcsv is None:
+        out_csv = os.path.splitext(os.path.basename(args.eprime_csv))[0] + '_summary.csv'
+    else:
+        out_csv = args.outcsv
+
+    # Read in CSV
+    edat = read_eprime_csv(args.eprime_csv,task)
+
+    # Summarize by condition
+    summary = summarize(edat,task)
+
+    # Write to file
+    summary.to_csv(out_csv)
+    if args.outtrials:
+        summary.write_trials(args.outtrials)
+    if args.onsets:
+        write_onset_files(summary,args.onsets_dir,task,args.onsets)
+
+
+
+if __name__ == "__main__":
+    main()
+
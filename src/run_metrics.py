@@ -0,0 +1,151 @@
+# Per-stage metrics for a gf_edat.py run, written to <out_dir>/metrics.json so
+# a slow job can be looked into after the fact. For each stage (convert,
+# parse, the output writes, pdf) it records
+#
+#    wall_sec       Wall time
+#    cpu_sec        CPU time of the process (user + system)
+#    peak_rss_mb    Peak RSS during the stage. Where the kernel can reset the
+#                   peak (Linux /proc/self/clear_refs) this is the stage's own
+#                   peak, otherwise the process's peak so far
+#
+# plus counts the stage adds, e.g. input_bytes and frames for the conversion,
+# trials and conditions for the parse, and whether it came from the cache.
+# The run's info says whether the compiled tokenizer was used.
+# Each stage can also be profiled with cProfile (<stage>.prof, for pstats or
+# snakeviz) or pyinstrument (<stage>.html) into a profile directory.
+#
+# Standard library only, so gf_edat.py --lite can use it too.
+
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import eprime_tokenizer
+
+
+PROFILERS = ('cprofile','pyinstrument')
+
+
+# Reset the kernel's record of peak RSS for this process. Returns whether it
+# could
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# Peak RSS in MB, since the last reset if there was one. ru_maxrss is in kB
+# on Linux and bytes on macOS
+def peak_rss_mb(since_reset=False):
+    if since_reset:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def cpu_sec():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+# A stage being measured. Use as a context manager; values set on it with
+# add() are stored with the stage's times
+class Stage:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.record = dict(stage=name)
+        self.profiler = None
+
+    def add(self, **values):
+        self.record.update(values)
+
+    def __enter__(self):
+        self.reset = reset_peak_rss()
+        if self.metrics.profile == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.metrics.profile == 'pyinstrument':
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+            self.profiler.start()
+        self.wall0 = time.perf_counter()
+        self.cpu0 = cpu_sec()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record['wall_sec'] = time.perf_counter() - self.wall0
+        self.record['cpu_sec'] = cpu_sec() - self.cpu0
+        self.record['peak_rss_mb'] = peak_rss_mb(self.reset)
+        if exc_type is not None:
+            self.record['error'] = '%s: %s' % (exc_type.__name__,exc)
+        if self.profiler is not None:
+            if self.metrics.profile == 'cprofile':
+                self.profiler.disable()
+            else:
+                self.profiler.stop()
+            self.record['profile'] = self.metrics.save_profile(self.profiler,
+                self.record['stage'])
+        self.metrics.stages.append(self.record)
+        return False
+
+
+# Metrics of one run: info about the run, and a record for each stage in the
+# order they ran
+class RunMetrics:
+
+    def __init__(self, profile=None, profile_dir=None, **info):
+        if profile not in (None,) + PROFILERS:
+            raise ValueError('Unknown profiler %s' % profile)
+        if profile == 'pyinstrument':
+            # Fail now rather than after the first stage if it isn't installed
+            import pyinstrument
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.info = dict(info)
+        self.info['started'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.info['python'] = platform.python_version()
+        self.info['host'] = platform.node()
+        self.info['compiled_tokenizer'] = eprime_tokenizer.COMPILED
+        self.stages = []
+        self.wall0 = time.perf_counter()
+        self.cpu0 = cpu_sec()
+
+    def stage(self, name):
+        return Stage(self,name)
+
+    def save_profile(self, profiler, name):
+        os.makedirs(self.profile_dir,exist_ok=True)
+        if self.profile == 'cprofile':
+            path = os.path.join(self.profile_dir,'%s.prof' % name)
+            profiler.dump_stats(path)
+        else:
+            path = os.path.join(self.profile_dir,'%s.html' % name)
+            with open(path,'w') as f:
+                f.write(profiler.output_html())
+        return path
+
+    def to_dict(self):
+        return dict(self.info,
+            wall_sec=time.perf_counter() - self.wall0,
+            cpu_sec=cpu_sec() - self.cpu0,
+            # Resetting the peak for each stage can lower ru_maxrss too
+            peak_rss_mb=max([peak_rss_mb()] + [s['peak_rss_mb'] for s in self.stages]),
+            stages=self.stages)
+
+    def write(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'w') as f:
+            json.dump(self.to_dict(),f,indent=2)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+#
+# Build the optional compiled tokenizer, eprime_tokenizer_cy.pyx, into an
+# extension module next to it. eprime_tokenizer.py uses it when it's there.
+#
+#    pip3 install cython
+#    python3 setup_tokenizer.py build_ext --inplace
+#
+# Delete the eprime_tokenizer_cy*.so (or .pyd) to go back to plain Python.
+# check_tokenizer.py checks the compiled tokenizer gives the same CSVs.
+
+import os
+
+from Cython.Build import cythonize
+from setuptools import setup
+
+
+# Build next to the source wherever this is run from
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+setup(
+    name='gf-edat-tokenizer',
+    ext_modules=cythonize('eprime_tokenizer_cy.pyx'),
+    )
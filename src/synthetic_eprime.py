@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#
+# Write synthetic E-Prime .txt logs for the GF tasks, for testing and
+# benchmarking. The logs are UTF-16 with CRLF line endings like E-Prime's
+# (or another encoding, with --encoding), and the trial frames have the columns the task definitions in tasks.py
+# read, with random conditions, onsets, RTs and accuracy.
+#
+#    synthetic_eprime.py --task WM --trials 120 WM-000000-1.txt
+#
+# Frames are nested like E-Prime's: trials at the deepest level, inside one
+# frame per block at each level above, inside the session frame at level 1.
+# Each frame is written when it ends, so a block's trials come before it.
+
+import argparse
+import random
+
+from tasks import TASKS
+
+
+# Fields of a trial frame for each task, given the trial number, its onset
+# time (ms), whether it's answered correctly, and the random generator
+
+def oddball_trial(n, onset, correct, rng):
+    condition = 'Deviant' if rng.random() < 0.2 else 'Standard'
+    tone = condition + 'Tone'
+    return [
+        ('Procedure', condition + 'Proc'),
+        ('Running', 'TrialList'),
+        ('TrialList', n),
+        ('TrialList.Cycle', 1),
+        ('TrialList.Sample', n),
+        (tone + '.OnsetDelay', rng.randint(0,20)),
+        (tone + '.OnsetTime', onset),
+        (tone + '.ACC', int(correct)),
+        (tone + '.RESP', 1 if correct else ''),
+        (tone + '.RT', rng.randint(250,900) if correct else 0),
+        ]
+
+def oddball_old_trial(n, onset, correct, rng):
+    tone = rng.choice(['silence','1000','1000','1000','1200'])
+    return [
+        ('Procedure', 'MainProc'),
+        ('Running', 'MainStimuli'),
+        ('MainStimuli', n),
+        ('MainStimuli.Cycle', 1),
+        ('MainStimuli.Sample', n),
+        ('tone', 'stimuli\\%s.wav' % tone),
+        ('duration', rng.choice([500,1000])),
+        ('MainScreen.OnsetDelay', rng.randint(0,20)),
+        ('MainScreen.OnsetTime', onset),
+        ('MainScreen.ACC', int(correct)),
+        ('MainScreen.RESP', 1 if correct else ''),
+        ('MainScreen.RT', rng.randint(250,900) if correct else 0),
+        ]
+
+def spt_trial(n, onset, correct, rng):
+    return [
+        ('Procedure', 'PictureProc'),
+        ('Running', 'PictureList'),
+        ('PictureList', n),
+        ('PictureList.Cycle', 1),
+        ('PictureList.Sample', n),
+        ('ImageType', rng.choice(['Face','House','Scene'])),
+        ('bbcolor', rng.choice(['red','green','green','green'])),
+        ('PresentPicture.OnsetDelay', rng.randint(0,20)),
+        ('PresentPicture.OnsetTime', onset),
+        ('PresentPicture.ACC', int(correct)),
+        ('PresentPicture.RESP', 7 if correct else ''),
+        ('PresentPicture.RT', rng.randint(250,900) if correct else 0),
+        ]
+
+def spt_esop_trial(n, onset, correct, rng):
+    target = rng.random() < 0.25
+    return [
+        ('Procedure', 'PictureProc'),
+        ('Running', 'PictureList'),
+        ('PictureList', n),
+        ('PictureList.Cycle', 1),
+        ('PictureList.Sample', n),
+        ('ImageType', rng.choice(['Face','House','Scene'])),
+        ('PresentPicture.OnsetDelay', rng.randint(0,20)),
+        ('PresentPicture.OnsetTime', onset),
+        ('PresentPicture.ACC', int(correct)),
+        ('PresentPicture.CRESP', 7 if target else ''),
+        ('PresentPicture.RESP', 7 if target == correct else ''),
+        ('PresentPicture.RT', rng.randint(250,900) if target == correct else 0),
+        ]
+
+def wm_trial(n, onset, correct, rng):
+    return [
+        ('Procedure', 'StimProc'),
+        ('Running', 'StimList'),
+        ('StimList', n),
+        ('StimList.Cycle', 1),
+        ('StimList.Sample', n),
+        ('BlockType', rng.choice(['0back','2back'])),
+        ('StimType', rng.choice(['target','nontarget','nontarget','lure'])),
+        ('Stim.OnsetDelay', rng.randint(0,20)),
+        ('Stim.OnsetTime', onset),
+        ('Stim.ACC', int(correct)),
+        ('Stim.CRESP', 1),
+        ('Stim.RESP', 1 if correct else 2),
+        ('Stim.RT', rng.randint(250,1500)),
+        ]
+
+TRIALS = {
+    'Oddball': oddball_trial,
+    'OddballOld': oddball_old_trial,
+    'SPT': spt_trial,
+    'SPT-ESOP': spt_esop_trial,
+    'WM': wm_trial,
+    }
+
+
+# Lines of a log frame, tab-indented by level
+def frame_lines(level, fields):
+    tabs = '\t' * (level - 1)
+    lines = ['%sLevel: %d' % (tabs,level), '%s*** LogFrame Start ***' % tabs]
+    lines += ['%s%s: %s' % (tabs,field,value) for field,value in fields]
+    lines.append('%s*** LogFrame End ***' % tabs)
+    return lines
+
+
+# Lines of a synthetic log for a task.
+#
+#    ntrials        Number of trial frames
+#    nlevels        Level of the trial frames (2 or more)
+#    nblocks        Number of blocks the trials are split into
+#    noise          Number of extra fields in every trial frame that no
+#                   task uses
+#    accuracy       Fraction of trials answered correctly
+#
+# The start trigger for the task is recorded in each block's frame at the
+# level above the trials, at the time the block starts.
+def log_lines(task, ntrials, nlevels=3, nblocks=2, noise=0, accuracy=0.85, seed=0):
+
+    if nlevels < 2:
+        raise ValueError('Trial frames must be at level 2 or deeper')
+    rng = random.Random(seed)
+    experiment = 'GF_%s' % task.replace('-','_')
+    start = TASKS[task]['start']
+    trial = TRIALS[task]
+
+    yield '*** Header Start ***'
+    yield 'VersionPersist: 1'
+    yield 'LevelName: Session'
+    for level in range(2,nlevels):
+        yield 'LevelName: Block%d' % (level - 1) if level > 2 else 'LevelName: Block'
+    yield 'LevelName: Trial'
+    yield 'Experiment: %s' % experiment
+    yield 'SessionDate: 01-01-2020'
+    yield 'SessionTime: 10:00:00'
+    yield 'RandomSeed: %d' % rng.randint(-2**31,2**31 - 1)
+    yield 'Group: 1'
+    yield 'Subject: 0'
+    yield 'Session: 1'
+    yield 'Display.RefreshRate: 60.000'
+    yield '*** Header End ***'
+
+    time = 10000
+    n = 0
+    for block in range(nblocks):
+        block_start = time + rng.randint(0,500)
+        time = block_start + 2000
+        for t in range(ntrials * (block + 1) // nblocks - n):
+            n += 1
+            fields = trial(n,time,rng.random() < accuracy,rng)
+            fields += [('Noise%d' % k, rng.randint(0,99999)) for k in range(noise)]
+            yield from frame_lines(nlevels,fields)
+            time += rng.randint(1000,3000)
+
+        # Block frames end after their trials, innermost first. The session
+        # frame holds the trigger if there are no block levels
+        for level in range(nlevels - 1,1,-1):
+            fields = [
+                ('Procedure', 'BlockProc'),
+                ('Running', 'BlockList'),
+                ('BlockList', block + 1),
+                ]
+            if level == nlevels - 1:
+                fields.append((start,block_start))
+            yield from frame_lines(level,fields)
+
+    fields = [
+        ('Experiment', experiment),
+        ('SessionDate', '01-01-2020'),
+        ('Subject', 0),
+        ('Clock.Information', '<?xml version="1.0"?>\\n<Clock />'),
+        ('Display.RefreshRate', '60.000'),
+        ]
+    if nlevels == 2:
+        fields.append((start,10000))
+    yield from frame_lines(1,fields)
+
+
+# Write a synthetic log. Other options are those of log_lines
+def write_log(eprime_txt, task, ntrials, encoding='utf-16', **kwargs):
+    with open(eprime_txt,'w',encoding=encoding,newline='\r\n') as f:
+        for line in log_lines(task,ntrials,**kwargs):
+            f.write(line + '\n')
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Write a synthetic E-Prime log for a GF task')
+    parser.add_argument('--task', help='Task', choices=list(TASKS), required=True)
+    parser.add_argument('--trials', type=int, default=120, help='Number of trials')
+    parser.add_argument('--levels', type=int, default=3, help='Level of the trial frames')
+    parser.add_argument('--blocks', type=int, default=2, help='Number of blocks')
+    parser.add_argument('--noise', type=int, default=0,
+        help='Number of extra fields in each trial frame')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--encoding', default='utf-16',
+        help='Text encoding, e.g. utf-16 (as E-Prime), utf-8, utf-8-sig or cp1252')
+    parser.add_argument('eprime_txt', help='E-Prime txt file to write', metavar='EPRIME_TXT')
+    args = parser.parse_args()
+
+    write_log(args.eprime_txt, args.task, args.trials, nlevels=args.levels,
+        nblocks=args.blocks, noise=args.noise, seed=args.seed, encoding=args.encoding)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Task definitions for the GF E-Prime tasks. parse_csv_GF.py uses these to
+# pick out the trials from the converted E-Prime table and summarize them by
+# condition with condition_summary.summarize_conditions. To handle a new task
+# or a variant of an existing one, add an entry here. Only the standard
+# library is used here, so the lightweight path (gf_edat_lite.py) can use it too.
+#
+#    sort_frames    Whether the converted E-Prime table is sorted by level
+#    start          Column with the trigger time. Its earliest value is the
+#                   start time that onsets are measured from
+#    rows           Trial rows: those where column is one of values, or where
+#                   column is not empty if no values are given
+#    derive         New columns to add to the trials: name is set to the label
+#                   for each value of column, or default if it has none
+#    drop           Trials to drop after deriving columns: those where column
+#                   is one of values
+#
+# The rest are passed on to summarize_conditions:
+#
+#    groups         Columns whose unique combinations are the conditions
+#    condition      Columns joined with '_' to name the condition, if groups
+#                   doesn't already include a Condition column
+#    onset, rt, acc Columns with onset time, RT, and accuracy. Names with
+#                   {Condition} use a different column for each condition
+#    duration       Constant duration (sec) or a column of durations (ms)
+#    rt_only        (column,value) - only compute RT for these conditions
+#    acc_only       (column,value) - only compute accuracy for these conditions
+#    sort           Sort conditions, or keep order of appearance
+#    pct_decimals   Decimals to round PctAccuracy to, or None
+
+
+TASKS = {
+
+    'Oddball': dict(
+        sort_frames=True,
+        start='Start1.OffsetTime',
+        rows=dict(column='Procedure', values=['StandardProc','DeviantProc']),
+        derive=[
+            dict(name='Condition', column='Procedure', default='',
+                values={'StandardProc': 'Standard', 'DeviantProc': 'Deviant'}),
+            ],
+        groups=('Procedure','Condition'),
+        onset='{Condition}Tone.OnsetTime',
+        rt='{Condition}Tone.RT',
+        acc='{Condition}Tone.ACC',
+        duration=0.5,
+        ),
+
+    # Old version of Oddball. Only the oddball trials have responses recorded
+    'OddballOld': dict(
+        sort_frames=True,
+        start='scanstart2.OnsetTime',
+        rows=dict(column='Running', values=['MainStimuli']),
+        derive=[
+            dict(name='Condition', column='tone', default='',
+                values={
+                    'stimuli\\silence.wav': 'Silence',
+                    'stimuli\\1000.wav': 'Standard',
+                    'stimuli\\1200.wav': 'Deviant',
+                    }),
+            ],
+        drop=dict(column='Condition', values=['Silence']),
+        groups=('Running','Condition'),
+        onset='MainScreen.OnsetTime',
+        rt='MainScreen.RT',
+        acc='MainScreen.ACC',
+        duration='duration',
+        rt_only=('Condition','Deviant'),
+        acc_only=('Condition','Deviant'),
+        ),
+
+    # Only have RTs for target trials
+    'SPT': dict(
+        sort_frames=True,
+        start='Instructions.RTTime',
+        rows=dict(column='ImageType'),
+        groups=('ImageType','bbcolor'),
+        condition=('ImageType','bbcolor'),
+        onset='PresentPicture.OnsetTime',
+        rt='PresentPicture.RT',
+        acc='PresentPicture.ACC',
+        duration=1.0,
+        rt_only=('bbcolor','red'),
+        sort=True,
+        ),
+
+    # ESOP version of SPT. Targets are the trials with correct response 7
+    'SPT-ESOP': dict(
+        sort_frames=False,
+        start='Instructions.RTTime',
+        rows=dict(column='ImageType'),
+        derive=[
+            dict(name='Target', column='PresentPicture.CRESP', default='Foil',
+                values={7: 'Target'}),
+            ],
+        groups=('ImageType','Target'),
+        condition=('ImageType','Target'),
+        onset='PresentPicture.OnsetTime',
+        rt='PresentPicture.RT',
+        acc='PresentPicture.ACC',
+        duration=1.0,
+        rt_only=('Target','Target'),
+        sort=True,
+        ),
+
+    'WM': dict(
+        sort_frames=True,
+        start='GetReady.OffsetTime',
+        rows=dict(column='StimType'),
+        groups=('BlockType','StimType'),
+        condition=('BlockType','StimType'),
+        onset='Stim.OnsetTime',
+        rt='Stim.RT',
+        acc='Stim.ACC',
+        duration=2.5,
+        sort=True,
+        pct_decimals=None,
+        ),
+
+    }
+
+
+# Labels a derived column can take
+def derived_labels(task, name):
+    labels = []
+    for d in TASKS[task].get('derive',()):
+        if d['name'] == name:
+            labels += [d['default']] + list(d['values'].values())
+    return labels
+
+
+# E-Prime columns the task needs, in the order they're first used. Columns
+# named with {Condition} are expanded for every condition label
+def task_columns(task):
+    spec = TASKS[task]
+    derived = [d['name'] for d in spec.get('derive',())]
+
+    columns = [spec['start'], spec['rows']['column']]
+    columns += [d['column'] for d in spec.get('derive',())]
+    columns += [g for g in spec['groups'] if g not in derived]
+    columns += [c for c in spec.get('condition') or () if c not in derived]
+    for name in (spec['onset'],spec['rt'],spec['acc']):
+        if '{Condition}' in name:
+            columns += [name.format(Condition=c) for c in derived_labels(task,'Condition') if c]
+        else:
+            columns.append(name)
+    if isinstance(spec['duration'],str):
+        columns.append(spec['duration'])
+
+    return list(dict.fromkeys(columns))
+
+
+# Columns the task needs that a log doesn't have. A log that was cut short
+# can be missing the columns of conditions it never got to, which are taken
+# as empty, but without the trigger or trial rows it can't be summarized
+def missing_columns(task, have):
+    spec = TASKS[task]
+    missing = [c for c in task_columns(task) if c not in have]
+    for c in (spec['start'],spec['rows']['column']):
+        if c in missing:
+            raise ValueError('No %s column in the log: not a %s log, or cut short before '
+                'it was logged' % (c,task))
+    return missing
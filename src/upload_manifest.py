@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# Local record of the E-Prime files find_and_upload_eprime_files.py has
+# handled, kept in an SQLite database. For every file and project it stores
+# the file's size, mtime and content hash, the subject/session/scan it was
+# matched to, and the result of the last attempt. Later sweeps use it to skip
+# files that were uploaded and haven't changed since, without asking XNAT.
+# It also keeps the directory listings from the last search of the tree, so
+# directories that haven't changed don't have to be listed again.
+#
+# Run directly to list what's recorded, e.g. everything uploaded for a
+# session:
+#
+#    upload_manifest.py --status uploaded --session 123456
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import sys
+
+from eprime_cache import file_hash
+
+
+DEFAULT_MANIFEST = os.path.join(os.environ.get('GF_EDAT_CACHE') or
+    os.path.join(os.path.expanduser('~'),'.cache','gf-edat'),'uploads.sqlite')
+
+COLUMNS = ('path','project','size','mtime','sha256','subject','session','scan',
+    'status','message','checked','uploaded')
+
+# Results that stand until the file changes: it was uploaded, its scan already
+# had an E-Prime resource, or its filename couldn't be parsed
+DONE = ('uploaded','exists','invalid')
+
+
+class UploadManifest:
+
+    def __init__(self, path=DEFAULT_MANIFEST):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('''create table if not exists files (
+            path text, project text, size integer, mtime real, sha256 text,
+            subject text, session text, scan text, status text, message text,
+            checked text, uploaded text, primary key (path,project))''')
+        self.db.execute('''create table if not exists dirs (
+            path text primary key, mtime real, listed real, files text, subdirs text)''')
+        self.db.commit()
+
+    def get(self, path, project):
+        return self.db.execute('select * from files where path=? and project=?',
+            (path,project)).fetchone()
+
+    # Whether a file needs to go to XNAT: it's new, it changed since the last
+    # attempt, or the last attempt might work if tried again (no matching scan
+    # yet, failed, ...). The hash is only computed when the size or mtime changed.
+    # Returns None if the file can be skipped, or its size, mtime and hash for
+    # record(), and whether it replaces an earlier upload of the same file.
+    # With overwrite, nothing is skipped, as everything is to be uploaded again
+    def pending(self, path, project, overwrite=False):
+        st = os.stat(path)
+        row = self.get(path,project)
+        done = row is not None and row['status'] in DONE
+        uploaded = done and row['status'] == 'uploaded'
+        if overwrite:
+            return dict(size=st.st_size, mtime=st.st_mtime, sha256=file_hash(path),
+                replace=uploaded)
+        if done and (row['size'],row['mtime']) == (st.st_size,st.st_mtime):
+            return None
+        sha256 = file_hash(path)
+        if done and row['sha256'] == sha256:
+            self.db.execute('update files set size=?, mtime=? where path=? and project=?',
+                (st.st_size,st.st_mtime,path,project))
+            self.db.commit()
+            return None
+        return dict(size=st.st_size, mtime=st.st_mtime, sha256=sha256, replace=uploaded)
+
+    # Store the result of an upload attempt. The upload time is kept from an
+    # earlier upload if this attempt didn't upload
+    def record(self, path, project, size, mtime, sha256, subject=None, session=None,
+            scan=None, status=None, message=None):
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        row = self.get(path,project)
+        uploaded = now if status == 'uploaded' else (row['uploaded'] if row else None)
+        self.db.execute('insert or replace into files values (?,?,?,?,?,?,?,?,?,?,?,?)',
+            (path,project,size,mtime,sha256,subject,session,scan,status,message,now,uploaded))
+        self.db.commit()
+
+    # Directory listings from the last complete search, for
+    # find_and_upload_eprime_files.DirCache
+    def load_dirs(self):
+        return {row['path']: dict(mtime=row['mtime'], listed=row['listed'],
+            files=json.loads(row['files']), subdirs=json.loads(row['subdirs']))
+            for row in self.db.execute('select * from dirs')}
+
+    # Replace the stored directory listings
+    def save_dirs(self, listings):
+        self.db.execute('delete from dirs')
+        self.db.executemany('insert into dirs values (?,?,?,?,?)',
+            [(path,d['mtime'],d['listed'],json.dumps(d['files']),json.dumps(d['subdirs']))
+                for path,d in listings.items()])
+        self.db.commit()
+
+    # Recorded files, optionally only those matching the given columns
+    def query(self, **where):
+        where = {k: v for k,v in where.items() if v is not None}
+        sql = 'select * from files'
+        if where:
+            sql += ' where ' + ' and '.join('%s=?' % k for k in where)
+        return self.db.execute(sql + ' order by path',tuple(where.values())).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='List E-Prime files recorded by the uploader')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='Upload manifest database')
+    parser.add_argument('--project', help='Only files for this XNAT project')
+    parser.add_argument('--subject', help='Only files for this subject')
+    parser.add_argument('--session', help='Only files for this session')
+    parser.add_argument('--status', help='Only files with this status (uploaded, exists, invalid, skipped, failed)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.manifest):
+        print('No upload manifest at %s' % args.manifest)
+        sys.exit(1)
+
+    manifest = UploadManifest(args.manifest)
+    rows = manifest.query(project=args.project, subject=args.subject,
+        session=args.session, status=args.status)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow([row[c] for c in COLUMNS])
+    manifest.close()
+
+
+if __name__ == "__main__":
+    main()
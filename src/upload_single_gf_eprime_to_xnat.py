@@ -3,6 +3,9 @@
 # Given the name of an E-PRIME .txt output file, parse the filename and upload the file
 # to the appropriate EPRIME_TXT resource on XNAT. Specific to the three GF tasks.
 #
+# The filename parsing, scan matching and upload are shared with
+# find_and_upload_eprime_files.py, which does this for a whole directory.
+#
 # Requires a python 3 installation and DAX:
 #    https://dax.readthedocs.io/en/latest/installing_dax_in_a_virtual_environment.html
 #
@@ -35,74 +38,33 @@
 #          the --overwrite option was not specified
 
 
-import re
-import os
-import sys
-import dax
 import argparse
 
-# Parse arguments
-parser = argparse.ArgumentParser(description='Upload an E-Prime .txt to XNAT')
-parser.add_argument('--eprime_txt', help='E-Prime .txt filename',required=True)
-parser.add_argument('--project', help='XNAT project',required=True)
-parser.add_argument('--overwrite', help='Force overwrite if existing',default='False')
-args = parser.parse_args()
-
-expr = re.compile('^(?P<task>.*?)-(?P<session>.*?)-(?P<run>\d)\S*\.txt$')
-
-project = args.project
-overwrite = args.overwrite
-eprime_txt = args.eprime_txt
+from find_and_upload_eprime_files import ScanIndex, XnatPool, upload_file
 
-r = expr.match(os.path.basename(eprime_txt))
-if r is None:
-    print(f'   WARNING: Could not parse filename. Skipping')
-    sys.exit(0)
 
-session = r.group('session')
-subject = r.group('session')
-run = r.group('run')
-task = r.group('task')
+def main():
 
-#print('   %s, %s, %s, Run %s, %s' % (project,subject,session,run,task))
-
-# Figure out the expected scan label prefix
-#
-# wm1*
-# wm2*
-# oddball1*
-# oddball2*
-# spt1*
-scan_prefix = '%s%s' % (task.lower(),run)
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Upload an E-Prime .txt to XNAT')
+    parser.add_argument('--eprime_txt', help='E-Prime .txt filename',required=True)
+    parser.add_argument('--project', help='XNAT project',required=True)
+    parser.add_argument('--overwrite', help='Force overwrite if existing',default='False')
+    args = parser.parse_args()
 
-# Connect to XNAT and upload
-with dax.XnatUtils.get_interface() as xnat:
-    
-    # Get list of scans in this session
-    scans = xnat.get_scans(project,session,subject)
+    # Connect to XNAT (only if the filename can be parsed) and upload
+    pool = XnatPool(retries=0)
+    try:
+        status, scan_id, message = upload_file(pool, ScanIndex(pool), args.eprime_txt, args.project,
+            overwrite=args.overwrite.lower()=='true')
+    finally:
+        pool.close()
 
-    # Find scan(s) where scan_prefix matches scans['scan_type']
-    match = [x for x in scans if x['scan_type'].startswith(scan_prefix) and x['quality']!='unusable']
-    
-    # Only proceed if exactly one match is found
-    if len(match) == 0:
-        print(f'   WARNING: No matching scan. Skipping')
-        sys.exit(0)
-    elif len(match) > 1:
-        print(f'   WARNING: Multiple matching scans found. Skipping')
-        sys.exit(0)
-    else:
-        match = match[0]
-        #print('   Found single scan %s matching \'%s\'' % (match['scan_id'],scan_prefix))
-        
-    # If scan has resource warn and skip upload unless overwrite
-    rsrc = xnat.select_scan_resource(project,session,subject,match['scan_id'],'EPRIME_TXT')
-    if rsrc.exists() and not (overwrite.lower()=='true'):
-        print(f'   WARNING: EPRIME_TXT resource already exists on XNAT, skipping')
-        sys.exit(0)
-    else:
-        if not rsrc.exists():
-            rsrc.create()
-        rsrc.put([eprime_txt],overwrite=True)
+    if status == 'uploaded':
         print(f'   Uploaded')
+    else:
+        print(f'   WARNING: {message}. Skipping')
+
 
+if __name__ == "__main__":
+    main()
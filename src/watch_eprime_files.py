@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+#
+# Watch a directory tree for new or changed EPrime txt files:
+#    Oddball-*.txt
+#    SPT-*.txt
+#    WM-*.txt
+#
+# and upload each one to XNAT as soon as it's complete, the same way as
+# find_and_upload_eprime_files.py. Optionally also convert, parse and report
+# on it locally (gf_edat.py) in a directory per log under --out_dir.
+#
+# On Linux the tree is watched with inotify, so only directories where
+# something happened are looked at. Elsewhere, or with --poll (inotify doesn't
+# see changes made by other machines on network shares), the tree is rescanned
+# every --interval seconds. E-Prime writes its log as the task runs, so a
+# file is only handled once its size and mtime haven't changed for --settle
+# seconds. Files already in the tree when the watch starts are handled too,
+# except those the upload manifest shows were already handled. With
+# --partial, logs are also converted as far as they go while they're being
+# written (eprime_partial.py), and how complete each is shown.
+#
+# Files that couldn't be uploaded because their scan isn't on XNAT yet, or
+# because of an error, are tried again every --retry seconds.
+#
+# Usage:
+#
+#    watch_eprime_files.py --project <XNAT_project> --dir <directory>
+#        [--out_dir /OUTPUTS [--partial 30]] [--settle 60] [--poll]
+
+import argparse
+import concurrent.futures
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import time
+
+from tasks import TASKS
+import upload_manifest
+from find_and_upload_eprime_files import (DirCache, ScanIndex, XnatPool,
+    find_eprime_files, group_by_session, is_eprime_file, record_result, upload_session)
+
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event: wd, mask, cookie, len, then the name
+EVENT = struct.Struct('iIII')
+
+
+# Watch a directory tree with inotify. changes() returns the files created,
+# written, or moved into the tree since it was last called, and the first
+# call returns every file already there. New subdirectories are watched as
+# they appear.
+class InotifyWatcher:
+
+    def __init__(self, top):
+        self.top = top
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'),use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int,ctypes.c_char_p,ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(),'inotify_init1 failed')
+        self.dirs = dict()
+        self.found = []
+        try:
+            self.add_tree(top)
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    # Watch a directory and everything under it, and note the files in it
+    def add_tree(self, top):
+        for root,dirs,files in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd,os.fsencode(root),WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                raise OSError(err,'Cannot watch %s: %s' % (root,os.strerror(err)))
+            self.dirs[wd] = root
+            self.found += [os.path.join(root,fname) for fname in files]
+
+    def changes(self, timeout):
+        paths, self.found = self.found, []
+        if not select.select([self.fd],[],[],timeout)[0]:
+            return paths
+        data = os.read(self.fd,64*1024)
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data,i)
+            name = os.fsdecode(data[i+EVENT.size:i+EVENT.size+length].rstrip(b'\0'))
+            i += EVENT.size + length
+
+            # Events were lost. Look at the whole tree again
+            if mask & IN_Q_OVERFLOW:
+                self.add_tree(self.top)
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd,None)
+                continue
+            root = self.dirs.get(wd)
+            if root is None or not name:
+                continue
+            path = os.path.join(root,name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                continue
+            paths.append(path)
+
+        paths, self.found = paths + self.found, []
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Watch a directory tree by rescanning it. changes() waits for the next scan
+# and returns the files that are new or whose size or mtime changed.
+# Directories that haven't changed since the last scan aren't listed again
+class PollWatcher:
+
+    def __init__(self, top, interval=60, jobs=8):
+        self.top = top
+        self.interval = interval
+        self.jobs = jobs
+        self.next_scan = 0
+        self.seen = dict()
+        self.dir_cache = DirCache()
+
+    def changes(self, timeout):
+        wait = self.next_scan - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait,0))
+        self.next_scan = time.time() + self.interval
+
+        paths = []
+        seen = dict()
+        for path in find_eprime_files(self.top,jobs=self.jobs,dir_cache=self.dir_cache):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen[path] = (st.st_size,st.st_mtime)
+            if self.seen.get(path) != seen[path]:
+                paths.append(path)
+        self.seen = seen
+        self.dir_cache = DirCache(self.dir_cache.fresh)
+        return paths
+
+    def close(self):
+        pass
+
+
+# inotify if we can, else polling
+def make_watcher(top, poll=False, interval=60):
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(top)
+        except OSError as e:
+            print('WARNING: Cannot use inotify (%s), polling instead' % e)
+    return PollWatcher(top,interval)
+
+
+# Files that have stopped changing. A file is ready once its size and mtime
+# have stayed the same for settle seconds
+class SettleTracker:
+
+    def __init__(self, settle):
+        self.settle = settle
+        self.pending = dict()
+
+    def add(self, path):
+        self.pending[path] = None
+
+    def ready(self):
+        now = time.time()
+        ready = []
+        for path,last in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            sig = (st.st_size,st.st_mtime)
+            if last is None or last[0] != sig:
+                self.pending[path] = (sig,now)
+            elif now - last[1] >= self.settle:
+                ready.append(path)
+                del self.pending[path]
+        return ready
+
+
+# Convert, parse and report on a log like gf_edat_batch.py, in
+# <out_dir>/<log name>. Returns an error message, or None if it worked
+def convert_log(eprime_txt, out_dir, project, task=None):
+    from gf_edat_batch import describe_log
+    from gf_edat import run
+    import eprime_cache
+    log = describe_log(eprime_txt,task=task,project=project)
+    if log['task'] is None:
+        return 'Unknown task'
+    name = os.path.splitext(os.path.basename(eprime_txt))[0]
+    cache = None
+    if eprime_cache.DEFAULT_CACHE_DIR:
+        cache = eprime_cache.EprimeCache(eprime_cache.DEFAULT_CACHE_DIR)
+    try:
+        run(eprime_txt, log['task'], os.path.join(out_dir,name), project=log['project'],
+            subject=log['subject'], session=log['session'], scan=log['scan'], cache=cache)
+    except Exception as e:
+        return '%s: %s' % (type(e).__name__,e)
+    return None
+
+
+# Convert as much of a log as has been written so far, in
+# <out_dir>/<log name>/PARTIAL, reading on from where the last time got to
+# (eprime_partial.py). Returns how complete it is
+def convert_partial(eprime_txt, out_dir, task=None):
+    from gf_edat_batch import describe_log
+    import eprime_partial
+    log = describe_log(eprime_txt,task=task)
+    if log['task'] not in TASKS:
+        log['task'] = None
+    name = os.path.splitext(os.path.basename(eprime_txt))[0]
+    try:
+        p = eprime_partial.convert(eprime_txt,
+            os.path.join(out_dir,name,'PARTIAL','eprime.csv'), task=log['task'])
+    except Exception as e:
+        return '%s: %s' % (type(e).__name__,e)
+    return eprime_partial.progress_text(p)
+
+
+# Upload a set of ready files, and convert them if out_dir is given. Scans are
+# listed afresh for each set, since new scans keep arriving on XNAT
+def process_files(pool, eprime_txts, project, overwrite=False, replace=(),
+        out_dir=None, task=None):
+    index = ScanIndex(pool)
+    results = []
+    for session_txts in group_by_session(eprime_txts).values():
+        results += upload_session(pool,index,session_txts,project,overwrite,replace)
+    if out_dir:
+        for r in results:
+            r['convert_error'] = convert_log(r['eprime_txt'],out_dir,project,task)
+    return results
+
+
+# Report and record the results of process_files
+def finish(future, pending, manifest, project):
+    results = future.result()
+    for r in results:
+        print('%-8s %s%s' % (r['status'], r['eprime_txt'],
+            '  (%s)' % r['message'] if r['message'] else ''))
+        if r.get('convert_error'):
+            print('   WARNING: Not converted: %s' % r['convert_error'])
+        record_result(manifest,project,r,pending[r['eprime_txt']])
+    return results
+
+
+# Whether a file that wasn't uploaded is worth trying again later
+def should_retry(result):
+    return result['status'] == 'failed' or result['message'] == 'No matching scan'
+
+
+def main():
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description='Watch for E-Prime .txt files and upload them to XNAT')
+    parser.add_argument('--project', help='XNAT project', default='GenFac_HWZ')
+    parser.add_argument('--dir', help='Directory to watch', required=True)
+    parser.add_argument('--overwrite', help='Force overwrite if existing', default='False')
+    parser.add_argument('--out_dir',
+        help='Also convert, parse and report on each log in a directory under this one')
+    parser.add_argument('--task', help='Task to use for all logs when converting')
+    parser.add_argument('--partial', type=float, metavar='SECONDS',
+        help='Also convert logs as they are written, at most every SECONDS, into '
+        '<out_dir>/<log name>/PARTIAL, and show how complete they are')
+    parser.add_argument('--settle', type=float, default=60,
+        help='Seconds a file must stay unchanged before it is handled')
+    parser.add_argument('--poll', action='store_true',
+        help='Rescan the tree instead of using inotify, e.g. for network shares')
+    parser.add_argument('--interval', type=float, default=60,
+        help='Seconds between rescans when polling')
+    parser.add_argument('--retry', type=float, default=3600,
+        help='Seconds before trying again files that could not be uploaded')
+    parser.add_argument('--jobs', type=int, default=2,
+        help='Number of sets of files to handle at once')
+    parser.add_argument('--retries', type=int, default=3, help='Retries for failed XNAT calls')
+    parser.add_argument('--backoff', type=float, default=1.0,
+        help='Wait (sec) before the first retry. Doubles for each retry after')
+    parser.add_argument('--host', help='XNAT host (default $XNAT_HOST)')
+    parser.add_argument('--user', help='XNAT user (default from ~/.netrc)')
+    parser.add_argument('--manifest', default=upload_manifest.DEFAULT_MANIFEST,
+        help='Database of files already handled (default ~/.cache/gf-edat/uploads.sqlite)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print('Specified directory %s not found' % args.dir)
+        sys.exit(1)
+    overwrite = args.overwrite.lower()=='true'
+    if args.partial is not None and not args.out_dir:
+        parser.error('--partial needs --out_dir')
+
+    # Stop cleanly on kill as well as ctrl-C
+    signal.signal(signal.SIGTERM,lambda signum,frame: sys.exit(0))
+
+    print('Watching %s for %s' % (args.dir,args.project))
+    watcher = make_watcher(args.dir,args.poll,args.interval)
+    tracker = SettleTracker(args.settle)
+    manifest = upload_manifest.UploadManifest(args.manifest)
+    pool = XnatPool(args.host, args.user, retries=args.retries, backoff=args.backoff)
+    executor = concurrent.futures.ThreadPoolExecutor(args.jobs)
+    running = dict()
+    retry_at = dict()
+    partial_due = set()
+    partial_at = dict()
+
+    try:
+        while True:
+
+            for path in watcher.changes(timeout=1.0):
+                if is_eprime_file(os.path.basename(path)):
+                    tracker.add(path)
+                    retry_at.pop(path,None)
+                    if args.partial is not None:
+                        partial_due.add(path)
+
+            # Logs still being written, each no more often than --partial
+            now = time.time()
+            for path in list(partial_due):
+                if now - partial_at.get(path,0) >= args.partial:
+                    partial_due.discard(path)
+                    partial_at[path] = now
+                    print('%-8s %s  (%s)' % ('partial',path,
+                        convert_partial(path,args.out_dir,args.task)))
+
+            for path,t in list(retry_at.items()):
+                if t <= now:
+                    tracker.add(path)
+                    del retry_at[path]
+
+            # Files that have settled and weren't already handled. The manifest
+            # is only used from this thread
+            pending = dict()
+            for path in tracker.ready():
+                try:
+                    p = manifest.pending(path,args.project,overwrite)
+                except OSError:
+                    continue
+                if p is not None:
+                    pending[path] = p
+
+            # Forget when logs that were handled, or have gone, were last
+            # converted partially
+            for path in [f for f in partial_at if f not in tracker.pending]:
+                del partial_at[path]
+            partial_due &= set(tracker.pending)
+
+            if pending:
+                replace = {f for f,p in pending.items() if p['replace']}
+                future = executor.submit(process_files, pool, list(pending), args.project,
+                    overwrite, replace, args.out_dir, args.task)
+                running[future] = pending
+
+            # Record what's finished
+            for future in [f for f in running if f.done()]:
+                for r in finish(future,running.pop(future),manifest,args.project):
+                    if should_retry(r):
+                        retry_at[r['eprime_txt']] = time.time() + args.retry
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('Stopping')
+        executor.shutdown(wait=True)
+        for future,pending in running.items():
+            finish(future,pending,manifest,args.project)
+        watcher.close()
+        pool.close()
+        manifest.close()
+
+
+if __name__ == "__main__":
+    main()